@@ -0,0 +1,294 @@
+"""
+benchmarkEncoding.py
+--------------------
+This script measures the speed of the encoding hot path: the reference functions in
+encodingMessage.py, Plugboard.transform_character and the faster engines built on the
+compiled EnigmaMachine. Every engine is run over a range of message sizes and machine
+configurations, and for each run the script reports characters per second, latency
+percentiles and peak memory. Latency is timed separately from throughput: the engine is
+called on LATENCY_SAMPLES small pieces of the message, one timed call per piece, and the
+percentiles are taken over the time per character of each call.
+
+Results are written to a JSON file. Passing a stored baseline compares the new run
+against it and flags every result that got slower by more than the threshold.
+
+Usage (from the repository root):
+    python -m EnigmaMachine.benchmarks.benchmarkEncoding --sizes 1 1000 100000 --output bench.json
+    python -m EnigmaMachine.benchmarks.benchmarkEncoding --baseline bench.json --threshold 0.1
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from EnigmaMachine.core.encodingMessage import encode_letter_with_rotor_advance, encode_message_with_rotor_advance
+from EnigmaMachine.core.enigmaMachine import EnigmaMachine
+from EnigmaMachine.core.enigmaPlugs import PlugLead, Plugboard
+from EnigmaMachine.core.enigmaRotors import reflector_wirings_dict, rotor_notches_dict, rotor_wirings_dict
+from EnigmaMachine.core.periodTable import encode_with_period_table
+from EnigmaMachine.core.vectorEncoder import VectorEncoder, np
+
+DEFAULT_SIZES = [1, 1_000, 100_000]
+DEFAULT_THRESHOLD = 0.10  # Flag results more than 10% slower than the baseline
+MIN_TIMED_SECONDS = 0.25  # Keep repeating a run until it has been timed for at least this long
+MAX_REPEATS = 1000
+LATENCY_PIECE_SIZE = 16  # Characters per timed call in the latency sample
+LATENCY_SAMPLES = 1000  # Timed calls in the latency sample
+SLOW_ENGINE_MAX_SIZE = 100_000  # The pure Python reference engines are skipped above this size
+
+# Machine configurations: rotors (rightmost first), reflector, starting positions and plug leads
+CONFIGURATIONS = {
+    "I-II-III/B/no-leads": (["I", "II", "III"], "B", [0, 0, 0], []),
+    "IV-V-I/C/10-leads": (["IV", "V", "I"], "C", [7, 12, 3],
+                          ["AB", "CD", "EF", "GH", "IJ", "KL", "MN", "OP", "QR", "ST"]),
+    "II-IV-III/A/5-leads": (["II", "IV", "III"], "A", [25, 0, 13], ["AZ", "BY", "CX", "DW", "EV"]),
+}
+
+
+def make_setup(configuration):
+    """Builds the plugboard, rotors, reflector and positions for a configuration."""
+    rotor_names, reflector_name, rotor_positions, leads = CONFIGURATIONS[configuration]
+    plugboard = Plugboard()
+    for lead in leads:
+        plugboard.add_lead(PlugLead(lead))
+    selected_rotors = [(name, rotor_wirings_dict[name]) for name in rotor_names]
+    selected_reflector = (reflector_name, reflector_wirings_dict[reflector_name])
+    return plugboard, selected_rotors, selected_reflector, list(rotor_positions)
+
+
+def make_message(size, seed=0):
+    """Builds a message of uppercase letters with a space roughly every six characters."""
+    generator = random.Random(seed)
+    block = ''.join(generator.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ     ") for _ in range(min(size, 1 << 20)))
+    return (block * (size // len(block) + 1))[:size] if block else ""
+
+
+def _reference_letters(configuration):
+    plugboard, selected_rotors, selected_reflector, rotor_positions = make_setup(configuration)
+    rotor_notches = [rotor_notches_dict[rotor[0]] for rotor in selected_rotors]
+
+    def run(message):
+        for letter in message:
+            if letter != " ":
+                encode_letter_with_rotor_advance(plugboard, selected_rotors, selected_reflector, letter,
+                                                 rotor_positions, rotor_notches, tracer=None)
+    return run
+
+
+def _reference_message(configuration):
+    plugboard, selected_rotors, selected_reflector, rotor_positions = make_setup(configuration)
+
+    def run(message):
+        encode_message_with_rotor_advance(plugboard, selected_rotors, selected_reflector, message, rotor_positions,
+                                          rotor_notches_dict, [0, 0, 0], tracer=None)
+    return run
+
+
+def _plugboard(configuration):
+    plugboard = make_setup(configuration)[0]
+
+    def run(message):
+        for letter in message:
+            plugboard.transform_character(letter)
+    return run
+
+
+def _machine(configuration):
+    return EnigmaMachine(*make_setup(configuration), rotor_notches_dict).encode
+
+
+def _period_table(configuration):
+    machine = EnigmaMachine(*make_setup(configuration), rotor_notches_dict)
+    encode_with_period_table(machine, "")  # Build the table before timing starts
+    return lambda message: encode_with_period_table(machine, message)
+
+
+def _vectorized(configuration):
+    return VectorEncoder(EnigmaMachine(*make_setup(configuration), rotor_notches_dict)).encode
+
+
+# Engine name -> (setup function, largest message size worth running)
+ENGINES = {
+    "encode_letter_with_rotor_advance": (_reference_letters, SLOW_ENGINE_MAX_SIZE),
+    "encode_message_with_rotor_advance": (_reference_message, SLOW_ENGINE_MAX_SIZE),
+    "Plugboard.transform_character": (_plugboard, None),
+    "EnigmaMachine.encode": (_machine, None),
+    "period_table": (_period_table, None),
+}
+if np is not None:
+    ENGINES["vectorized"] = (_vectorized, None)
+
+
+def percentile(values, fraction):
+    """Returns the value below which the given fraction of the sorted values fall."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_sample(run, message, samples=LATENCY_SAMPLES):
+    """Times an engine one small piece of the message at a time.
+
+    The pieces are LATENCY_PIECE_SIZE characters long (or the whole message, if shorter),
+    taken in turn from the start of the message and wrapping around when it runs out.
+
+    Returns:
+        list: The seconds per character of each timed call.
+    """
+    length = min(len(message), LATENCY_PIECE_SIZE)
+    if length == 0:
+        return [0.0]
+    pieces = [message[start:start + length] for start in range(0, min(len(message), samples * length) - length + 1,
+                                                              length)]
+    clock = time.perf_counter
+    timings = []
+    for index in range(samples):
+        piece = pieces[index % len(pieces)]
+        start = clock()
+        run(piece)
+        timings.append((clock() - start) / length)
+    return timings
+
+
+def benchmark(engine, configuration, size, repeats=None):
+    """Times one engine on one configuration and message size.
+
+    Args:
+        engine (str): A key of ENGINES.
+        configuration (str): A key of CONFIGURATIONS.
+        size (int): The message length in characters.
+        repeats (int): How many times to time the run. Defaults to as many runs as fit in
+            MIN_TIMED_SECONDS (at least 3, at most MAX_REPEATS).
+
+    Returns:
+        dict: The measurements for the run.
+    """
+    setup, _ = ENGINES[engine]
+    message = make_message(size)
+    run = setup(configuration)
+    timings = []
+    while len(timings) < (repeats or MAX_REPEATS):
+        start = time.perf_counter()
+        run(message)
+        timings.append(time.perf_counter() - start)
+        if repeats is None and len(timings) >= 3 and sum(timings) >= MIN_TIMED_SECONDS:
+            break
+    repeats = len(timings)
+
+    # Peak memory is measured on a separate run, as tracing allocations slows everything down
+    run = setup(configuration)
+    tracemalloc.start()
+    run(message)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies = latency_sample(setup(configuration), message)
+    return {
+        "engine": engine,
+        "configuration": configuration,
+        "size": size,
+        "repeats": repeats,
+        "chars_per_sec": size * repeats / sum(timings) if sum(timings) > 0 else float("inf"),
+        "latency_piece_chars": min(size, LATENCY_PIECE_SIZE),
+        "latency_p50_us": percentile(latencies, 0.50) * 1e6,
+        "latency_p90_us": percentile(latencies, 0.90) * 1e6,
+        "latency_p99_us": percentile(latencies, 0.99) * 1e6,
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def run_benchmarks(engines=None, configurations=None, sizes=None, repeats=None):
+    """Runs every combination of engine, configuration and size.
+
+    Returns:
+        dict: The run's metadata and a list of results, ready to be written as JSON.
+    """
+    results = []
+    for engine in engines or ENGINES:
+        max_size = ENGINES[engine][1]
+        for configuration in configurations or CONFIGURATIONS:
+            for size in sizes or DEFAULT_SIZES:
+                if max_size is not None and size > max_size:
+                    continue
+                results.append(benchmark(engine, configuration, size, repeats))
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare_to_baseline(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """Finds results that are slower than the same engine, configuration and size in a baseline.
+
+    Args:
+        report (dict): The report from run_benchmarks.
+        baseline (dict): A report from an earlier run.
+        threshold (float): The fraction of throughput that may be lost before a result is flagged.
+
+    Returns:
+        list: One dict per regression, with the baseline and current chars/sec and the change.
+    """
+    baseline_speeds = {(result["engine"], result["configuration"], result["size"]): result["chars_per_sec"]
+                       for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = (result["engine"], result["configuration"], result["size"])
+        if key not in baseline_speeds:
+            continue
+        change = result["chars_per_sec"] / baseline_speeds[key] - 1
+        if change < -threshold:
+            regressions.append({
+                "engine": key[0],
+                "configuration": key[1],
+                "size": key[2],
+                "baseline_chars_per_sec": baseline_speeds[key],
+                "chars_per_sec": result["chars_per_sec"],
+                "change": change,
+            })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Enigma Machine encoding engines.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Message sizes in characters (up to 100000000).")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), help="Engines to run (default: all).")
+    parser.add_argument("--configurations", nargs="+", choices=list(CONFIGURATIONS),
+                        help="Machine configurations to run (default: all).")
+    parser.add_argument("--repeats", type=int, help="Timed runs per result (default: based on size).")
+    parser.add_argument("--output", default="bench_output.json", help="Where to write the JSON results.")
+    parser.add_argument("--baseline", help="A previous JSON results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Slowdown (as a fraction) that counts as a regression.")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.engines, args.configurations, args.sizes, args.repeats)
+    for result in report["results"]:
+        print(f"{result['engine']:<36} {result['configuration']:<22} {result['size']:>10} chars  "
+              f"{result['chars_per_sec']:>14,.0f} chars/sec  p50 {result['latency_p50_us']:8.3f} us  "
+              f"p99 {result['latency_p99_us']:8.3f} us  peak {result['peak_memory_bytes'] / 1024:10,.1f} KB")
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare_to_baseline(report, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression['engine']} / {regression['configuration']} / {regression['size']} "
+                  f"chars is {-regression['change']:.1%} slower than the baseline")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
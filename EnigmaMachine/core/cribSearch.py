@@ -0,0 +1,165 @@
+"""
+cribSearch.py
+--------------------
+This module recovers machine settings from intercepted ciphertext and a crib: a piece of
+plaintext known (or guessed) to appear in the message. Every rotor order, reflector and
+start position is tried. For each rotor order and reflector the period table (see
+periodTable.py) is built once, so encoding a crib letter is one lookup in its flat
+per-state permutations, and a table of the state every start position reaches at the
+crib's first letter saves stepping through the crib offset. A setting is dropped at the
+first letter that does not match the ciphertext, so most settings cost a single lookup
+to rule out.
+
+Each rotor order is a separate task, and tasks are spread over worker processes.
+"""
+
+import itertools
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from EnigmaMachine.core.enigmaMachine import LETTER_INDEX, EnigmaMachine
+from EnigmaMachine.core.enigmaPlugs import Plugboard
+from EnigmaMachine.core.enigmaRotors import reflector_wirings_dict, rotor_notches_dict, rotor_wirings_dict
+from EnigmaMachine.core.periodTable import STATE_COUNT, build_period_table, state_positions
+
+# A setting that encodes the crib into the ciphertext
+CribCandidate = namedtuple("CribCandidate", ["rotors", "reflector", "rotor_positions"])
+
+
+class CribSearchResult:
+    """The candidates found by a crib search, with throughput statistics."""
+
+    def __init__(self, candidates, settings_tested, elapsed):
+        """
+        Args:
+            candidates (list): The CribCandidate settings that match the crib.
+            settings_tested (int): The number of rotor order, reflector and position combinations tried.
+            elapsed (float): The time the search took, in seconds.
+        """
+        self.candidates = candidates
+        self.settings_tested = settings_tested
+        self.elapsed = elapsed
+
+    @property
+    def settings_per_second(self):
+        """The number of settings tried per second."""
+        return self.settings_tested / self.elapsed if self.elapsed > 0 else float("inf")
+
+
+def letter_indices(text):
+    """Converts text into alphabet indices, dropping anything outside A-Z.
+
+    Args:
+        text (str): The text to convert.
+
+    Returns:
+        list: The index of every uppercase letter in the text.
+    """
+    return [LETTER_INDEX[letter] for letter in text if letter in LETTER_INDEX]
+
+
+def _states_after(successors, steps):
+    """Builds a table mapping every rotor state to the state the given number of keypresses later.
+
+    The successor table is composed with itself by repeated squaring, so this takes a few
+    passes over the states however many steps there are.
+    """
+    states = list(range(STATE_COUNT))
+    power = successors
+    while steps:
+        if steps & 1:
+            states = [power[state] for state in states]
+        steps >>= 1
+        if steps:
+            power = [power[state] for state in power]
+    return states
+
+
+def _search_rotor_order(rotor_names, reflector_names, plugboard_table, ciphertext, crib, crib_offset):
+    """Runs in a worker process: tries every reflector and start position for one rotor order.
+
+    The plugboard comes as its 26 entry table, so workers are sent neither the Plugboard nor
+    anything its listeners refer to.
+
+    Returns:
+        list: The matching CribCandidate settings.
+    """
+    selected_rotors = [(name, rotor_wirings_dict[name]) for name in rotor_names]
+    crib_pairs = list(zip(crib, ciphertext[crib_offset:crib_offset + len(crib)]))
+    candidates = []
+    first_states = None
+    for reflector_name in reflector_names:
+        machine = EnigmaMachine(Plugboard(), selected_rotors, (reflector_name, reflector_wirings_dict[reflector_name]),
+                                [0, 0, 0], rotor_notches_dict)
+        machine.plugboard_table = plugboard_table
+        table = build_period_table(machine)
+        permutations, successors = table.permutations, table.successors
+        if first_states is None:
+            # The state each start is in at the crib's first letter. Only depends on the rotors.
+            first_states = _states_after(successors, crib_offset + 1)
+
+        for start in range(STATE_COUNT):
+            state = first_states[start]
+            for plain, cipher in crib_pairs:
+                if permutations[state * 26 + plain] != cipher:
+                    break  # Prune on the first mismatch
+                state = successors[state]  # The rotors step before the next letter
+            else:
+                candidates.append(CribCandidate(tuple(rotor_names), reflector_name, state_positions(start)))
+    return candidates
+
+
+def search_crib(ciphertext, crib, crib_offset=0, plugboard=None, rotor_names=None, reflector_names=None,
+                workers=None):
+    """Finds every rotor order, reflector and start position that encodes the crib into the ciphertext.
+
+    Characters outside A-Z are ignored in both the ciphertext and the crib, as they do not
+    advance the rotors.
+
+    Args:
+        ciphertext (str): The intercepted message.
+        crib (str): The known plaintext.
+        crib_offset (int): The number of letters of ciphertext before the crib starts.
+        plugboard (Plugboard): The plugboard setting, if known. Defaults to no plug leads.
+        rotor_names (list): The rotors to choose from. Defaults to every rotor in rotor_wirings_dict.
+        reflector_names (list): The reflectors to try. Defaults to every reflector in reflector_wirings_dict.
+        workers (int): The number of worker processes. Defaults to one per CPU core; 1 searches in-process.
+
+    Returns:
+        CribSearchResult: The matching settings and search statistics.
+
+    Raises:
+        ValueError: If the crib is empty or runs past the end of the ciphertext.
+    """
+    ciphertext = letter_indices(ciphertext)
+    crib = letter_indices(crib)
+    if not crib:
+        raise ValueError("The crib must contain at least one letter.")
+    if crib_offset < 0 or crib_offset + len(crib) > len(ciphertext):
+        raise ValueError("The crib does not fit inside the ciphertext at that offset.")
+
+    plugboard_table = tuple(plugboard.table) if plugboard is not None else tuple(range(26))
+    if rotor_names is None:
+        rotor_names = list(rotor_wirings_dict)
+    if reflector_names is None:
+        reflector_names = list(reflector_wirings_dict)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    rotor_orders = list(itertools.permutations(rotor_names, 3))
+    arguments = [rotor_orders, [reflector_names] * len(rotor_orders), [plugboard_table] * len(rotor_orders),
+                 [ciphertext] * len(rotor_orders), [crib] * len(rotor_orders), [crib_offset] * len(rotor_orders)]
+
+    start_time = time.perf_counter()
+    if workers == 1:
+        results = list(map(_search_rotor_order, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_search_rotor_order, *arguments))
+    elapsed = time.perf_counter() - start_time
+
+    candidates = [candidate for result in results for candidate in result]
+    settings_tested = len(rotor_orders) * len(reflector_names) * STATE_COUNT
+    return CribSearchResult(candidates, settings_tested, elapsed)
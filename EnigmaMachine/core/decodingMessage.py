@@ -1,7 +1,96 @@
-# def decode_message(plugboard, selected_rotors, selected_reflector, encoded_message):
-#     """
-#     Decodes a message by passing it through the same Enigma machine settings
-#     that were used for encoding.
-#     """
-#     return encode_message(plugboard, selected_rotors, selected_reflector, encoded_message)
+"""
+decodingMessage.py
+--------------------
+This module decodes messages. An Enigma machine is its own inverse: with the same key and
+the same start positions, encoding the ciphertext gives back the plaintext. Decoding is
+therefore encoding, and every engine in the project can be used for it.
 
+A day's traffic is many messages under one daily key, each starting from its own positions
+(the message key). decode_messages decodes all of them in one call with a single compiled
+machine. Large batches go through the configuration's period table, which is built once and
+then costs one lookup per letter, so the cost per message falls as the batch grows.
+
+With the indicator procedure the message key is not sent in the clear: the operator picks a
+start position (the Grundstellung), sends it in the clear, and sends the message key
+encoded at that position. message_key recovers the message key from the two.
+"""
+
+from EnigmaMachine.core.encodingMessage import encode_message_with_rotor_advance
+from EnigmaMachine.core.machineKeys import parse_settings
+from EnigmaMachine.core.parallelEncoder import count_letters
+from EnigmaMachine.core.periodTable import encode_with_period_table
+
+PERIOD_TABLE_MIN_LETTERS = 1 << 15  # Batches with fewer letters than this are not worth building a period table for
+
+
+def decode_message(plugboard, selected_rotors, selected_reflector, encoded_message, rotor_positions, rotor_notches_dict,
+                   ring_settings):
+    """
+    Decodes a message by passing it through the same Enigma machine settings
+    that were used for encoding.
+
+    Args:
+        rotor_positions (list): The start positions the message was encoded from. Stepped in place.
+        The other arguments are those of encode_message_with_rotor_advance.
+
+    Returns:
+        str: The decoded message.
+    """
+    return encode_message_with_rotor_advance(plugboard, selected_rotors, selected_reflector, encoded_message,
+                                             rotor_positions, rotor_notches_dict, ring_settings, tracer=None)
+
+
+def _start_positions(machine, positions):
+    """Checks a message's start positions (letters or numbers, rightmost rotor first) against the machine."""
+    positions = parse_settings(positions)
+    if len(positions) != len(machine.rotor_positions) or any(not 0 <= position <= 25 for position in positions):
+        raise ValueError(f"Expected {len(machine.rotor_positions)} positions between 0 and 25, got {positions}.")
+    return positions
+
+
+def message_key(machine, grundstellung, indicator):
+    """Recovers a message key from its indicator.
+
+    Args:
+        machine (EnigmaMachine): A compiled machine with the daily key. Its positions are not changed.
+        grundstellung (str or list): The start position sent in the clear, rightmost rotor first.
+        indicator (str): The message key as encoded at the Grundstellung.
+
+    Returns:
+        list: The message key, i.e. the start positions of the message.
+
+    Raises:
+        ValueError: If the Grundstellung or the indicator does not fit the machine.
+    """
+    working = machine.silent_copy()
+    working.rotor_positions = _start_positions(machine, grundstellung)
+    return _start_positions(machine, working.encode(indicator.strip().upper()))
+
+
+def decode_messages(machine, messages, use_period_table=None):
+    """Decodes a batch of messages that share a daily key.
+
+    Args:
+        machine (EnigmaMachine): A compiled machine with the daily key. Its positions are not used or changed.
+        messages (iterable): (start positions, ciphertext) pairs. Start positions are letters or
+            numbers, rightmost rotor first, e.g. from message_key.
+        use_period_table (bool): Force the period table on or off. By default it is used once the
+            batch holds PERIOD_TABLE_MIN_LETTERS letters.
+
+    Returns:
+        list: The decoded messages, in the same order.
+
+    Raises:
+        ValueError: If a message's start positions do not fit the machine.
+    """
+    messages = [(_start_positions(machine, positions), ciphertext) for positions, ciphertext in messages]
+    if use_period_table is None:
+        use_period_table = sum(count_letters(ciphertext) for _, ciphertext in messages) >= PERIOD_TABLE_MIN_LETTERS
+
+    # One silent working copy shares the compiled tables; only its positions change between messages
+    working = machine.silent_copy()
+    decoded = []
+    for positions, ciphertext in messages:
+        working.rotor_positions = positions
+        decoded.append(encode_with_period_table(working, ciphertext) if use_period_table else working.encode(ciphertext))
+    return decoded
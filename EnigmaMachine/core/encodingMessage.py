@@ -5,61 +5,117 @@ This module contains functions for encoding messages using the Enigma machine's
 including rotor advancement and detailed step logging for each letter encoded.
 """
 
+import time
+
 MAX_MESSAGE_LENGTH = 250  # Limit for the maximum length of the message
 
-def update_rotor_positions(rotor_positions, rotor_notches_dict, selected_rotors):
+LAMPBOARD_STEP = "Output (Lampboard)"  # The last step traced for every letter
+
+STEPPING_ROTORS = 3  # Only the three rightmost rotors have pawls; the M4's fourth rotor never moves
+
+
+def print_trace(step, letter):
     """
-    Updates the rotor positions based on the current rotor settings
-    and the notches defined in the rotor notches dictionary.
+    The default tracer: prints each encryption step as soon as it happens.
 
     Args:
-        rotor_positions (list): A list representing the current positions of the rotors.
-        rotor_notches_dict (dict): A dictionary mapping rotor names to their notch positions.
-        selected_rotors (list): A list of selected rotors for the encoding process.
-
-    Returns:
-        list: The updated list of rotor positions after stepping.
+        step (str): The name of the encryption step, e.g. "Reflector Encryption".
+        letter (str): The letter produced by that step.
     """
-    for i in range(len(rotor_positions)):
-        rotor_positions[i] = (rotor_positions[i] + 1) % 26  # Increment rotor position
-        if rotor_positions[i] == rotor_notches_dict[selected_rotors[i][0]]:
-            if i + 1 < len(rotor_positions):
-                rotor_positions[i + 1] = (rotor_positions[i + 1] + 1) % 26  # Advance next rotor
-    return rotor_positions
+    print(f"{step}: {letter}")
+    if step == LAMPBOARD_STEP:
+        print("-----------------------------")
+
+
+class StepRecorder:
+    """A tracer that stores the encryption steps as (step, letter) tuples instead of printing them."""
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, step, letter):
+        self.events.append((step, letter))
+
+    def lines(self):
+        """
+        Returns:
+            list: The recorded steps formatted the same way print_trace prints them.
+        """
+        return [f"{step}: {letter}" for step, letter in self.events]
+
+    def clear(self):
+        """Forgets all recorded steps."""
+        self.events = []
+
 
 def advance_rotors(rotor_positions, rotor_notches):
     """
-    Advances the rotors, simulating the stepping mechanism.
-    Rightmost rotor steps by 1 on every keypress.
-    Rotor 2 steps when rotor 1 reaches a certain notch.
-    Rotor 3 steps when rotor 2 reaches a certain notch.
-    """
-    # Step rotor 1
-    rotor_positions[0] = (rotor_positions[0] + 1) % 26
+    Steps the rotors for one keypress, the way the machine's pawls and ratchets do.
+    This is the only stepping logic: every encoder in the project steps through it.
 
-    # Check if rotor 1 hits the notch, advance rotor 2
-    if rotor_positions[0] == rotor_notches.get(0, None):
-        rotor_positions[1] = (rotor_positions[1] + 1) % 26
+    - The rightmost rotor steps on every keypress.
+    - A rotor steps when the rotor to its right is at its turnover position.
+    - A rotor at its own turnover position is pushed along with the rotor to its left.
+      This is the "double step": the middle rotor steps on two keypresses in a row.
+    - Rotors beyond the first STEPPING_ROTORS (the M4's thin fourth rotor) never move.
 
-        # If rotor 2 hits the notch, advance rotor 3
-        if rotor_positions[1] == rotor_notches.get(1, None):
-            rotor_positions[2] = (rotor_positions[2] + 1) % 26
+    Args:
+        rotor_positions (list): The rotor positions, rightmost rotor first. Changed in place.
+        rotor_notches (list): The turnover position of each rotor, or None for a rotor
+            without a notch.
+
+    Returns:
+        list: The stepped rotor positions.
+    """
+    # Work out which rotors move before moving any of them, as the pawls all push at once
+    stepping = [True] + [False] * (min(len(rotor_positions), STEPPING_ROTORS) - 1)
+    for i in range(1, len(stepping)):
+        if rotor_positions[i - 1] == rotor_notches[i - 1]:
+            stepping[i] = True  # The pawl drops into the notch of the rotor to the right...
+            stepping[i - 1] = True  # ...and pushes that rotor along too
+
+    for i, steps in enumerate(stepping):
+        if steps:
+            rotor_positions[i] = (rotor_positions[i] + 1) % 26
+    return rotor_positions
 
 
-def encode_letter_with_rotor_advance(plugboard, selected_rotors, selected_reflector, letter, rotor_positions, rotor_notches):
+def rotor_offsets(rotor_positions, ring_settings):
     """
-    Encode a single letter with rotor advancement and show detailed encryption steps.
+    Works out how far each rotor's wiring is turned from its home position.
+
+    The ring setting (Ringstellung) turns the wiring against the letter ring, so a rotor
+    at position p with ring setting r behaves like a rotor at position p - r with no ring
+    offset. Turnover still follows the letter ring, i.e. the position itself.
+
+    Args:
+        rotor_positions (list): The rotor positions, rightmost rotor first.
+        ring_settings (list): The ring settings, or None for all 0.
+
+    Returns:
+        list: The offset of each rotor, 0-25.
     """
+    if ring_settings is None:
+        return list(rotor_positions)
+    return [(position - ring) % 26 for position, ring in zip(rotor_positions, ring_settings)]
+
+
+def encode_letter_with_rotor_advance(plugboard, selected_rotors, selected_reflector, letter, rotor_positions, rotor_notches,
+                                     tracer=print_trace, ring_settings=None):
     """
-    Encodes a single letter while advancing the rotors and showing detailed encryption steps.
+    Encodes a single letter, stepping the rotors first as the machine does when a key is pressed,
+    and shows detailed encryption steps.
 
     Args:
         plugboard (Plugboard): The plugboard instance for initial and final character transformations.
-        selected_rotors (list): The list of selected rotors with their mappings.
+        selected_rotors (list): The list of selected rotors with their mappings, rightmost rotor first.
         selected_reflector (tuple): The selected reflector's name and mapping.
         letter (str): The letter to be encoded.
-        rotor_positions (list): The current positions of the rotors.
-        rotor_notches (list): The notch positions for the selected rotors.
+        rotor_positions (list): The current positions of the rotors. Stepped in place.
+        rotor_notches (list): The turnover positions for the selected rotors.
+        tracer (callable): Called with (step, letter) for every encryption step. Defaults to
+            print_trace; pass None to encode without any output.
+        ring_settings (list): The ring settings for the rotors. Defaults to all 0.
 
     Returns:
         str: The encoded letter after passing through the plugboard, rotors, reflector, and back.
@@ -67,86 +123,117 @@ def encode_letter_with_rotor_advance(plugboard, selected_rotors, selected_reflec
     alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
     original_letter = letter  # Store the original letter for displaying later
 
-    # Step 1: Plugboard input
+    # Step 1: Pressing the key steps the rotors before the current flows
+    advance_rotors(rotor_positions, rotor_notches)
+    offsets = rotor_offsets(rotor_positions, ring_settings)
+
+    # Step 2: Plugboard input
     plugboard_input = plugboard.transform_character(letter)
 
-    # Display rotor positions before encoding
-    rotor_position_str = ''.join([alphabet[pos] for pos in rotor_positions])
+    # Display rotor positions used for encoding
+    if tracer is not None:
+        rotor_position_str = ''.join([alphabet[pos] for pos in rotor_positions])
+        tracer("Keyboard Input", original_letter)
+        tracer("Rotors Position", rotor_position_str)
+        tracer("Plugboard Encryption", plugboard_input)
+
+    # Step 3: Pass through the rotors, rightmost first. The signal enters each rotor shifted
+    # by the rotor's offset and leaves shifted back by it.
+    letter = plugboard_input
+    for i, rotor in enumerate(selected_rotors):
+        index = (alphabet.index(letter) + offsets[i]) % 26
+        letter = alphabet[(alphabet.index(rotor[1][index]) - offsets[i]) % 26]
+        if tracer is not None:
+            tracer(f"Wheel {len(selected_rotors) - i} Encryption", letter)
+
+    # Step 4: Reflector
+    reflector_mapping = selected_reflector[1]
+    index = alphabet.index(letter)
+    letter = reflector_mapping[index]
+    if tracer is not None:
+        tracer("Reflector Encryption", letter)
 
-    print(f"Keyboard Input: {original_letter}")
-    print(f"Rotors Position: {rotor_position_str}")
-    print(f"Plugboard Encryption: {plugboard_input}")
+    # Reverse process through the rotors, leftmost first
+    for i in reversed(range(len(selected_rotors))):
+        index = (alphabet.index(letter) + offsets[i]) % 26
+        letter = alphabet[(selected_rotors[i][1].index(alphabet[index]) - offsets[i]) % 26]
+        if tracer is not None:
+            tracer(f"Wheel {len(selected_rotors) - i} Reverse Encryption", letter)
 
-    # Step 2: Pass through rotors (with advancement)
+    # Step 5: Final plugboard encryption
+    final_output = plugboard.transform_character(letter)
+    if tracer is not None:
+        tracer("Plugboard Encryption", final_output)
+        tracer(LAMPBOARD_STEP, final_output)
 
-    # Rotor 1
-    rotor1_mapping = selected_rotors[0][1]
-    index = (alphabet.index(plugboard_input) + rotor_positions[0]) % 26
-    letter = rotor1_mapping[index]
-    print(f"Wheel 3 Encryption: {letter}")
+    return final_output
 
-    # Rotor 2
-    rotor2_mapping = selected_rotors[1][1]
-    index = (alphabet.index(letter) + rotor_positions[1]) % 26
-    letter = rotor2_mapping[index]
-    print(f"Wheel 2 Encryption: {letter}")
 
-    # Rotor 3
-    rotor3_mapping = selected_rotors[2][1]
-    index = (alphabet.index(letter) + rotor_positions[2]) % 26
-    letter = rotor3_mapping[index]
-    print(f"Wheel 1 Encryption: {letter}")
+def encode_letter_profiled(stats, plugboard, selected_rotors, selected_reflector, letter, rotor_positions, rotor_notches,
+                           ring_settings=None):
+    """
+    Encodes a single letter exactly like encode_letter_with_rotor_advance, timing each stage
+    into an EncodingStats instead of reporting the steps.
 
-    # Step 3: Reflector
-    reflector_mapping = selected_reflector[1]
-    index = alphabet.index(letter)
-    letter = reflector_mapping[index]
-    print(f"Reflector Encryption: {letter}")
+    Args:
+        stats (EncodingStats): Where the stage counters and timings are added.
+        The other arguments are those of encode_letter_with_rotor_advance.
 
-    # Reverse process through rotors
+    Returns:
+        str: The encoded letter.
+    """
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    clock = time.perf_counter
 
-    # Rotor 3 reverse
-    rotor3_inverse_mapping = ''.join(alphabet[rotor3_mapping.index(a)] for a in alphabet)
-    index = (alphabet.index(letter) - rotor_positions[2]) % 26
-    letter = rotor3_inverse_mapping[index]
-    print(f"Wheel 1 Reverse Encryption: {letter}")
+    start = clock()
+    advance_rotors(rotor_positions, rotor_notches)
+    offsets = rotor_offsets(rotor_positions, ring_settings)
+    stepped = clock()
+    stats.add("stepping", stepped - start)
 
-    # Rotor 2 reverse
-    rotor2_inverse_mapping = ''.join(alphabet[rotor2_mapping.index(a)] for a in alphabet)
-    index = (alphabet.index(letter) - rotor_positions[1]) % 26
-    letter = rotor2_inverse_mapping[index]
-    print(f"Wheel 2 Reverse Encryption: {letter}")
+    letter = plugboard.transform_character(letter)
+    start = clock()
+    stats.add("plugboard", start - stepped)
 
-    # Rotor 1 reverse
-    rotor1_inverse_mapping = ''.join(alphabet[rotor1_mapping.index(a)] for a in alphabet)
-    index = (alphabet.index(letter) - rotor_positions[0]) % 26
-    letter = rotor1_inverse_mapping[index]
-    print(f"Wheel 3 Reverse Encryption: {letter}")
+    for i, rotor in enumerate(selected_rotors):
+        index = (alphabet.index(letter) + offsets[i]) % 26
+        letter = alphabet[(alphabet.index(rotor[1][index]) - offsets[i]) % 26]
+    end = clock()
+    stats.add("rotors", end - start, len(selected_rotors))
 
-    # Step 4: Final plugboard encryption
-    final_output = plugboard.transform_character(letter)
-    print(f"Plugboard Encryption: {final_output}")
-    print(f"Output (Lampboard): {final_output}")
-    print("-----------------------------")
+    letter = selected_reflector[1][alphabet.index(letter)]
+    start = clock()
+    stats.add("reflector", start - end)
 
-    # Step 5: Advance the rotors after each letter
-    advance_rotors(rotor_positions, rotor_notches)
+    for i in reversed(range(len(selected_rotors))):
+        index = (alphabet.index(letter) + offsets[i]) % 26
+        letter = alphabet[(selected_rotors[i][1].index(alphabet[index]) - offsets[i]) % 26]
+    end = clock()
+    stats.add("rotors", end - start, len(selected_rotors))
 
-    return final_output
+    letter = plugboard.transform_character(letter)
+    stats.add("plugboard", clock() - end)
+    return letter
 
 
-def encode_message_with_rotor_advance(plugboard, selected_rotors, selected_reflector, message, rotor_positions, rotor_notches_dict, ring_settings):
+def encode_message_with_rotor_advance(plugboard, selected_rotors, selected_reflector, message, rotor_positions, rotor_notches_dict, ring_settings,
+                                      tracer=print_trace, stats=None):
     """
     Encodes the entire message with rotor advancement for each letter.
+    An Enigma machine is its own inverse, so this also decodes a message set up with the same key.
 
     Args:
         plugboard (Plugboard): The plugboard instance for character transformations.
         selected_rotors (list): The list of selected rotors with their mappings.
         selected_reflector (tuple): The selected reflector's name and mapping.
         message (str): The message to be encoded.
-        rotor_positions (list): The current positions of the rotors.
-        rotor_notches_dict (dict): A dictionary mapping rotor names to their notch positions.
+        rotor_positions (list): The current positions of the rotors. Stepped in place.
+        rotor_notches_dict (dict): A dictionary mapping rotor names to their turnover positions.
         ring_settings (list): The ring settings for the rotors.
+        tracer (callable): Called with (step, letter) for every encryption step. Defaults to
+            print_trace; pass None to encode without any output.
+        stats (EncodingStats): Optional. If given, every letter goes through encode_letter_profiled
+            and the tracer is not used.
 
     Returns:
         str: The encoded message after processing each letter.
@@ -170,6 +257,18 @@ def encode_message_with_rotor_advance(plugboard, selected_rotors, selected_refle
     # Create rotor notches based on selected rotors
     #rotor_notches = [rotor_notches_dict[rotor[0]] for rotor in selected_rotors]
 
+    if stats is not None:
+        started = time.perf_counter()
+        encoded_message = []
+        for letter in message:
+            if letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
+                letter = encode_letter_profiled(stats, plugboard, selected_rotors, selected_reflector, letter,
+                                                rotor_positions, rotor_notches, ring_settings)
+            encoded_message.append(letter)
+        stats.add_message(len(message), sum(letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ" for letter in message),
+                          time.perf_counter() - started)
+        return ''.join(encoded_message)
+
     encoded_message = []
     for letter in message:
         if letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
@@ -180,12 +279,12 @@ def encode_message_with_rotor_advance(plugboard, selected_rotors, selected_refle
                 selected_reflector,
                 letter,
                 rotor_positions,
-                rotor_notches
+                rotor_notches,
+                tracer,
+                ring_settings
             )
 
             encoded_message.append(encoded_letter)
-            # Update rotor positions
-            rotor_positions = update_rotor_positions(rotor_positions, rotor_notches_dict, selected_rotors)
 
         else:
             encoded_message.append(letter)  # Keep spaces or non-alphabetic characters as-is
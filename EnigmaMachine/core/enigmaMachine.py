@@ -0,0 +1,555 @@
+"""
+enigmaMachine.py
+--------------------
+This module contains the EnigmaMachine class, a compiled version of the encoding
+mechanism in encodingMessage.py. The rotor, reflector and plugboard wirings are
+turned into integer lookup tables once, when the machine is built, so encoding a
+letter only needs a handful of list lookups instead of rebuilding strings.
+
+The rotors step through advance_rotors from encodingMessage.py, the same routine the
+reference functions use. Between turnovers only the rightmost rotor moves, so encode()
+combines the other rotors and the reflector into one table and rebuilds it only when a
+turnover comes round.
+
+A four rotor M4 runs on the same fast path: its fourth rotor never moves, so it is folded
+together with the thin reflector into one combined reflector table.
+
+The machine is silent by default. Passing a tracer (such as print_trace or a
+StepRecorder from encodingMessage.py) switches it to a separate traced code path
+that reports the same steps as encode_letter_with_rotor_advance. Passing an EncodingStats
+from encodingStats.py likewise switches it to a profiled code path that times every stage,
+and passing a TraceBuffer from traceBuffer.py to one that records every letter as integers.
+"""
+
+import copy
+import time
+
+from EnigmaMachine.core.encodingMessage import LAMPBOARD_STEP, STEPPING_ROTORS, advance_rotors
+from EnigmaMachine.core.enigmaPlugs import PlugLead, Plugboard
+from EnigmaMachine.core.enigmaRotors import (reflector_wirings_dict, rotor_notches_dict, rotor_wirings_dict,
+                                             thin_reflector_wirings_dict)
+from EnigmaMachine.core.rotorRegistry import ALPHABET, LETTER_INDEX, compile_wiring, compiled_wiring, ring_tables
+
+INNER_TABLE_CACHE_SIZE = 4 * 676  # Inner tables kept per machine: all 676 for a few fourth rotor positions
+
+
+def compile_plugboard(plugboard):
+    """Converts a Plugboard into a 26 entry integer lookup table.
+
+    Args:
+        plugboard (Plugboard): The plugboard instance to compile.
+
+    Returns:
+        tuple: Entry i holds the letter index that letter i is swapped with.
+    """
+    return tuple(plugboard.table)
+
+
+def check_components(rotor_names, reflector_name):
+    """Checks that named rotors and a reflector can be fitted together.
+
+    Args:
+        rotor_names (list): Rotor names from rotor_wirings_dict, rightmost rotor first. A machine
+            takes STEPPING_ROTORS (three); an M4 takes four, the last being Beta or Gamma.
+        reflector_name (str): A reflector name from reflector_wirings_dict, or from
+            thin_reflector_wirings_dict for an M4.
+
+    Returns:
+        str: The reflector's wiring.
+
+    Raises:
+        ValueError: If a name is unknown, there are too few rotors, or the rotors and reflector
+            do not fit together.
+    """
+    if len(rotor_names) < STEPPING_ROTORS:
+        # The period table, the vectorized encoder and their rotor states assume three stepping rotors
+        raise ValueError(f"A machine needs at least {STEPPING_ROTORS} rotors, got {len(rotor_names)}.")
+    for name in rotor_names:
+        if name not in rotor_wirings_dict:
+            raise ValueError(f"Unknown rotor {name!r}. Choose from {', '.join(rotor_wirings_dict)}.")
+    if len(rotor_names) > STEPPING_ROTORS:
+        # An M4: thin rotors in the extra slots and a thin reflector
+        reflectors = thin_reflector_wirings_dict
+        for name in rotor_names[STEPPING_ROTORS:]:
+            if rotor_notches_dict.get(name) is not None:
+                raise ValueError(f"Rotor {name} steps, so it cannot be fitted beyond the first "
+                                 f"{STEPPING_ROTORS} rotors. Use Beta or Gamma.")
+    else:
+        reflectors = reflector_wirings_dict
+    if reflector_name not in reflectors:
+        raise ValueError(f"Unknown reflector {reflector_name!r} for {len(rotor_names)} rotors. "
+                         f"Choose from {', '.join(reflectors)}.")
+    return reflectors[reflector_name]
+
+
+class EnigmaMachine:
+    """A compiled Enigma machine that encodes messages using integer lookup tables."""
+
+    def __init__(self, plugboard, selected_rotors, selected_reflector, rotor_positions, rotor_notches_dict,
+                 ring_settings=None, tracer=None, stats=None, trace=None):
+        """Builds the forward and inverse tables for the selected machine setup.
+
+        Args:
+            plugboard (Plugboard): The plugboard instance for character transformations.
+            selected_rotors (list): The list of selected rotors with their mappings.
+            selected_reflector (tuple): The selected reflector's name and mapping.
+            rotor_positions (list): The starting positions of the rotors.
+            rotor_notches_dict (dict): A dictionary mapping rotor names to their notch positions.
+            ring_settings (list): The ring settings for the rotors.
+            tracer (callable): Optional, called with (step, letter) for every encryption step.
+                Leave as None for the silent fast path.
+            stats (EncodingStats): Optional, records per-stage counters and timings.
+                Leave as None for the uninstrumented fast path.
+            trace (TraceBuffer): Optional, receives one structured record per letter.
+
+        Raises:
+            KeyError: If a selected rotor is not in the rotor notches dictionary.
+            ValueError: If the trace buffer is sized for a different number of rotors.
+        """
+        for rotor in selected_rotors:
+            if rotor[0] not in rotor_notches_dict:
+                raise KeyError(f"{rotor[0]} not found in rotor notches dictionary.")
+
+        self.selected_rotors = tuple((rotor[0], rotor[1]) for rotor in selected_rotors)
+        self.selected_reflector = (selected_reflector[0], selected_reflector[1])
+        self.rotor_notches = [rotor_notches_dict[rotor[0]] for rotor in selected_rotors]
+        self.rotor_positions = list(rotor_positions)
+        self.ring_settings = list(ring_settings) if ring_settings is not None else [0] * len(selected_rotors)
+        self.tracer = tracer
+        self.stats = stats
+        if trace is not None and trace.rotor_count != len(selected_rotors):
+            raise ValueError(f"The trace buffer holds records for {trace.rotor_count} rotors, "
+                             f"not {len(selected_rotors)}.")
+        self.trace = trace
+
+        # Rotors past the first STEPPING_ROTORS never move during a message
+        self.stepping_rotors = min(len(selected_rotors), STEPPING_ROTORS)
+
+        # Integer tables, built once for the lifetime of the machine
+        self.plugboard_table = compile_plugboard(plugboard)
+        # Rotor tables come from the shared catalog in rotorRegistry.py, compiled once per wiring
+        compiled = [compiled_wiring(rotor[1]) for rotor in selected_rotors]
+        self.reflector_table = compile_wiring(selected_reflector[1])
+
+        # The same tables at each of the 26 rotor positions with the ring settings applied,
+        # so a letter needs no arithmetic per rotor
+        self.forward_tables = tuple(ring_tables(tables[2], ring) for tables, ring in zip(compiled, self.ring_settings))
+        self.backward_tables = tuple(ring_tables(tables[3], ring) for tables, ring in zip(compiled, self.ring_settings))
+        self._reflector_tables = {}  # Combined reflector tables, keyed by the non-stepping rotors' positions
+        self._inner_tables = {}  # Inner tables, keyed by the positions of every rotor but the rightmost
+
+    @classmethod
+    def from_settings(cls, rotor_names, reflector_name, rotor_positions=None, ring_settings=None, plug_leads=(),
+                      tracer=None, stats=None):
+        """Builds a machine from rotor and reflector names, without any input() prompts.
+
+        Args:
+            rotor_names (list): Rotor names from rotor_wirings_dict, rightmost rotor first. An M4 takes
+                four, the last being Beta or Gamma.
+            reflector_name (str): A reflector name from reflector_wirings_dict, or from
+                thin_reflector_wirings_dict for an M4.
+            rotor_positions (list): The starting positions of the rotors. Defaults to all 0.
+            ring_settings (list): The ring settings for the rotors. Defaults to all 0.
+            plug_leads (list): Pairs of letters to connect on the plugboard, e.g. ["AB", "CD"].
+            tracer (callable): Optional, called with (step, letter) for every encryption step.
+            stats (EncodingStats): Optional, records per-stage counters and timings.
+
+        Returns:
+            EnigmaMachine: The compiled machine.
+
+        Raises:
+            ValueError: If a name is unknown, a position is out of range or a plug lead is invalid.
+        """
+        reflector_wiring = check_components(rotor_names, reflector_name)
+        if rotor_positions is None:
+            rotor_positions = [0] * len(rotor_names)
+        if ring_settings is None:
+            ring_settings = [0] * len(rotor_names)
+        for settings in (rotor_positions, ring_settings):
+            if len(settings) != len(rotor_names) or any(not 0 <= setting <= 25 for setting in settings):
+                raise ValueError(f"Expected {len(rotor_names)} settings between 0 and 25, got {list(settings)}.")
+
+        plugboard = Plugboard()
+        for lead in plug_leads:
+            plugboard.add_lead(PlugLead(lead))
+        selected_rotors = [(name, rotor_wirings_dict[name]) for name in rotor_names]
+        selected_reflector = (reflector_name, reflector_wiring)
+        return cls(plugboard, selected_rotors, selected_reflector, rotor_positions, rotor_notches_dict, ring_settings,
+                   tracer, stats)
+
+    def configuration_key(self):
+        """Returns a hashable key describing everything except the stepping rotors' positions.
+
+        Two machines with the same key produce the same output from the same rotor positions,
+        so the key can be used to share precomputed tables between them. The positions of
+        rotors that never move (an M4's fourth rotor) are part of the key.
+        """
+        return (
+            self.selected_rotors,
+            self.selected_reflector,
+            tuple(self.rotor_notches),
+            tuple(self.ring_settings),
+            tuple(self.plugboard_table),
+            tuple(self.rotor_positions[self.stepping_rotors:]),
+        )
+
+    def silent_copy(self):
+        """Returns a copy that shares the compiled tables but has no tracer, stats or trace.
+
+        Working copies made by the decoders and encoders use this, so they neither report into
+        the caller's tracer, stats or trace buffer nor leave the fast code path.
+        """
+        machine = copy.copy(self)
+        machine.tracer = machine.stats = machine.trace = None
+        return machine
+
+    def follow_plugboard(self, plugboard):
+        """Keeps the machine's plugboard table in step with a Plugboard as its leads are moved.
+
+        The machine takes the plugboard's current connections and from then on patches only the
+        table entries that each swap(), unswap() or undo() changes. The other tables do not
+        involve the plugboard, so nothing is rebuilt. Copies of the machine share the patched
+        table. Stop following with plugboard.remove_listener(machine.plugboard_changed).
+
+        Args:
+            plugboard (Plugboard): The plugboard to follow.
+        """
+        self.plugboard_table = list(plugboard.table)
+        plugboard.add_listener(self.plugboard_changed)
+
+    def plugboard_changed(self, entries):
+        """Patches the plugboard table. Called by a followed Plugboard with the (letter, partner) entries it set."""
+        table = self.plugboard_table
+        for letter, partner in entries:
+            table[letter] = partner
+
+    def next_positions(self, rotor_positions):
+        """Returns the rotor positions one keypress after the given ones.
+
+        Args:
+            rotor_positions (list): The rotor positions to step from. The list is not changed.
+
+        Returns:
+            list: The stepped rotor positions.
+        """
+        return advance_rotors(list(rotor_positions), self.rotor_notches)
+
+    def letter_positions(self, count):
+        """Lists the rotor positions that each of the next count letters will be encoded at.
+
+        The rotors step before every letter, so the first letter is encoded one step on
+        from the current positions.
+
+        Args:
+            count (int): The number of letters.
+
+        Returns:
+            list: One list of rotor positions per letter. The machine's positions are not changed.
+        """
+        positions = []
+        rotor_positions = self.rotor_positions
+        for _ in range(count):
+            rotor_positions = self.next_positions(rotor_positions)
+            positions.append(rotor_positions)
+        return positions
+
+    def position_path(self):
+        """Follows the rotor positions from the current ones until they start repeating.
+
+        Stepping is deterministic and there are only a limited number of rotor states, so the
+        positions always end up going round a cycle.
+
+        Returns:
+            tuple: (path, cycle_start). path[k] is a tuple of the rotor positions after k keypresses,
+            and from index cycle_start onwards the path repeats with period len(path) - cycle_start.
+        """
+        path = []
+        seen = {}
+        rotor_positions = tuple(self.rotor_positions)
+        while rotor_positions not in seen:
+            seen[rotor_positions] = len(path)
+            path.append(rotor_positions)
+            rotor_positions = tuple(self.next_positions(rotor_positions))
+        return path, seen[rotor_positions]
+
+    def positions_after(self, keypresses):
+        """Works out the rotor positions a number of keypresses ahead, without encoding anything.
+
+        Args:
+            keypresses (int): How many letters ahead to look.
+
+        Returns:
+            list: The rotor positions after that many keypresses.
+        """
+        path, cycle_start = self.position_path()
+        if keypresses >= len(path):
+            keypresses = cycle_start + (keypresses - cycle_start) % (len(path) - cycle_start)
+        return list(path[keypresses])
+
+    def seek(self, keypresses):
+        """Moves the rotors forward as if that many letters had been encoded.
+
+        Args:
+            keypresses (int): The number of letters to skip.
+        """
+        self.rotor_positions = self.positions_after(keypresses)
+
+    def step(self):
+        """Advances the rotor positions by one keypress, exactly as encode_letter_with_rotor_advance does."""
+        self.rotor_positions = self.next_positions(self.rotor_positions)
+
+    def encode_index(self, index):
+        """Encodes a single letter index at the current rotor positions, without stepping.
+
+        Args:
+            index (int): The alphabet index of the letter to encode.
+
+        Returns:
+            int: The alphabet index of the encoded letter.
+        """
+        return self.encode_index_at(index, self.rotor_positions)
+
+    def encode_index_at(self, index, rotor_positions):
+        """Encodes a single letter index at the given rotor positions, taking the ring settings into account.
+
+        Args:
+            index (int): The alphabet index of the letter to encode.
+            rotor_positions (list): The rotor positions to encode at.
+
+        Returns:
+            int: The alphabet index of the encoded letter.
+        """
+        stepping = self.stepping_rotors
+        index = self.plugboard_table[index]
+        for tables, position in zip(self.forward_tables[:stepping], rotor_positions):
+            index = tables[position][index]
+        index = self.reflector_at(rotor_positions)[index]
+        for rotor in reversed(range(stepping)):
+            index = self.backward_tables[rotor][rotor_positions[rotor]][index]
+        return self.plugboard_table[index]
+
+    def reflector_at(self, rotor_positions):
+        """Returns the reflector combined with the rotors that never move, at their given positions.
+
+        For a three rotor machine this is just the reflector. For an M4 the signal goes through
+        the thin fourth rotor, the thin reflector and back through the fourth rotor, and since
+        that rotor stays put the whole path is one fixed substitution.
+
+        Args:
+            rotor_positions (list): The rotor positions; only the non-stepping rotors' are used.
+
+        Returns:
+            tuple: The combined reflector table.
+        """
+        fixed_positions = tuple(rotor_positions[self.stepping_rotors:])
+        table = self._reflector_tables.get(fixed_positions)
+        if table is None:
+            table = []
+            for index in range(26):
+                for rotor, position in enumerate(fixed_positions, self.stepping_rotors):
+                    index = self.forward_tables[rotor][position][index]
+                index = self.reflector_table[index]
+                for rotor, position in reversed(list(enumerate(fixed_positions, self.stepping_rotors))):
+                    index = self.backward_tables[rotor][position][index]
+                table.append(index)
+            table = tuple(table)
+            self._reflector_tables[fixed_positions] = table
+        return table
+
+    def inner_table(self, rotor_positions):
+        """Combines every rotor but the rightmost, and the reflector, into one substitution.
+
+        These rotors only move at a turnover, so encode() looks this table up at turnovers
+        and uses it for all the letters in between. Tables are built once per position of
+        these rotors and kept, so short messages do not pay for building them again.
+        """
+        key = tuple(rotor_positions[1:])
+        inner = self._inner_tables.get(key)
+        if inner is not None:
+            return inner
+
+        # Wrap the reflector in one rotor at a time, from the leftmost stepping rotor inwards
+        inner = self.reflector_at(rotor_positions)
+        for rotor in reversed(range(1, self.stepping_rotors)):
+            forward = self.forward_tables[rotor][rotor_positions[rotor]]
+            backward = self.backward_tables[rotor][rotor_positions[rotor]]
+            inner = [backward[inner[forward[index]]] for index in range(26)]
+        inner = tuple(inner)
+        if len(self._inner_tables) >= INNER_TABLE_CACHE_SIZE:
+            self._inner_tables.clear()  # An M4 whose fourth rotor keeps being moved
+        self._inner_tables[key] = inner
+        return inner
+
+    def _quiet_steps(self, rotor_positions):
+        """Counts the coming keypresses that only move the rightmost rotor.
+
+        Returns:
+            int: The number of keypresses before the next turnover, or -1 if there never is one.
+        """
+        notches = self.rotor_notches
+        for rotor in range(1, self.stepping_rotors - 1):
+            if rotor_positions[rotor] == notches[rotor]:
+                return 0  # This rotor will be pushed along on the next keypress
+        if notches[0] is None or self.stepping_rotors == 1:
+            return -1  # Never turns over
+        return (notches[0] - rotor_positions[0]) % 26
+
+    def encode(self, message):
+        """Encodes a message, stepping the rotors before every letter.
+
+        Characters outside A-Z are kept as-is and do not advance the rotors.
+
+        Args:
+            message (str): The message to be encoded.
+
+        Returns:
+            str: The encoded message, identical to encode_message_with_rotor_advance.
+        """
+        if self.tracer is not None:
+            return self._encode_traced(message)
+        if self.trace is not None:
+            return self._encode_recorded(message)
+        if self.stats is not None:
+            return self._encode_profiled(message)
+
+        plugboard = self.plugboard_table
+        forward, backward = self.forward_tables[0], self.backward_tables[0]
+        notches = self.rotor_notches
+        positions = list(self.rotor_positions)
+        inner = self.inner_table(positions)
+        quiet = self._quiet_steps(positions)
+
+        encoded_message = []
+        for letter in message:
+            index = LETTER_INDEX.get(letter)
+            if index is None:
+                encoded_message.append(letter)  # Keep spaces or non-alphabetic characters as-is
+                continue
+            if quiet:
+                quiet -= 1
+                positions[0] = (positions[0] + 1) % 26  # Only the rightmost rotor moves
+            else:
+                advance_rotors(positions, notches)
+                inner = self.inner_table(positions)
+                quiet = self._quiet_steps(positions)
+            position = positions[0]
+            encoded_message.append(ALPHABET[plugboard[backward[position][inner[forward[position][plugboard[index]]]]]])
+        self.rotor_positions = positions
+        return ''.join(encoded_message)
+
+    def _encode_traced(self, message):
+        """Encodes a message like encode(), reporting every encryption step to the tracer."""
+        tracer = self.tracer
+        encoded_message = []
+        for letter in message:
+            index = LETTER_INDEX.get(letter)
+            if index is None:
+                encoded_message.append(letter)
+                continue
+
+            self.step()
+            positions = self.rotor_positions
+            rotor_count = len(self.forward_tables)
+            tracer("Keyboard Input", letter)
+            tracer("Rotors Position", ''.join(ALPHABET[position] for position in positions))
+            index = self.plugboard_table[index]
+            tracer("Plugboard Encryption", ALPHABET[index])
+            for rotor in range(rotor_count):
+                index = self.forward_tables[rotor][positions[rotor]][index]
+                tracer(f"Wheel {rotor_count - rotor} Encryption", ALPHABET[index])
+            index = self.reflector_table[index]
+            tracer("Reflector Encryption", ALPHABET[index])
+            for rotor in reversed(range(rotor_count)):
+                index = self.backward_tables[rotor][positions[rotor]][index]
+                tracer(f"Wheel {rotor_count - rotor} Reverse Encryption", ALPHABET[index])
+            index = self.plugboard_table[index]
+            tracer("Plugboard Encryption", ALPHABET[index])
+            tracer(LAMPBOARD_STEP, ALPHABET[index])
+
+            encoded_message.append(ALPHABET[index])
+        return ''.join(encoded_message)
+
+    def _encode_recorded(self, message):
+        """Encodes a message like encode(), writing a record of every letter to the trace buffer."""
+        trace = self.trace
+        rotor_count = len(self.forward_tables)
+        encoded_message = []
+        for letter in message:
+            index = LETTER_INDEX.get(letter)
+            if index is None:
+                encoded_message.append(letter)
+                continue
+
+            self.step()
+            positions = self.rotor_positions
+            record = [index] + positions
+            index = self.plugboard_table[index]
+            record.append(index)
+            for rotor in range(rotor_count):
+                index = self.forward_tables[rotor][positions[rotor]][index]
+                record.append(index)
+            index = self.reflector_table[index]
+            record.append(index)
+            for rotor in reversed(range(rotor_count)):
+                index = self.backward_tables[rotor][positions[rotor]][index]
+                record.append(index)
+            index = self.plugboard_table[index]
+            record.append(index)
+            trace.append(record)
+
+            encoded_message.append(ALPHABET[index])
+        return ''.join(encoded_message)
+
+    def _encode_profiled(self, message):
+        """Encodes a message like encode(), timing every stage into self.stats.
+
+        Each stage is looked up on its own, without the combined inner table, so that the
+        time spent in the rotors and in the reflector can be told apart.
+        """
+        clock = time.perf_counter
+        stats = self.stats
+        stepping = self.stepping_rotors
+        plugboard = self.plugboard_table
+        forward, backward = self.forward_tables[:stepping], self.backward_tables[:stepping]
+        reflector = self.reflector_at(self.rotor_positions)
+        notches = self.rotor_notches
+        positions = list(self.rotor_positions)
+        stepping_time = plugboard_time = rotors_time = reflector_time = 0.0
+        letters = 0
+
+        started = clock()
+        encoded_message = []
+        for letter in message:
+            index = LETTER_INDEX.get(letter)
+            if index is None:
+                encoded_message.append(letter)
+                continue
+            letters += 1
+            t0 = clock()
+            advance_rotors(positions, notches)
+            t1 = clock()
+            index = plugboard[index]
+            t2 = clock()
+            for rotor in range(stepping):
+                index = forward[rotor][positions[rotor]][index]
+            t3 = clock()
+            index = reflector[index]
+            t4 = clock()
+            for rotor in reversed(range(stepping)):
+                index = backward[rotor][positions[rotor]][index]
+            t5 = clock()
+            index = plugboard[index]
+            t6 = clock()
+            stepping_time += t1 - t0
+            plugboard_time += (t2 - t1) + (t6 - t5)
+            rotors_time += (t3 - t2) + (t5 - t4)
+            reflector_time += t4 - t3
+            encoded_message.append(ALPHABET[index])
+        self.rotor_positions = positions
+
+        stats.add("stepping", stepping_time, letters)
+        stats.add("plugboard", plugboard_time, 2 * letters)
+        stats.add("rotors", rotors_time, 2 * stepping * letters)
+        stats.add("reflector", reflector_time, letters)
+        stats.add_message(len(message), letters, clock() - started)
+        return ''.join(encoded_message)
@@ -3,12 +3,26 @@ enigmaPlugs.py
 This module defines the PlugLead and Plugboard classes, which represent the
 connections on the Enigma Machine's plugboard. It allows for character encoding
 through plug leads and manages user input for plug lead configuration.
+
+The Plugboard keeps a 26 entry lookup table that is updated whenever a lead is added,
+so transforming a character is a single lookup and a whole message can be transformed
+with one str.translate call.
+
+Leads can also be moved one at a time with swap() and unswap(), which only touch the
+table and translation entries of the two to four letters involved; the list of PlugLeads
+is only rebuilt from the table when it is next read. Every change is passed to the plugboard's listeners, so a
+compiled machine can patch its own table instead of being rebuilt, and is pushed on an
+undo stack, so a search can try a change, score it and take it back with undo().
 """
 
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
 # PlugLead Class
 class PlugLead:
 
     """Represents a single plug lead that connects two letters in the plugboard."""
+    __slots__ = ("mapping",)
+
     def __init__(self, mapping):
         """Initializes a PlugLead with a pair of letters.
 
@@ -41,21 +55,151 @@ class PlugLead:
             return self.mapping[0]
         return character
 
+def plug_index(letter):
+    """Turns a plugboard letter ("A"-"Z", either case) or index (0-25) into its index.
+
+    Raises:
+        ValueError: If the letter is not on the plugboard.
+    """
+    if isinstance(letter, int):
+        if 0 <= letter <= 25:
+            return letter
+    elif len(letter) == 1 and letter.upper() in ALPHABET:
+        return ALPHABET.index(letter.upper())
+    raise ValueError(f"{letter!r} is not a letter on the plugboard.")
+
 # Plugboard class
 class Plugboard:
     """Represents the entire plugboard, storing multiple PlugLead objects to encode characters."""
     # uses them to encode characters
     def __init__(self):
-        # Initialize an empty list to store plug leads (PlugLead objects)
-        self.plug_leads = []
+        # The plug leads (PlugLead objects), or None once swap() and unswap() have moved them
+        self._plug_leads = []
+        # table[i] is the index of the letter that letter i is connected to
+        self.table = list(range(26))
+        # The same connections as character codes, for str.translate
+        self._translation = {}
+        # Each entry undoes one swap() or unswap(): the (letter, partner) pairs it overwrote
+        self.history = []
+        self._listeners = []
 
     def add_lead(self, plug_lead):
         """Adds a plug lead to the plug board.
 
                 Args:
                     plug_lead (PlugLead): The PlugLead object to be added.
+
+                Raises:
+                    ValueError: If either letter is already connected, or the lead connects a letter to itself.
+        """
+        first, second = plug_lead.mapping
+        if first == second:
+            raise ValueError(f"A plug lead cannot connect {first} to itself.")
+        for letter in plug_lead.mapping:
+            if letter not in ALPHABET:
+                raise ValueError(f"{letter} is not a letter on the plugboard.")
+            if ord(letter) in self._translation:
+                raise ValueError(f"{letter} is already connected by another plug lead.")
+
+        if self._plug_leads is not None:
+            self._plug_leads.append(plug_lead)
+        self.table[ALPHABET.index(first)] = ALPHABET.index(second)
+        self.table[ALPHABET.index(second)] = ALPHABET.index(first)
+        self._translation[ord(first)] = ord(second)
+        self._translation[ord(second)] = ord(first)
+        self._notify([(ALPHABET.index(first), ALPHABET.index(second)), (ALPHABET.index(second), ALPHABET.index(first))])
+
+    @property
+    def plug_leads(self):
+        """list: The PlugLead objects connecting the letters, rebuilt from the table after a swap."""
+        if self._plug_leads is None:
+            self._plug_leads = [PlugLead(ALPHABET[letter] + ALPHABET[partner])
+                                for letter, partner in enumerate(self.table) if letter < partner]
+        return self._plug_leads
+
+    def add_listener(self, listener):
+        """Registers a callable to be told about every change to the connections.
+
+        Args:
+            listener (callable): Called with a list of (letter, partner) index pairs, the table
+                entries that were set. A letter that is its own partner has been unplugged.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Stops telling a listener registered with add_listener about changes."""
+        self._listeners.remove(listener)
+
+    def _notify(self, entries):
+        for listener in self._listeners:
+            listener(entries)
+
+    def _write(self, entries):
+        """Sets (letter, partner) table entries in place, keeping the translation in step.
+
+        The entries must leave the table a valid set of swaps, i.e. name both ends of every
+        lead they change. The list of leads is dropped, to be rebuilt when it is next read.
+        """
+        table, translation = self.table, self._translation
+        for letter, partner in entries:
+            table[letter] = partner
+            if partner == letter:
+                translation.pop(ord(ALPHABET[letter]), None)
+            else:
+                translation[ord(ALPHABET[letter])] = ord(ALPHABET[partner])
+        self._plug_leads = None
+        self._notify(entries)
+
+    def swap(self, first, second):
+        """Connects two letters with a lead, first unplugging any lead either is already on.
+
+        Args:
+            first (str or int): A letter or its index.
+            second (str or int): Another letter or its index.
+
+        Raises:
+            ValueError: If the letters are the same or not on the plugboard.
         """
-        self.plug_leads.append(plug_lead)
+        first, second = plug_index(first), plug_index(second)
+        if first == second:
+            raise ValueError(f"A plug lead cannot connect {ALPHABET[first]} to itself.")
+        table = self.table
+        entries = {first: second, second: first}
+        for letter in (first, second):
+            if table[letter] not in entries:
+                entries[table[letter]] = table[letter]  # Its old partner is left unplugged
+        self.history.append([(letter, table[letter]) for letter in entries])
+        self._write(list(entries.items()))
+
+    def unswap(self, letter):
+        """Removes the lead a letter is on.
+
+        Args:
+            letter (str or int): Either end of the lead, as a letter or its index.
+
+        Raises:
+            ValueError: If the letter is not connected.
+        """
+        letter = plug_index(letter)
+        partner = self.table[letter]
+        if partner == letter:
+            raise ValueError(f"{ALPHABET[letter]} is not connected by a plug lead.")
+        self.history.append([(letter, partner), (partner, letter)])
+        self._write([(letter, letter), (partner, partner)])
+
+    def undo(self):
+        """Takes back the latest swap() or unswap() that has not been undone.
+
+        Raises:
+            IndexError: If there is nothing to undo.
+        """
+        if not self.history:
+            raise IndexError("There is no plugboard change to undo.")
+        self._write(self.history.pop())
+
+    def clear_history(self):
+        """Keeps the current connections and forgets how they were reached, so they cannot be undone."""
+        self.history.clear()
 
     # This is the encode method but named something different to avoid
     # confusion with encode in PlugLead
@@ -66,13 +210,23 @@ class Plugboard:
             character (str): The character to transform.
 
         Returns:
-            str: The transformed character, or the original character if no change occurs.
+            str: The transformed character. As when each lead encoded the character in turn, the
+            result is uppercase once any lead is fitted; an empty plugboard returns the character as is.
+        """
+        if not self._translation:
+            return character
+        return character.upper().translate(self._translation)
+
+    def transform_string(self, message):
+        """Transforms a whole message through the plug leads in one go.
+
+        Args:
+            message (str): The message to transform. Only uppercase A-Z are swapped.
+
+        Returns:
+            str: The transformed message.
         """
-        for lead in self.plug_leads:
-            new_char = lead.encode(character)  # 'encode' is from PlugLead
-            if new_char != character:
-                return new_char # If a change is made, return the new character
-        return character  # Return the original character if no transformation is done
+        return message.translate(self._translation)
 
 def get_user_leads():
     """Prompts the user for plugboard leads and creates a Plugboard object.
@@ -82,22 +236,20 @@ def get_user_leads():
     """
     plugboard = Plugboard()
     lead_count = 10  # There are 10 plug leads allowed
-    used_characters = set()  # Track used characters
     all_leads = []
 
     for i in range(lead_count):
         while True:
             user_input = input(f"Please enter Lead {i + 1} (e.g., 'AB'): ").strip().upper()
 
-            # Validate that the input is two unique letters, and neither has been used already
-            if len(user_input) == 2 and user_input.isalpha() and user_input[0] not in used_characters and user_input[
-                1] not in used_characters:
+            # The plugboard rejects leads that are not two unique letters, or reuse a letter already entered
+            try:
                 plugboard.add_lead(PlugLead(user_input))
-                used_characters.update(user_input)  # Mark both characters as used
-                all_leads.append(user_input)
-                break
-            else:
+            except ValueError:
                 print("Invalid input. Please enter a pair of unique letters not already entered.")
+                continue
+            all_leads.append(user_input)
+            break
 
     # After all 10 leads are entered, confirm and print them back in a box
     print("\nAll 10 leads have been entered successfully!\n")
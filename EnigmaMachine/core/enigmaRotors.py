@@ -6,15 +6,40 @@ in the Enigma Machine, including the selection of rotors and reflectors
 based on user input.
 """
 
-# Define rotor notches in a dictionary.
+# Define rotor notches in a dictionary: the position (0 = A) a rotor is at when its notch
+# makes the rotor to its left step on the next keypress.
 rotor_notches_dict = {
-    "I": 17,  # Notch position for rotor I
-    "II": 5,  # Notch position for rotor II
-    "III": 22,  # Notch position for rotor III
-    "IV": 9,  # Notch position for rotor IV
-    "V": 25,  # Notch position for rotor V
-    "Beta": 15,  # Notch position for rotor Beta
-    "Gamma": 2,  # Notch position for rotor Gamma
+    "I": 16,  # Q, steps the next rotor as it moves from Q to R
+    "II": 4,  # E
+    "III": 21,  # V
+    "IV": 9,  # J
+    "V": 25,  # Z
+    "Beta": None,  # The thin rotors Beta and Gamma have no notch
+    "Gamma": None,
+}
+
+# Define the rotors in a dictionary with their labels and wiring.
+rotor_wirings_dict = {
+    "Beta": "LEYJVCNIXWPBQMDRTAKZGFUHOS",
+    "Gamma": "FSOKANUERHMBTIYCWLQPZXVGJD",
+    "I": "EKMFLGDQVZNTOWYHXUSPAIBRCJ",
+    "II": "AJDKSIRUXBLHWTMCQGZNPYFVOE",
+    "III": "BDFHJLCPRTXVZNYEIWGAKMUSQO",
+    "IV": "ESOVPZJAYQUIRHXLNFTGKDCMWB",
+    "V": "VZBRGITYUPSDNHLXAWMJQOFECK",
+}
+
+# Define the reflectors in a dictionary with their labels and wiring.
+reflector_wirings_dict = {
+    "A": "EJMZALYXVBWFCRQUONTSPIKHGD",
+    "B": "YRUHQSLDPXNGOKMIEBFZCWVJAT",
+    "C": "FVPJIAOYEDRZXWGCTKUQSBNMHL"
+}
+
+# The thin reflectors of the four rotor M4, used together with Beta or Gamma as the fourth rotor.
+thin_reflector_wirings_dict = {
+    "B-Thin": "ENKQAUYWJICOPBLMDXZVFTHRGS",
+    "C-Thin": "RDOBJNTKVEHMLFCWZAXGYIPSUQ",
 }
 
 def rotors_setup():
@@ -27,16 +52,7 @@ def rotors_setup():
     """
     print("We are now going to check the rotor setup.")
 
-    # Define the rotors in a dictionary with their labels
-    rotors = {
-        "Beta": "LEYJVCNIXWPBQMDRTAKZGFUHOS",
-        "Gamma": "FSOKANUERHMBTIYCWLQPZXVGJD",
-        "I": "EKMFLGDQVZNTOWYHXUSPAIBRCJ",
-        "II": "AJDKSIRUXBLHWTMCQGZNPYFVOE",
-        "III": "BDFHJLCPRTXVZNYEIWGAKMUSQO",
-        "IV": "ESOVPZJAYQUIRHXLNFTGKDCMWB",
-        "V": "VZBRGITYUPSDNHLXAWMJQOFECK",
-    }
+    rotors = rotor_wirings_dict
 
     # Show rotors available for selection
     print_rotors_to_choose(rotors)
@@ -77,11 +93,7 @@ def reflectors_setup():
     """
     print("We are now going to check the reflector setup.")
 
-    reflectors = {
-        "A": "EJMZALYXVBWFCRQUONTSPIKHGD",
-        "B": "YRUHQSLDPXNGOKMIEBFZCWVJAT",
-        "C": "FVPJIAOYEDRZXWGCTKUQSBNMHL"
-    }
+    reflectors = reflector_wirings_dict
     print_reflectors_to_choose(reflectors)
 
     # Ask the user to input which reflector they want to use
@@ -127,10 +139,6 @@ def print_reflectors_to_choose(reflectors):
         print(f"- {reflector_name}")
 
 def ring_settings_setup(selected_rotors):
-    """
-    This function is defined but not yet implemented.
-    It will handle the ring settings for the rotors.
-    """
     """
     Prompts the user to enter the ring settings for each selected rotor.
 
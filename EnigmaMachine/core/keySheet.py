@@ -0,0 +1,263 @@
+"""
+keySheet.py
+--------------------
+This module loads a key sheet, the list of daily keys issued for a month, so operators
+can pick up the day's settings instead of typing the plug leads, rotors and reflector in
+every session.
+
+A key sheet is a CSV file with a header row, e.g.
+
+    date,rotors,reflector,rings,positions,plugs,indicators
+    2024-05-01,I II III,B,AAA,AAA,AG BT QZ,JKM OGI NCJ GLP
+
+or a JSON file with the same fields, either as a list of objects or as {"keys": [...]}.
+Rotors are listed rightmost first, as in rotors_setup(). Rings and positions are letters
+or comma separated numbers; positions default to all A. Indicators are optional and are
+the groups that mark a message as using that day's key.
+
+Every key is checked and compiled once, when the sheet is loaded, so looking a key up by
+date or indicator and getting a machine for it costs no more than copying a machine.
+"""
+
+import copy
+import csv
+import datetime
+import json
+import os
+from collections import namedtuple
+
+from EnigmaMachine.core.enigmaPlugs import ALPHABET, PlugLead, Plugboard
+from EnigmaMachine.core.enigmaRotors import (reflector_wirings_dict, rotor_notches_dict, rotor_wirings_dict,
+                                             thin_reflector_wirings_dict)
+from EnigmaMachine.core.machineKeys import MachinePool, parse_settings
+
+
+class DailyKey(namedtuple("DailyKey", ["date", "rotors", "reflector", "rings", "positions", "plugs", "indicators"])):
+    """One day's key. Settings are tuples of integers, rightmost rotor first."""
+
+    __slots__ = ()
+
+    def as_key(self):
+        """Returns the key in the dict format used by machineKeys, enigmaBatch and enigmaServer."""
+        return {"rotors": list(self.rotors), "reflector": self.reflector, "rings": list(self.rings),
+                "positions": list(self.positions), "plugs": list(self.plugs)}
+
+    def components(self):
+        """Builds the plugboard, rotors and reflector in the form rotors_setup() and reflectors_setup() return.
+
+        Returns:
+            tuple: (plugboard, selected_rotors, selected_reflector).
+        """
+        plugboard = Plugboard()
+        for lead in self.plugs:
+            plugboard.add_lead(PlugLead(lead))
+        selected_rotors = [(name, rotor_wirings_dict[name]) for name in self.rotors]
+        reflectors = thin_reflector_wirings_dict if self.reflector in thin_reflector_wirings_dict else reflector_wirings_dict
+        return plugboard, selected_rotors, (self.reflector, reflectors[self.reflector])
+
+
+def _split(value, name):
+    """Splits a space or comma separated CSV field; lists from JSON are kept as they are.
+
+    Raises:
+        ValueError: If the field is not text or a list of text.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return value.replace(",", " ").split()
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"The {name} should be text or a list of text, got {value!r}.")
+    return value
+
+
+def parse_date(value):
+    """Reads a date given as a datetime.date or an ISO "YYYY-MM-DD" string.
+
+    Raises:
+        ValueError: If the string is not an ISO date.
+    """
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value).strip())
+
+
+def parse_daily_key(entry):
+    """Checks one key sheet entry and turns it into a DailyKey.
+
+    Args:
+        entry (dict): The fields of one row or JSON object.
+
+    Returns:
+        DailyKey: The validated key.
+
+    Raises:
+        ValueError: If a field is missing, invalid or of the wrong type.
+    """
+    if not entry.get("date"):
+        raise ValueError("The date is missing.")
+    date = parse_date(entry["date"])
+
+    rotors = tuple(_split(entry.get("rotors"), "rotors"))
+    if not rotors:
+        raise ValueError("No rotors are given.")
+    for name in rotors:
+        if name not in rotor_notches_dict or name not in rotor_wirings_dict:
+            raise ValueError(f"Unknown rotor {name!r}. Choose from {', '.join(rotor_notches_dict)}.")
+    if len(set(rotors)) != len(rotors):
+        raise ValueError(f"Rotor order {' '.join(rotors)} uses the same rotor twice.")
+
+    reflector = entry.get("reflector") or ""
+    if not isinstance(reflector, str):
+        raise ValueError(f"The reflector should be a name such as \"B\", got {reflector!r}.")
+    reflector = reflector.strip()
+    reflectors = thin_reflector_wirings_dict if len(rotors) == 4 else reflector_wirings_dict
+    if reflector not in reflectors:
+        raise ValueError(f"Unknown reflector {reflector!r} for {len(rotors)} rotors. "
+                         f"Choose from {', '.join(reflectors)}.")
+
+    settings = {}
+    for name in ("rings", "positions"):
+        value = entry.get(name)
+        if value is not None and not isinstance(value, (str, list)):
+            raise ValueError(f"The {name} should be letters or a list of settings, got {value!r}.")
+        settings[name] = tuple(parse_settings(value)) if value not in (None, "") else (0,) * len(rotors)
+        if len(settings[name]) != len(rotors) or any(not 0 <= setting <= 25 for setting in settings[name]):
+            raise ValueError(f"Expected {len(rotors)} {name} between 0 and 25, got {list(settings[name])}.")
+
+    plugs = tuple(lead.upper() for lead in _split(entry.get("plugs"), "plugs"))
+    used = set()
+    for lead in plugs:
+        if len(lead) != 2 or any(letter not in ALPHABET for letter in lead) or lead[0] == lead[1]:
+            raise ValueError(f"Invalid plug lead {lead!r}.")
+        if used & set(lead):
+            raise ValueError(f"Plug lead {lead} reuses a letter that is already connected.")
+        used.update(lead)
+
+    indicators = tuple(indicator.upper() for indicator in _split(entry.get("indicators"), "indicators"))
+    return DailyKey(date, rotors, reflector, settings["rings"], settings["positions"], plugs, indicators)
+
+
+def read_key_sheet(path):
+    """Reads the raw entries of a CSV or JSON key sheet.
+
+    Returns:
+        list: One dict of fields per key.
+
+    Raises:
+        ValueError: If a JSON key sheet is not a list of keys or an object with a "keys" list.
+    """
+    with open(path, newline="") as file:
+        if os.path.splitext(path)[1].lower() == ".json":
+            entries = json.load(file)
+            if isinstance(entries, dict):
+                if "keys" not in entries:
+                    raise ValueError(f"{path} should hold a list of keys or an object with a \"keys\" list.")
+                entries = entries["keys"]
+            if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+                raise ValueError(f"{path} should hold a list of keys, each one an object.")
+            return entries
+        return [{name.strip().lower(): value for name, value in row.items() if name} for row in csv.DictReader(file)]
+
+
+class KeySheet:
+    """An indexed store of daily keys, with their machines compiled up front."""
+
+    def __init__(self, keys):
+        """
+        Args:
+            keys (list): DailyKey entries, e.g. from parse_daily_key.
+
+        Raises:
+            ValueError: If two keys share a date or an indicator, or a key cannot be compiled. A key
+                that cannot be compiled is named by its number in keys and its date.
+        """
+        keys = list(keys)
+        self.keys = sorted(keys, key=lambda key: key.date)
+        self._by_date = {}
+        self._by_indicator = {}
+        for key in self.keys:
+            if key.date in self._by_date:
+                raise ValueError(f"There are two keys for {key.date}.")
+            self._by_date[key.date] = key
+            for indicator in key.indicators:
+                if indicator in self._by_indicator:
+                    raise ValueError(f"Indicator {indicator} is used on {self._by_indicator[indicator].date} "
+                                     f"and {key.date}.")
+                self._by_indicator[indicator] = key
+
+        # Compile every key now; days that share a configuration share a compiled machine
+        pool = MachinePool(maxsize=max(len(self.keys), 1))
+        self._machines = {}
+        for number, key in enumerate(keys, start=1):
+            try:
+                self._machines[key.date] = pool.get(key.as_key())
+            except (KeyError, ValueError) as error:
+                raise ValueError(f"Key {number} ({key.date}): {error}") from None
+        self.compiled = pool.compiled
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def for_date(self, date):
+        """Returns the key for a date (a datetime.date or "YYYY-MM-DD").
+
+        Raises:
+            KeyError: If the sheet has no key for the date.
+        """
+        date = parse_date(date)
+        if date not in self._by_date:
+            raise KeyError(f"The key sheet has no key for {date}.")
+        return self._by_date[date]
+
+    def for_indicator(self, indicator):
+        """Returns the key that an indicator group belongs to.
+
+        Raises:
+            KeyError: If no key on the sheet lists the indicator.
+        """
+        indicator = indicator.strip().upper()
+        if indicator not in self._by_indicator:
+            raise KeyError(f"No key on the sheet uses the indicator {indicator}.")
+        return self._by_indicator[indicator]
+
+    def machine(self, key, rotor_positions=None):
+        """Returns a machine ready to encode with a key from this sheet.
+
+        Args:
+            key (DailyKey): A key from for_date or for_indicator.
+            rotor_positions (list): Start positions for the message. Defaults to the key's positions.
+
+        Returns:
+            EnigmaMachine: A copy of the compiled machine, so its rotors can be moved freely.
+        """
+        machine = copy.copy(self._machines[key.date])
+        machine.rotor_positions = list(rotor_positions if rotor_positions is not None else key.positions)
+        return machine
+
+
+def load_key_sheet(path):
+    """Loads and validates a CSV or JSON key sheet.
+
+    Args:
+        path (str): The key sheet file. Files ending in .json are read as JSON, anything else as CSV.
+
+    Returns:
+        KeySheet: The indexed keys.
+
+    Raises:
+        ValueError: If any entry is invalid, naming the entry at fault.
+    """
+    keys = []
+    for number, entry in enumerate(read_key_sheet(path), start=1):
+        try:
+            keys.append(parse_daily_key(entry))
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"{path}, key {number}: {error}") from None
+    try:
+        return KeySheet(keys)
+    except ValueError as error:
+        raise ValueError(f"{path}: {error}") from None
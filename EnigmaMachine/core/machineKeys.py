@@ -0,0 +1,139 @@
+"""
+machineKeys.py
+--------------------
+This module turns a machine key written as plain data, e.g.
+
+    {"rotors": ["I", "II", "III"], "reflector": "B", "positions": "AAA", "rings": "AAA", "plugs": ["AB", "CD"]}
+
+into a compiled EnigmaMachine. Compiling is the expensive part of setting up a machine and
+does not depend on the rotor start positions, so a MachinePool keeps compiled machines
+keyed by everything except the positions and hands out cheap copies of them.
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+
+from EnigmaMachine.core.enigmaMachine import ALPHABET, EnigmaMachine
+
+MACHINE_POOL_SIZE = 64  # Default number of compiled configurations kept in a pool
+
+
+def parse_settings(values):
+    """Turns rotor positions or ring settings into integers.
+
+    Args:
+        values (list or str): Letters ("ABC" or ["A", "B", "C"]) or numbers 0-25, rightmost rotor first.
+
+    Returns:
+        list: The settings as integers.
+
+    Raises:
+        ValueError: If a value is neither a letter nor a number.
+    """
+    if isinstance(values, str):
+        values = list(values) if values.isalpha() else values.split(",")
+    settings = []
+    for value in values:
+        value = str(value).strip().upper()
+        if value.isdigit():
+            settings.append(int(value))
+        elif len(value) == 1 and value in ALPHABET:
+            settings.append(ALPHABET.index(value))
+        else:
+            raise ValueError(f"{value!r} is not a letter or a number between 0 and 25.")
+    return settings
+
+
+def normalize_key(key):
+    """Splits a key into its compiled configuration and its rotor start positions.
+
+    Args:
+        key (dict): A key with "rotors" and "reflector", and optionally "positions", "rings" and "plugs".
+
+    Returns:
+        tuple: (configuration, positions). configuration is a hashable (rotors, reflector, rings, plugs)
+        tuple that is the same for every key sharing a compiled machine.
+
+    Raises:
+        ValueError: If the rotors or reflector are missing, a field has the wrong type, or the
+            positions do not fit the rotors.
+    """
+    if not isinstance(key, dict) or not key.get("rotors") or not key.get("reflector"):
+        raise ValueError("A key needs rotors and a reflector.")
+    if not isinstance(key["rotors"], (list, tuple)) or not all(isinstance(name, str) for name in key["rotors"]):
+        raise ValueError("The rotors should be a list of rotor names.")
+    if not isinstance(key["reflector"], str):
+        raise ValueError("The reflector should be a reflector name.")
+    for field in ("positions", "rings"):
+        if key.get(field) is not None and not isinstance(key[field], (str, list, tuple)):
+            raise ValueError(f"The {field} should be a string or a list of letters or numbers.")
+    if key.get("plugs") and (not isinstance(key["plugs"], (list, tuple))
+                             or not all(isinstance(lead, str) for lead in key["plugs"])):
+        raise ValueError("The plugs should be a list of letter pairs, e.g. [\"AB\", \"CD\"].")
+    rotors = tuple(key["rotors"])
+    positions = parse_settings(key["positions"]) if key.get("positions") is not None else [0] * len(rotors)
+    if len(positions) != len(rotors) or any(not 0 <= position <= 25 for position in positions):
+        raise ValueError(f"Expected {len(rotors)} positions between 0 and 25, got {positions}.")
+    rings = tuple(parse_settings(key["rings"])) if key.get("rings") is not None else (0,) * len(rotors)
+    plugs = tuple(sorted(''.join(sorted(lead.upper())) for lead in key.get("plugs") or ()))
+    return (rotors, key["reflector"], rings, plugs), positions
+
+
+def compile_configuration(configuration):
+    """Builds a compiled machine, at the rotors' zero positions, for a configuration from normalize_key."""
+    rotors, reflector, rings, plugs = configuration
+    return EnigmaMachine.from_settings(list(rotors), reflector, None, list(rings), plugs)
+
+
+def build_machine(key):
+    """Builds a compiled machine for a key, set to the key's rotor start positions.
+
+    Raises:
+        ValueError: If the key is incomplete or invalid.
+    """
+    configuration, positions = normalize_key(key)
+    machine = compile_configuration(configuration)
+    machine.rotor_positions = positions
+    return machine
+
+
+class MachinePool:
+    """A least recently used cache of compiled machines, keyed by configuration. Safe to share between threads."""
+
+    def __init__(self, maxsize=MACHINE_POOL_SIZE):
+        """
+        Args:
+            maxsize (int): The largest number of compiled configurations to keep.
+        """
+        self.maxsize = maxsize
+        self.compiled = 0  # How many times a configuration had to be compiled
+        self._machines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._machines)
+
+    def get(self, key):
+        """Returns a machine for a key, ready to encode from the key's start positions.
+
+        The machine is a copy of the pooled one, so its rotor positions can change freely.
+
+        Raises:
+            ValueError: If the key is incomplete or invalid.
+        """
+        configuration, positions = normalize_key(key)
+        with self._lock:
+            template = self._machines.get(configuration)
+            if template is None:
+                template = compile_configuration(configuration)
+                self.compiled += 1
+                self._machines[configuration] = template
+                if len(self._machines) > self.maxsize:
+                    self._machines.popitem(last=False)
+            else:
+                self._machines.move_to_end(configuration)
+
+        machine = copy.copy(template)
+        machine.rotor_positions = list(positions)
+        return machine
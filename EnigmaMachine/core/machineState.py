@@ -0,0 +1,149 @@
+"""
+machineState.py
+--------------------
+This module packs the full state of a machine (rotor order, reflector, ring settings,
+rotor positions and plugboard) into a few dozen bytes, and unpacks it again.
+
+A snapshot is cheap enough to take every few thousand characters, so a long encoding job
+can be checkpointed and resumed exactly where it stopped, and a precomputed start state can
+be sent to a worker process instead of a pickled machine with all its tables.
+
+The binary layout for a machine with n rotors is n * 3 + 29 bytes:
+
+    version | n | rotor ids (n) | reflector id | ring settings (n) | positions (n) | plugboard (26)
+
+Rotors and reflectors are stored as their index in ROTOR_NAMES and REFLECTOR_NAMES, the
+standard parts of rotorRegistry.py, and the plugboard as its 26 entry table (entry i is the
+letter that letter i is connected to). to_text() turns the bytes into a fixed-width ASCII
+string that can be printed or typed in.
+
+Only machines built from standard parts can be snapshotted. Custom parts would have ids that
+differ between processes, and notches are not stored at all: a snapshot is restored with
+each rotor's standard notch, so from_machine refuses a machine whose rotors step on any other.
+"""
+
+import base64
+from collections import namedtuple
+
+from EnigmaMachine.core.enigmaMachine import ALPHABET, EnigmaMachine
+from EnigmaMachine.core.enigmaPlugs import PlugLead, Plugboard
+from EnigmaMachine.core.rotorRegistry import REFLECTORS, ROTORS, STANDARD_REFLECTORS, STANDARD_ROTORS
+
+STATE_VERSION = 1
+ROTOR_NAMES = STANDARD_ROTORS
+REFLECTOR_NAMES = STANDARD_REFLECTORS
+
+
+class MachineState(namedtuple("MachineState", ["rotors", "reflector", "rings", "positions", "plugboard"])):
+    """A snapshot of a machine. Settings are tuples of integers, rightmost rotor first."""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_machine(cls, machine):
+        """Takes a snapshot of a compiled machine.
+
+        Raises:
+            ValueError: If a rotor or the reflector is not one of the standard wirings, or a rotor
+                does not have its standard notch.
+        """
+        rotors = tuple(name for name, _ in machine.selected_rotors)
+        for (name, wiring), notch in zip(machine.selected_rotors, machine.rotor_notches):
+            if name not in ROTOR_NAMES or ROTORS[name].wiring != wiring:
+                raise ValueError(f"Rotor {name} does not have a standard wiring, so it cannot be snapshotted.")
+            if ROTORS[name].notch != notch:
+                raise ValueError(f"Rotor {name} does not have its standard notch, so it cannot be snapshotted.")
+        reflector, wiring = machine.selected_reflector
+        if reflector not in REFLECTOR_NAMES or REFLECTORS[reflector].wiring != wiring:
+            raise ValueError(f"Reflector {reflector} does not have a standard wiring, so it cannot be snapshotted.")
+        return cls(rotors, reflector, tuple(machine.ring_settings), tuple(machine.rotor_positions),
+                   tuple(machine.plugboard_table))
+
+    def to_bytes(self):
+        """Packs the state into n * 3 + 29 bytes."""
+        return bytes([STATE_VERSION, len(self.rotors)]
+                     + [ROTOR_NAMES.index(name) for name in self.rotors]
+                     + [REFLECTOR_NAMES.index(self.reflector)]
+                     + list(self.rings) + list(self.positions) + list(self.plugboard))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Unpacks a state packed by to_bytes.
+
+        Raises:
+            ValueError: If the data is not a valid snapshot.
+        """
+        data = bytes(data)
+        if len(data) < 2 or data[0] != STATE_VERSION:
+            raise ValueError("The data is not a machine state snapshot of a known version.")
+        count = data[1]
+        if len(data) != count * 3 + 29:
+            raise ValueError(f"A snapshot of {count} rotors is {count * 3 + 29} bytes, got {len(data)}.")
+
+        rotor_ids, reflector_id = data[2:2 + count], data[2 + count]
+        rings, positions = data[3 + count:3 + 2 * count], data[3 + 2 * count:3 + 3 * count]
+        plugboard = data[3 + 3 * count:]
+        if any(index >= len(ROTOR_NAMES) for index in rotor_ids) or reflector_id >= len(REFLECTOR_NAMES):
+            raise ValueError("The snapshot names an unknown rotor or reflector.")
+        if any(setting > 25 for setting in rings + positions + plugboard):
+            raise ValueError("The snapshot has a setting outside 0-25.")
+        if any(plugboard[plugboard[index]] != index for index in range(26)):
+            raise ValueError("The snapshot's plugboard does not connect letters in pairs.")
+        return cls(tuple(ROTOR_NAMES[index] for index in rotor_ids), REFLECTOR_NAMES[reflector_id], tuple(rings),
+                   tuple(positions), tuple(plugboard))
+
+    def to_text(self):
+        """Packs the state into a fixed-width string of letters, digits, '-' and '_'."""
+        return base64.urlsafe_b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def from_text(cls, text):
+        """Unpacks a state packed by to_text.
+
+        Raises:
+            ValueError: If the text is not a valid snapshot.
+        """
+        try:
+            data = base64.urlsafe_b64decode(text.strip().encode("ascii"))
+        except (UnicodeEncodeError, ValueError):
+            raise ValueError("The text is not a machine state snapshot.") from None
+        return cls.from_bytes(data)
+
+    def plug_leads(self):
+        """Returns the plugboard as a list of leads, e.g. ["AG", "BT"]."""
+        return [ALPHABET[index] + ALPHABET[partner] for index, partner in enumerate(self.plugboard) if index < partner]
+
+    def components(self):
+        """Builds the plugboard, rotors and reflector in the form rotors_setup() and reflectors_setup() return.
+
+        Returns:
+            tuple: (plugboard, selected_rotors, selected_reflector).
+        """
+        plugboard = Plugboard()
+        for lead in self.plug_leads():
+            plugboard.add_lead(PlugLead(lead))
+        selected_rotors = [(name, ROTORS[name].wiring) for name in self.rotors]
+        return plugboard, selected_rotors, (self.reflector, REFLECTORS[self.reflector].wiring)
+
+    def machine(self, tracer=None):
+        """Builds a compiled machine in exactly this state.
+
+        Raises:
+            ValueError: If the rotors and reflector do not fit together.
+        """
+        return EnigmaMachine.from_settings(list(self.rotors), self.reflector, list(self.positions), list(self.rings),
+                                           self.plug_leads(), tracer)
+
+
+def snapshot(machine):
+    """Packs a machine's full state into bytes. See MachineState.to_bytes."""
+    return MachineState.from_machine(machine).to_bytes()
+
+
+def restore(data):
+    """Builds a compiled machine from bytes packed by snapshot.
+
+    Raises:
+        ValueError: If the data is not a valid snapshot.
+    """
+    return MachineState.from_bytes(data).machine()
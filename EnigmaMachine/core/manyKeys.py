@@ -0,0 +1,260 @@
+"""
+manyKeys.py
+--------------------
+This module encodes one message under many keys at once, e.g. to generate corpora or to
+check every entry of a key sheet. Instead of compiling an EnigmaMachine per key, the keys
+are packed into a KeyBatch of NumPy arrays (rotor ids, reflector ids, ring settings, start
+positions and plugboard tables), and the wiring of each distinct rotor and reflector is
+compiled once for the whole batch.
+
+Encoding is then a 2D problem over keys x letters: the rotors of every key are stepped
+together one letter at a time, and each stage is one NumPy gather over the whole block.
+Large batches are split into blocks of keys so memory stays bounded, and the blocks can be
+spread over a process pool. The result is a single (keys, characters) array of character
+codes with no Python object per key.
+
+Usage:
+    batch = compile_keys([{"rotors": ["I", "II", "III"], "reflector": "B", "positions": "ABC"}, ...])
+    results = encode_many_keys("HELLO WORLD", batch)
+    row_text(results, 0)  # The message encoded under the first key
+"""
+
+import os
+from collections import namedtuple
+
+from EnigmaMachine.core.encodingMessage import STEPPING_ROTORS
+from EnigmaMachine.core.enigmaMachine import check_components
+from EnigmaMachine.core.enigmaPlugs import PlugLead, Plugboard
+from EnigmaMachine.core.machineKeys import normalize_key
+from EnigmaMachine.core.rotorRegistry import REFLECTORS, ROTORS
+from EnigmaMachine.core.vectorEncoder import _require_numpy, np
+
+BLOCK_CELLS = 1 << 22  # Keys x letters encoded per NumPy pass
+NO_NOTCH = 26  # Stands in for the notch of a rotor that has none; never equal to a position
+
+
+class KeyBatch(namedtuple("KeyBatch", ["rotor_names", "rotor_ids", "reflector_names", "reflector_ids", "rings",
+                                       "positions", "plugboards"])):
+    """Many keys as arrays, one row per key and one column per rotor, rightmost rotor first.
+
+    rotor_ids and reflector_ids index the distinct names in rotor_names and reflector_names,
+    and plugboards holds each key's 26 entry plugboard table.
+    """
+
+    __slots__ = ()
+
+    def select(self, rows):
+        """Returns the keys in rows (a slice or an index array) as a new batch sharing the name catalogs."""
+        return self._replace(rotor_ids=self.rotor_ids[rows], reflector_ids=self.reflector_ids[rows],
+                             rings=self.rings[rows], positions=self.positions[rows], plugboards=self.plugboards[rows])
+
+
+def compile_keys(keys):
+    """Packs keys written as plain data into a KeyBatch.
+
+    Args:
+        keys (iterable): Keys in the form machineKeys.normalize_key takes, e.g.
+            {"rotors": ["I", "II", "III"], "reflector": "B", "positions": "ABC", "plugs": ["AB"]}.
+
+    Returns:
+        KeyBatch: The keys, in the same order.
+
+    Raises:
+        ImportError: If NumPy is not installed.
+        ValueError: If a key is invalid, or the keys do not all have the same number of rotors.
+    """
+    _require_numpy()
+    rotor_names, reflector_names = {}, {}  # Name -> id, in order of first use
+    rotor_ids, reflector_ids, rings, positions, plugboards = [], [], [], [], []
+    plugboard_tables = {}  # Keys often share a plugboard
+    for key in keys:
+        (rotors, reflector, key_rings, plugs), key_positions = normalize_key(key)
+        check_components(rotors, reflector)
+        if rotor_ids and len(rotors) != len(rotor_ids[0]):
+            raise ValueError(f"Every key in a batch needs the same number of rotors, got {len(rotor_ids[0])} "
+                             f"and {len(rotors)}.")
+        if len(key_rings) != len(rotors) or any(not 0 <= ring <= 25 for ring in key_rings):
+            raise ValueError(f"Expected {len(rotors)} ring settings between 0 and 25, got {list(key_rings)}.")
+        if plugs not in plugboard_tables:
+            plugboard = Plugboard()
+            for lead in plugs:
+                plugboard.add_lead(PlugLead(lead))
+            plugboard_tables[plugs] = plugboard.table
+        rotor_ids.append([rotor_names.setdefault(name, len(rotor_names)) for name in rotors])
+        reflector_ids.append(reflector_names.setdefault(reflector, len(reflector_names)))
+        rings.append(key_rings)
+        positions.append(key_positions)
+        plugboards.append(plugboard_tables[plugs])
+
+    return KeyBatch(tuple(rotor_names), np.array(rotor_ids, dtype=np.uint8).reshape(len(positions), -1),
+                    tuple(reflector_names), np.array(reflector_ids, dtype=np.uint8),
+                    np.array(rings, dtype=np.uint8).reshape(len(positions), -1),
+                    np.array(positions, dtype=np.uint8).reshape(len(positions), -1),
+                    np.array(plugboards, dtype=np.uint8).reshape(len(positions), 26))
+
+
+def sweep_positions(key, positions=None):
+    """Builds a batch of one key at many start positions, for key-space sweeps.
+
+    Args:
+        key (dict): The key to sweep. Its own positions are ignored.
+        positions (array-like): (keys, rotors) start positions. Defaults to all 26 ** 3 positions of
+            the stepping rotors, with any rotors beyond them at the key's positions.
+
+    Returns:
+        KeyBatch: The key once for every row of positions.
+
+    Raises:
+        ImportError: If NumPy is not installed.
+        ValueError: If the key or the positions are invalid.
+    """
+    batch = compile_keys([key])
+    if positions is None:
+        stepping = min(batch.positions.shape[1], STEPPING_ROTORS)
+        grid = np.indices((26,) * stepping, dtype=np.uint8).reshape(stepping, -1).T[:, ::-1]
+        positions = np.hstack([grid, np.repeat(batch.positions[:, stepping:], len(grid), axis=0)])
+    positions = np.asarray(positions)
+    if positions.ndim != 2 or positions.shape[1] != batch.positions.shape[1] or positions.min(initial=0) < 0 \
+            or positions.max(initial=0) > 25:
+        raise ValueError(f"Expected a (keys, {batch.positions.shape[1]}) array of positions between 0 and 25.")
+    count = len(positions)
+    return batch._replace(rotor_ids=np.repeat(batch.rotor_ids, count, axis=0),
+                          reflector_ids=np.repeat(batch.reflector_ids, count),
+                          rings=np.repeat(batch.rings, count, axis=0), positions=positions.astype(np.uint8),
+                          plugboards=np.repeat(batch.plugboards, count, axis=0))
+
+
+def compile_catalog(batch):
+    """Stacks the compiled tables of each distinct rotor and reflector in a batch.
+
+    The tables come from the catalog in rotorRegistry.py, where each rotor is compiled at
+    its 26 offsets (position minus ring setting), so a rotor pass is a single lookup with
+    no arithmetic.
+
+    Returns:
+        tuple: (forward, backward, notches, reflectors) arrays indexed by rotor or reflector id.
+        forward and backward are flattened, entry (id * 26 + offset) * 26 + letter.
+    """
+    rotors = [ROTORS[name] for name in batch.rotor_names]
+    notches = [NO_NOTCH if rotor.notch is None else rotor.notch for rotor in rotors]
+    return (np.array([rotor.forward for rotor in rotors], dtype=np.uint8).ravel(),
+            np.array([rotor.backward for rotor in rotors], dtype=np.uint8).ravel(),
+            np.array(notches, dtype=np.int16),
+            np.array([REFLECTORS[name].table for name in batch.reflector_names], dtype=np.uint8))
+
+
+def _rotor_offsets(batch, notches, count):
+    """Steps every key's rotors together for count letters, as advance_rotors does for one key.
+
+    Returns:
+        numpy.ndarray: (rotors, keys, count) rotor offsets (position minus ring setting) for each
+        letter. Rotors that never step keep the same offset throughout, so only get one column.
+    """
+    keys, rotors = batch.positions.shape
+    stepping = min(rotors, STEPPING_ROTORS)
+    positions = batch.positions.astype(np.int16)
+    rings = batch.rings.astype(np.int16)
+    key_notches = notches[batch.rotor_ids[:, :stepping].astype(np.intp)]
+
+    offsets = np.empty((stepping, keys, count), dtype=np.int16)
+    for letter in range(count):
+        moves = np.zeros((keys, stepping), dtype=np.int16)
+        moves[:, 0] = 1
+        for rotor in range(1, stepping):
+            at_notch = positions[:, rotor - 1] == key_notches[:, rotor - 1]
+            moves[:, rotor] |= at_notch
+            moves[:, rotor - 1] |= at_notch
+        positions[:, :stepping] = (positions[:, :stepping] + moves) % 26
+        offsets[:, :, letter] = ((positions[:, :stepping] - rings[:, :stepping]) % 26).T
+    fixed_offsets = ((positions[:, stepping:] - rings[:, stepping:]) % 26).T[:, :, None]
+    return list(offsets) + list(fixed_offsets)
+
+
+def _encode_block(letters, batch, catalog):
+    """Encodes letter indices under every key of a batch.
+
+    Returns:
+        numpy.ndarray: (keys, letters) uint8 encoded letter indices.
+    """
+    forward, backward, notches, reflectors = catalog
+    rotor_ids = batch.rotor_ids.astype(np.intp)
+
+    # Where each rotor's table for each letter starts in the flattened catalog. The same
+    # index serves the forward and the backward pass.
+    table_starts = [(rotor_ids[:, rotor, None] * 26 + offsets) * 26
+                    for rotor, offsets in enumerate(_rotor_offsets(batch, notches, len(letters)))]
+
+    signals = batch.plugboards[:, letters]
+    for starts in table_starts:
+        signals = forward[starts + signals]
+    signals = np.take_along_axis(reflectors[batch.reflector_ids.astype(np.intp)], signals.astype(np.intp), axis=1)
+    for starts in reversed(table_starts):
+        signals = backward[starts + signals]
+    return np.take_along_axis(batch.plugboards, signals.astype(np.intp), axis=1)
+
+
+def _encode_keys(codes, batch, catalog):
+    """Encodes character codes under every key of a batch, in blocks of keys. Runs in the workers too.
+
+    Args:
+        codes (numpy.ndarray): The message's character codes.
+        batch (KeyBatch): The keys.
+        catalog (tuple): The batch's tables from compile_catalog. Workers are sent the tables rather
+            than looking the names up, as parts registered in this process are unknown to them.
+
+    Returns:
+        numpy.ndarray: (keys, characters) codes of the same type as codes.
+    """
+    is_letter = (codes >= 65) & (codes <= 90)
+    letters = (codes[is_letter] - 65).astype(np.intp)
+    results = np.repeat(codes[None, :], len(batch.positions), axis=0)
+    if len(letters) == 0 or len(batch.positions) == 0:
+        return results
+
+    block = max(1, BLOCK_CELLS // len(letters))
+    for start in range(0, len(batch.positions), block):
+        rows = slice(start, start + block)
+        results[rows, is_letter] = _encode_block(letters, batch.select(rows), catalog) + 65
+    return results
+
+
+def encode_many_keys(message, keys, workers=1):
+    """Encodes one message under every key of a batch.
+
+    Args:
+        message (str): The message to be encoded.
+        keys (KeyBatch or iterable): The keys, as a KeyBatch or as plain data for compile_keys.
+        workers (int): The number of worker processes. 1 encodes in this process; None uses one
+            per CPU core.
+
+    Returns:
+        numpy.ndarray: (keys, characters) character codes, uint8 for an ASCII message and UTF-32
+        code points otherwise. Row k equals EnigmaMachine.encode(message) under key k.
+
+    Raises:
+        ImportError: If NumPy is not installed.
+        ValueError: If a key is invalid.
+    """
+    batch = keys if isinstance(keys, KeyBatch) else compile_keys(keys)
+    if message.isascii():
+        codes = np.frombuffer(message.encode('ascii'), dtype=np.uint8)
+    else:
+        codes = np.frombuffer(message.encode('utf-32-le'), dtype='<u4')
+
+    catalog = compile_catalog(batch)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(batch.positions) < 2:
+        return _encode_keys(codes, batch, catalog)
+
+    from concurrent.futures import ProcessPoolExecutor  # Only needed when the keys are spread over processes
+    bounds = np.linspace(0, len(batch.positions), min(workers, len(batch.positions)) + 1).astype(int)
+    parts = [batch.select(slice(start, stop)) for start, stop in zip(bounds, bounds[1:])]
+    with ProcessPoolExecutor(max_workers=len(parts)) as executor:
+        return np.vstack(list(executor.map(_encode_keys, [codes] * len(parts), parts, [catalog] * len(parts))))
+
+
+def row_text(results, row):
+    """Returns one key's encoded message from an encode_many_keys result as a string."""
+    codes = results[row]
+    return codes.tobytes().decode('ascii' if codes.dtype == np.uint8 else 'utf-32-le')
@@ -0,0 +1,90 @@
+"""
+mmapEncoder.py
+--------------------
+This module encodes large files through memory maps instead of read() and write() calls.
+The input (and output) file is mapped into memory and encoded one window of pages at a
+time, so memory use stays the same however large the file is, and the whole content is
+never turned into a Python string.
+
+As in encode_message_with_rotor_advance, uppercase A-Z are encoded and every other byte
+is copied unchanged without advancing the rotors. With NumPy installed each window is
+encoded by a VectorEncoder straight from the mapped bytes; without it the period table
+engine is used one window at a time.
+
+A file can also be rewritten in place, which needs no extra disk space.
+"""
+
+import mmap
+import os
+
+from EnigmaMachine.core.periodTable import encode_with_period_table
+from EnigmaMachine.core.vectorEncoder import VectorEncoder, np
+
+DEFAULT_WINDOW_SIZE = mmap.PAGESIZE * 256  # Bytes encoded per window (1 MB with 4 KB pages)
+
+
+def window_encoder(machine):
+    """Picks the fastest engine available for encoding windows of bytes.
+
+    Args:
+        machine (EnigmaMachine): The compiled machine. Its rotor positions carry over between windows.
+
+    Returns:
+        callable: Takes a bytes-like window and returns its encoded bytes (or a NumPy uint8 array).
+    """
+    if np is not None:
+        encoder = VectorEncoder(machine)
+        return lambda window: encoder.encode_codes(np.frombuffer(window, dtype=np.uint8))
+    # latin-1 maps every byte to one character and back, so no byte can be lost
+    return lambda window: encode_with_period_table(machine, bytes(window).decode('latin-1')).encode('latin-1')
+
+
+def _encode_windows(encode, source, destination, size, window_size):
+    """Encodes size bytes from one mapping into another (or the same) mapping, a window at a time."""
+    with memoryview(source) as view:
+        for start in range(0, size, window_size):
+            end = min(start + window_size, size)
+            with view[start:end] as window:
+                destination[start:end] = encode(window)
+
+
+def _advise_sequential(mapping):
+    if hasattr(mapping, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+
+
+def encode_mmap(machine, src, dst=None, window_size=DEFAULT_WINDOW_SIZE):
+    """Encodes a file of any size through memory maps.
+
+    Args:
+        machine (EnigmaMachine): The compiled machine. Its rotor positions are advanced.
+        src (str): Path of the file to encode.
+        dst (str): Path the encoded file is written to. If None, src is rewritten in place.
+        window_size (int): The number of bytes encoded at a time, rounded up to whole pages.
+
+    Returns:
+        int: The number of bytes encoded.
+    """
+    window_size = -(-window_size // mmap.PAGESIZE) * mmap.PAGESIZE
+    size = os.path.getsize(src)
+    encode = window_encoder(machine)
+
+    if dst is None:
+        if size == 0:
+            return 0
+        with open(src, 'r+b') as file, mmap.mmap(file.fileno(), size, access=mmap.ACCESS_WRITE) as mapping:
+            _advise_sequential(mapping)
+            _encode_windows(encode, mapping, mapping, size, window_size)
+            mapping.flush()
+        return size
+
+    with open(src, 'rb') as source_file, open(dst, 'w+b') as destination_file:
+        if size == 0:
+            return 0  # Empty files cannot be mapped; dst has been created empty
+        destination_file.truncate(size)
+        with mmap.mmap(source_file.fileno(), size, access=mmap.ACCESS_READ) as source, \
+                mmap.mmap(destination_file.fileno(), size, access=mmap.ACCESS_WRITE) as destination:
+            _advise_sequential(source)
+            _encode_windows(encode, source, destination, size, window_size)
+            destination.flush()
+    return size
@@ -0,0 +1,320 @@
+"""
+ngramSearch.py
+--------------------
+This module attacks a message when no crib is available. Trial decryptions are scored
+by how much they look like language:
+
+- The index of coincidence picks out the most likely rotor start positions, since it
+  does not depend on the plugboard.
+- Bigram or trigram log-probabilities, loaded once into a flat array, then guide a hill
+  climb over plugboard pairs with the rotor order, reflector and positions fixed.
+
+Scoring runs millions of times during a climb, so trial decryptions are written into a
+preallocated buffer, the plugboard is a plain 26 entry list whose moves change and revert
+only the few entries involved, and nothing is allocated per trial. PlugLeads are only
+built for the final result. Restarts from random plugboards run in parallel worker
+processes.
+
+Decrypting means running the ciphertext through the machine with the same settings,
+so the "plaintext" scored here is the machine's output for the ciphertext.
+"""
+
+import math
+import os
+import random
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from EnigmaMachine.core.cribSearch import letter_indices
+from EnigmaMachine.core.enigmaMachine import ALPHABET, EnigmaMachine
+from EnigmaMachine.core.enigmaPlugs import PlugLead, Plugboard
+from EnigmaMachine.core.enigmaRotors import rotor_notches_dict
+from EnigmaMachine.core.periodTable import STATE_COUNT, build_period_table, state_positions
+
+MAX_PLUG_LEADS = 10  # The number of plug leads issued with the machine
+
+# The outcome of a hill climb: its score, the plug leads found and the resulting plaintext
+HillClimbResult = namedtuple("HillClimbResult", ["score", "leads", "plaintext"])
+
+
+class NgramTable:
+    """Log-probabilities of every n letter sequence, stored in one flat array."""
+
+    def __init__(self, n, log_probabilities):
+        """
+        Args:
+            n (int): The length of each sequence, e.g. 2 for bigrams or 3 for trigrams.
+            log_probabilities (array): 26 ** n log10 probabilities. The entry for a sequence is
+                found by reading its letters as the digits of a base 26 number.
+        """
+        self.n = n
+        self.size = 26 ** n
+        self.log_probabilities = log_probabilities
+
+    def score(self, letters, length):
+        """Adds up the log-probability of every n letter sequence in a buffer.
+
+        Args:
+            letters (array): Letter indices.
+            length (int): The number of letters in the buffer to score.
+
+        Returns:
+            float: The total log-probability. Higher means more like the training text.
+        """
+        table = self.log_probabilities
+        size = self.size
+        first_scored = self.n - 1
+        total = 0.0
+        index = 0
+        for position in range(length):
+            index = (index * 26 + letters[position]) % size
+            if position >= first_scored:
+                total += table[index]
+        return total
+
+
+def _table_from_counts(n, counts):
+    """Turns n-gram counts into an NgramTable. Unseen sequences get a floor below the rarest seen one."""
+    total = sum(counts.values())
+    if total == 0:
+        raise ValueError("No n-grams were found to build the table from.")
+    floor = math.log10(0.01 / total)
+    log_probabilities = array('d', [floor]) * (26 ** n)
+    for index, count in counts.items():
+        log_probabilities[index] = math.log10(count / total)
+    return NgramTable(n, log_probabilities)
+
+
+def _ngram_index(ngram):
+    index = 0
+    for letter in ngram:
+        index = index * 26 + ALPHABET.index(letter)
+    return index
+
+
+def build_ngram_table(text, n):
+    """Builds an n-gram table by counting the sequences in a sample of text.
+
+    Args:
+        text (str): The training text. Anything outside A-Z (after uppercasing) is skipped.
+        n (int): The n-gram length.
+
+    Returns:
+        NgramTable: The table for the text.
+    """
+    letters = letter_indices(text.upper())
+    counts = {}
+    for start in range(len(letters) - n + 1):
+        index = 0
+        for letter in letters[start:start + n]:
+            index = index * 26 + letter
+        counts[index] = counts.get(index, 0) + 1
+    return _table_from_counts(n, counts)
+
+
+def load_ngram_table(path):
+    """Loads an n-gram table from a file of "NGRAM COUNT" lines, e.g. "TION 13168375".
+
+    Args:
+        path (str): The path of the n-gram file.
+
+    Returns:
+        NgramTable: The table, with n taken from the length of the n-grams in the file.
+
+    Raises:
+        ValueError: If a line is not an n-gram and a count, the n-grams are not all the same length or
+            contain anything other than A-Z, or the file has no n-grams. The line at fault is named.
+    """
+    n = None
+    counts = {}
+    with open(path) as file:
+        for number, line in enumerate(file, start=1):
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) != 2:
+                raise ValueError(f"{path}, line {number}: expected an n-gram and a count, got {line.strip()!r}.")
+            ngram = fields[0].upper()
+            if n is None:
+                n = len(ngram)
+            if len(ngram) != n or any(letter not in ALPHABET for letter in ngram):
+                raise ValueError(f"{path}, line {number}: unexpected n-gram {fields[0]!r}, expected {n} letters.")
+            try:
+                count = int(fields[1])
+            except ValueError:
+                raise ValueError(f"{path}, line {number}: the count {fields[1]!r} is not a whole number.") from None
+            if count < 0:
+                raise ValueError(f"{path}, line {number}: the count {count} is negative.")
+            index = _ngram_index(ngram)
+            counts[index] = counts.get(index, 0) + count
+    if n is None:
+        raise ValueError(f"{path} has no n-grams.")
+    return _table_from_counts(n, counts)
+
+
+def index_of_coincidence(counts, length):
+    """Works out the index of coincidence from letter counts.
+
+    Args:
+        counts (list): How often each of the 26 letters occurs.
+        length (int): The total number of letters.
+
+    Returns:
+        float: The chance that two letters picked at random are the same (about 0.066 for English,
+        0.038 for random text).
+    """
+    if length < 2:
+        return 0.0
+    return sum(count * (count - 1) for count in counts) / (length * (length - 1))
+
+
+def best_start_positions(ciphertext, selected_rotors, selected_reflector, keep=10):
+    """Ranks every rotor start position by the index of coincidence of its decryption.
+
+    The plugboard is left out, as it only swaps letters and so barely changes the index.
+
+    Args:
+        ciphertext (str): The intercepted message.
+        selected_rotors (list): The rotor order, as (name, wiring) tuples.
+        selected_reflector (tuple): The reflector's name and wiring.
+        keep (int): The number of positions to return.
+
+    Returns:
+        list: (index of coincidence, rotor positions) tuples, best first.
+    """
+    ciphertext = letter_indices(ciphertext)
+    machine = EnigmaMachine(Plugboard(), selected_rotors, selected_reflector, [0, 0, 0], rotor_notches_dict)
+    table = build_period_table(machine)
+    permutations = table.permutations
+    successors = table.successors
+
+    counts = [0] * 26
+    ranking = []
+    for start in range(STATE_COUNT):
+        for letter in range(26):
+            counts[letter] = 0
+        state = start
+        for letter in ciphertext:
+            state = successors[state]
+            counts[permutations[state * 26 + letter]] += 1
+        ranking.append((index_of_coincidence(counts, len(ciphertext)), start))
+    ranking.sort(reverse=True)
+    return [(score, state_positions(start)) for score, start in ranking[:keep]]
+
+
+def _decrypt_into(buffer, ciphertext, rotor_rows, plug):
+    """Decrypts the ciphertext into a preallocated buffer with the given plugboard table."""
+    row = 0
+    for position, letter in enumerate(ciphertext):
+        buffer[position] = plug[rotor_rows[row + plug[letter]]]
+        row += 26
+
+
+def _connect(plug, first, second):
+    """Connects two letters, first unplugging whatever either was connected to."""
+    plug[plug[first]] = plug[first]
+    plug[plug[second]] = plug[second]
+    plug[first] = second
+    plug[second] = first
+
+
+def _climb(ciphertext, rotor_rows, ngram_table, seed, max_leads):
+    """Runs one hill climb. Runs in a worker process when climbing in parallel.
+
+    A seed of None starts from an empty plugboard, any other seed from a random one.
+    """
+    plug = list(range(26))
+    if seed is not None:
+        generator = random.Random(seed)
+        letters = generator.sample(range(26), 2 * generator.randint(0, max_leads))
+        for first, second in zip(letters[::2], letters[1::2]):
+            _connect(plug, first, second)
+    lead_count = sum(1 for letter in range(26) if plug[letter] > letter)
+
+    length = len(ciphertext)
+    buffer = array('B', bytes(length))
+    _decrypt_into(buffer, ciphertext, rotor_rows, plug)
+    best_score = ngram_table.score(buffer, length)
+
+    improved = True
+    while improved:
+        improved = False
+        for first in range(26):
+            for second in range(first + 1, 26):
+                # A move only changes the two letters and their partners, so those are all a revert restores
+                first_partner, second_partner = plug[first], plug[second]
+                if first_partner == second:
+                    new_lead_count = lead_count - 1  # Try removing the lead
+                    plug[first], plug[second] = first, second
+                else:
+                    new_lead_count = lead_count + 1 - (first_partner != first) - (second_partner != second)
+                    if new_lead_count > max_leads:
+                        continue
+                    _connect(plug, first, second)
+
+                _decrypt_into(buffer, ciphertext, rotor_rows, plug)
+                score = ngram_table.score(buffer, length)
+                if score > best_score:
+                    best_score = score
+                    lead_count = new_lead_count
+                    improved = True
+                else:
+                    # Revert the move
+                    plug[first], plug[second] = first_partner, second_partner
+                    plug[first_partner], plug[second_partner] = first, second
+
+    leads = [ALPHABET[letter] + ALPHABET[plug[letter]] for letter in range(26) if plug[letter] > letter]
+    return best_score, leads
+
+
+def hill_climb_plugboard(ciphertext, selected_rotors, selected_reflector, rotor_positions, ngram_table,
+                         restarts=8, workers=None, max_leads=MAX_PLUG_LEADS, seed=0):
+    """Searches for the plugboard of a message whose rotor order, reflector and positions are fixed.
+
+    Args:
+        ciphertext (str): The intercepted message.
+        selected_rotors (list): The rotor order, as (name, wiring) tuples.
+        selected_reflector (tuple): The reflector's name and wiring.
+        rotor_positions (list): The rotor start positions, e.g. from best_start_positions.
+        ngram_table (NgramTable): The table used to score trial decryptions.
+        restarts (int): The number of climbs. The first starts from an empty plugboard,
+            the rest from random ones.
+        workers (int): The number of worker processes. Defaults to one per CPU core; 1 climbs in-process.
+        max_leads (int): The largest number of plug leads to consider.
+        seed (int): Seeds the random starting plugboards, so results can be repeated.
+
+    Returns:
+        HillClimbResult: The best scoring plugboard over all restarts.
+
+    Raises:
+        ValueError: If restarts is less than 1.
+    """
+    if restarts < 1:
+        raise ValueError(f"At least one climb is needed, got restarts={restarts}.")
+    letters = letter_indices(ciphertext)
+    machine = EnigmaMachine(Plugboard(), selected_rotors, selected_reflector, rotor_positions, rotor_notches_dict)
+
+    # The rotor and reflector substitution for each letter; the plugboard is applied around it
+    rotor_rows = bytearray()
+    for positions in machine.letter_positions(len(letters)):
+        rotor_rows.extend(machine.encode_index_at(letter, positions) for letter in range(26))
+    rotor_rows = bytes(rotor_rows)
+
+    seeds = [None] + [seed * restarts + restart for restart in range(1, restarts)]
+    arguments = [[letters] * restarts, [rotor_rows] * restarts, [ngram_table] * restarts, seeds,
+                 [max_leads] * restarts]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or restarts == 1:
+        results = list(map(_climb, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, restarts)) as executor:
+            results = list(executor.map(_climb, *arguments))
+
+    score, leads = max(results, key=lambda result: result[0])
+    plugboard = Plugboard()
+    for lead in leads:
+        plugboard.add_lead(PlugLead(lead))
+    machine = EnigmaMachine(plugboard, selected_rotors, selected_reflector, rotor_positions, rotor_notches_dict)
+    return HillClimbResult(score, leads, machine.encode(ciphertext))
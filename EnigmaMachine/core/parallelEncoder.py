@@ -0,0 +1,101 @@
+"""
+parallelEncoder.py
+--------------------
+This module encodes large messages on several CPU cores at once. Rotor stepping does not
+depend on the letters being encoded, so the rotor positions at any point of the message
+can be worked out directly with EnigmaMachine.seek. The message is split into segments,
+each worker process seeks to the first letter of its segment and encodes it, and the
+encoded segments are joined back together in order. Workers are sent a machineState
+snapshot of a few dozen bytes rather than the pickled machine and its tables.
+
+Characters outside A-Z do not advance the rotors, so each segment's starting point is
+the number of letters (not characters) that come before it.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from EnigmaMachine.core.enigmaMachine import ALPHABET
+from EnigmaMachine.core.machineState import restore, snapshot
+
+MIN_SEGMENT_LENGTH = 1 << 16  # Smaller segments cost more to send to a worker than to encode
+
+# Deletes every letter, so the letters in a string can be counted in C with str.translate
+_DELETE_LETTERS = str.maketrans('', '', ALPHABET)
+
+
+def count_letters(text):
+    """Counts the characters in text that advance the rotors.
+
+    Args:
+        text (str): The text to check.
+
+    Returns:
+        int: The number of uppercase A-Z letters.
+    """
+    return len(text) - len(text.translate(_DELETE_LETTERS))
+
+
+def _encode_segment(machine, segment, letters_before):
+    """Runs in a worker process: seeks to the start of a segment and encodes it.
+
+    machine is either a snapshot from machineState.snapshot or, for machines with
+    non-standard wirings, the machine itself.
+    """
+    if isinstance(machine, bytes):
+        machine = restore(machine)
+    machine.seek(letters_before)
+    return machine.encode(segment)
+
+
+def split_message(message, segments, min_segment_length=MIN_SEGMENT_LENGTH):
+    """Splits a message into roughly equal segments.
+
+    Args:
+        message (str): The message to split.
+        segments (int): The number of segments wanted.
+        min_segment_length (int): The shortest segment worth making.
+
+    Returns:
+        list: The segments, in order.
+    """
+    segment_length = max(min_segment_length, 1, -(-len(message) // max(segments, 1)))
+    return [message[start:start + segment_length] for start in range(0, len(message), segment_length)] or [""]
+
+
+def encode_parallel(machine, message, workers=None, min_segment_length=MIN_SEGMENT_LENGTH):
+    """Encodes a message across several worker processes, advancing the machine's rotors.
+
+    Args:
+        machine (EnigmaMachine): The compiled machine to encode with. Workers always run silently.
+        message (str): The message to be encoded.
+        workers (int): The number of worker processes. Defaults to one per CPU core.
+        min_segment_length (int): The shortest segment worth sending to a worker.
+
+    Returns:
+        str: The encoded message, identical to machine.encode(message).
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    segments = split_message(message, workers, min_segment_length)
+    if len(segments) == 1:
+        return machine.encode(message)  # Not worth starting any processes
+
+    # Every worker starts from the machine's current positions and seeks forward
+    try:
+        worker_machine = snapshot(machine)
+    except ValueError:
+        worker_machine = machine.silent_copy()
+    letters_before = []
+    letters = 0
+    for segment in segments:
+        letters_before.append(letters)
+        letters += count_letters(segment)
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(segments))) as executor:
+        encoded_segments = list(executor.map(_encode_segment, [worker_machine] * len(segments), segments,
+                                             letters_before))
+
+    machine.seek(letters)
+    return ''.join(encoded_segments)
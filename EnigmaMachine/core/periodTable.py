@@ -0,0 +1,258 @@
+"""
+periodTable.py
+--------------------
+This module contains the "period table" mode of the Enigma machine. For a fixed set of
+rotors, reflector and plugboard the whole machine at one rotor state is a single
+substitution of the 26 letters. With three rotors there are only 26 ** 3 = 17,576 rotor
+states, so every substitution (and the state that follows each one) can be worked out
+once and stored in a compact table. Encoding is then one table lookup per letter.
+An M4's fourth rotor never moves, so it has the same number of states; its position is
+part of the configuration the table is built for.
+
+Tables are kept in a PeriodTableCache, keyed by the full machine configuration and
+evicted least recently used first, so a long-running service stays within a fixed
+amount of memory however many daily keys it sees. The successor table only depends on
+the stepping rotors' notches, so it is cached separately and shared between
+configurations (see successor_table).
+"""
+
+from array import array
+from collections import OrderedDict
+
+from EnigmaMachine.core.encodingMessage import STEPPING_ROTORS
+from EnigmaMachine.core.enigmaMachine import ALPHABET, LETTER_INDEX
+
+STATE_COUNT = 26 ** 3  # Number of rotor states for a three rotor machine
+PERIOD_TABLE_CACHE_SIZE = 8  # Default number of tables kept in memory (about 500 KB each)
+SUCCESSOR_CACHE_SIZE = 32  # Successor tables kept in memory (about 35 KB each)
+
+_successor_tables = OrderedDict()  # Stepping rotors' notches -> successor table
+
+
+def check_stepping_rotors(machine):
+    """Checks that a machine has the three stepping rotors rotor states are made of.
+
+    Raises:
+        ValueError: If the machine has fewer than STEPPING_ROTORS rotors.
+    """
+    if machine.stepping_rotors != STEPPING_ROTORS:
+        raise ValueError(f"Rotor states need {STEPPING_ROTORS} stepping rotors, the machine has "
+                         f"{machine.stepping_rotors}.")
+
+
+def state_index(rotor_positions):
+    """Converts three rotor positions into a single state number.
+
+    Args:
+        rotor_positions (list): The positions of the three rotors.
+
+    Returns:
+        int: A number between 0 and STATE_COUNT - 1.
+    """
+    return rotor_positions[0] + 26 * rotor_positions[1] + 676 * rotor_positions[2]
+
+
+def state_positions(state):
+    """Converts a state number back into a list of three rotor positions.
+
+    Args:
+        state (int): A state number returned by state_index.
+
+    Returns:
+        list: The rotor positions for that state.
+    """
+    return [state % 26, (state // 26) % 26, state // 676]
+
+
+class PeriodTable:
+    """The substitution and next state for every rotor state of one machine configuration."""
+
+    def __init__(self, permutations, successors):
+        """
+        Args:
+            permutations (bytes): STATE_COUNT rows of 26 letter indices. Row s holds the
+                output index for every input index when the rotors are in state s.
+            successors (array): The state that follows each state after one keypress.
+        """
+        self.permutations = permutations
+        self.successors = successors
+
+    def encode(self, message, state):
+        """Encodes a message starting from the given rotor state.
+
+        Characters outside A-Z are kept as-is and do not advance the rotors.
+
+        Args:
+            message (str): The message to be encoded.
+            state (int): The starting state number.
+
+        Returns:
+            tuple: The encoded message and the state number after the last letter, i.e. the
+            state the last letter was encoded at.
+        """
+        permutations = self.permutations
+        successors = self.successors
+        encoded_message = []
+        for letter in message:
+            index = LETTER_INDEX.get(letter)
+            if index is None:
+                encoded_message.append(letter)  # Keep spaces or non-alphabetic characters as-is
+                continue
+            state = successors[state]  # The rotors step before the letter is encoded
+            encoded_message.append(ALPHABET[permutations[state * 26 + index]])
+        return ''.join(encoded_message), state
+
+
+def build_period_table(machine):
+    """Works out the substitution and next state for every rotor state of a machine.
+
+    Args:
+        machine (EnigmaMachine): The compiled machine. Only the positions of rotors that never
+            move (an M4's fourth rotor) are used; nothing is changed.
+
+    Returns:
+        PeriodTable: The table for the machine's configuration.
+
+    Raises:
+        ValueError: If the machine has fewer than STEPPING_ROTORS rotors.
+    """
+    check_stepping_rotors(machine)
+    permutations = bytearray(STATE_COUNT * 26)
+    plugboard = machine.plugboard_table
+    forward, backward = machine.forward_tables[0], machine.backward_tables[0]
+    # The way in (plugboard, rightmost rotor) and out (rightmost rotor, plugboard) at each of the
+    # rightmost rotor's positions, so a row is two bytes.translate calls. Those take 256 byte tables.
+    padding = bytes(256 - 26)
+    inward = [bytes(forward[position][plugboard[index]] for index in range(26)) for position in range(26)]
+    outward = [bytes(plugboard[backward[position][index]] for index in range(26)) + padding for position in range(26)]
+    for upper_state in range(0, STATE_COUNT, 26):
+        # The other rotors stay put while the rightmost one goes through its 26 positions
+        inner = bytes(machine.inner_table(state_positions(upper_state) + machine.rotor_positions[STEPPING_ROTORS:]))
+        inner += padding
+        for position in range(26):
+            row = (upper_state + position) * 26
+            permutations[row:row + 26] = inward[position].translate(inner).translate(outward[position])
+    return PeriodTable(bytes(permutations), successor_table(machine))
+
+
+def build_successor_table(machine):
+    """Works out the state that follows every rotor state after one keypress.
+
+    Stepping only depends on which rotors are fitted, so machines with the same rotors
+    share the same successor table whatever their reflector or plugboard.
+
+    Args:
+        machine (EnigmaMachine): The compiled machine.
+
+    Returns:
+        array: Entry s is the state number that follows state s.
+
+    Raises:
+        ValueError: If the machine has fewer than STEPPING_ROTORS rotors.
+    """
+    check_stepping_rotors(machine)
+    successors = array('H', bytes(2 * STATE_COUNT))
+    # The leftmost rotor's own position never decides which rotors move, so each position of
+    # the two rotors to its right is stepped once and the result holds for all 26 of its positions
+    for lower_state in range(676):
+        stepped = machine.next_positions(state_positions(lower_state))
+        lower, carry = stepped[0] + 26 * stepped[1], stepped[2]
+        for left in range(26):
+            successors[lower_state + 676 * left] = lower + 676 * ((left + carry) % 26)
+    return successors
+
+
+def successor_table(machine):
+    """Returns the successor table for a machine's rotors, building it on first use.
+
+    The table is shared by every machine whose stepping rotors have the same notches, so
+    it must not be changed.
+
+    Args:
+        machine (EnigmaMachine): The compiled machine.
+
+    Returns:
+        array: Entry s is the state number that follows state s.
+
+    Raises:
+        ValueError: If the machine has fewer than STEPPING_ROTORS rotors.
+    """
+    check_stepping_rotors(machine)
+    key = tuple(machine.rotor_notches[:machine.stepping_rotors])
+    successors = _successor_tables.get(key)
+    if successors is not None:
+        _successor_tables.move_to_end(key)
+        return successors
+
+    successors = build_successor_table(machine)
+    _successor_tables[key] = successors
+    if len(_successor_tables) > SUCCESSOR_CACHE_SIZE:
+        _successor_tables.popitem(last=False)
+    return successors
+
+
+class PeriodTableCache:
+    """A least recently used cache of period tables keyed by machine configuration."""
+
+    def __init__(self, maxsize=PERIOD_TABLE_CACHE_SIZE):
+        """
+        Args:
+            maxsize (int): The largest number of tables to keep before evicting the oldest.
+        """
+        if maxsize < 1:
+            raise ValueError("The cache must be able to hold at least one table.")
+        self.maxsize = maxsize
+        self._tables = OrderedDict()
+
+    def __len__(self):
+        return len(self._tables)
+
+    def get(self, machine):
+        """Returns the period table for a machine, building it if it is not cached.
+
+        Args:
+            machine (EnigmaMachine): The compiled machine.
+
+        Returns:
+            PeriodTable: The table for the machine's configuration.
+        """
+        key = machine.configuration_key()
+        table = self._tables.get(key)
+        if table is not None:
+            self._tables.move_to_end(key)
+            return table
+
+        table = build_period_table(machine)
+        self._tables[key] = table
+        if len(self._tables) > self.maxsize:
+            self._tables.popitem(last=False)  # Evict the least recently used table
+        return table
+
+    def clear(self):
+        """Removes every cached table."""
+        self._tables.clear()
+
+
+# Shared by every caller that does not bring its own cache
+period_table_cache = PeriodTableCache()
+
+
+def encode_with_period_table(machine, message, cache=None):
+    """Encodes a message with the machine's period table, advancing the machine's rotors.
+
+    The output is identical to machine.encode(message).
+
+    Args:
+        machine (EnigmaMachine): The compiled machine to encode with.
+        message (str): The message to be encoded.
+        cache (PeriodTableCache): The cache to look the table up in. Defaults to period_table_cache.
+
+    Returns:
+        str: The encoded message.
+    """
+    if cache is None:
+        cache = period_table_cache
+    table = cache.get(machine)
+    encoded_message, state = table.encode(message, state_index(machine.rotor_positions))
+    machine.rotor_positions = state_positions(state) + machine.rotor_positions[STEPPING_ROTORS:]
+    return encoded_message
@@ -0,0 +1,298 @@
+"""
+rotorRegistry.py
+--------------------
+This module is the catalog of rotor and reflector definitions shared by every engine.
+Each definition is an immutable record holding the wiring as a string and compiled into
+integer tables: the forward and inverse substitutions, and both of them at each of the 26
+rotor offsets (position minus ring setting). The standard rotors and reflectors from
+enigmaRotors.py are compiled once, when the module is imported, so building a machine
+only picks tables out of the catalog instead of computing them again.
+
+Custom rotors and reflectors can be added from code or loaded from a JSON file:
+
+    {"rotors": [{"name": "X", "wiring": "QWERTZUIOASDFGHJKPYXCVBNML", "notch": "K"}],
+     "reflectors": [{"name": "D", "wiring": "...", "thin": false}]}
+
+Every wiring is checked to be a permutation of the alphabet, and every reflector wiring
+to swap letters in pairs with none left in place. Registered parts are added to the
+dictionaries in enigmaRotors.py as well, so the setup prompts, from_settings and key
+sheets all accept them. A rotor has at most one notch, as advance_rotors steps on one.
+"""
+
+import json
+from collections import namedtuple
+from types import MappingProxyType
+
+from EnigmaMachine.core.enigmaRotors import (reflector_wirings_dict, rotor_notches_dict, rotor_wirings_dict,
+                                             thin_reflector_wirings_dict)
+
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# Maps each uppercase letter to its position in the alphabet
+LETTER_INDEX = {letter: index for index, letter in enumerate(ALPHABET)}
+
+
+def compile_wiring(mapping):
+    """Converts a wiring string into a tuple of alphabet indices.
+
+    Args:
+        mapping (str): A 26 letter wiring string, e.g. "EKMFLGDQVZNTOWYHXUSPAIBRCJ".
+
+    Returns:
+        tuple: The wiring as integers, where entry i is the output for input letter i.
+    """
+    return tuple(LETTER_INDEX[letter] for letter in mapping)
+
+
+def invert_wiring(table):
+    """Builds the inverse of a compiled wiring table.
+
+    Args:
+        table (tuple): A compiled wiring table.
+
+    Returns:
+        tuple: The table that undoes the given wiring.
+    """
+    inverse = [0] * len(table)
+    for index, value in enumerate(table):
+        inverse[value] = index
+    return tuple(inverse)
+
+
+def position_tables(table, ring_setting=0):
+    """Builds a rotor's wiring table for each of the 26 positions it can be turned to.
+
+    Args:
+        table (tuple): A compiled wiring table.
+        ring_setting (int): The rotor's ring setting, which turns the wiring against the positions.
+
+    Returns:
+        tuple: Entry p is the table for the rotor at position p, so the signal entering at
+        letter i leaves at entry p's letter i.
+    """
+    tables = []
+    for position in range(26):
+        offset = (position - ring_setting) % 26
+        tables.append(tuple((table[(index + offset) % 26] - offset) % 26 for index in range(26)))
+    return tuple(tables)
+
+
+def ring_tables(offset_tables, ring_setting):
+    """Turns a rotor's tables by offset into its tables by position for a ring setting.
+
+    A rotor at position p with ring setting r is at offset p - r, so this only reorders the
+    shared tables; nothing is computed.
+
+    Args:
+        offset_tables (tuple): The rotor's 26 tables by offset, i.e. position_tables(table).
+        ring_setting (int): The rotor's ring setting.
+
+    Returns:
+        tuple: The same as position_tables(table, ring_setting).
+    """
+    if ring_setting == 0:
+        return offset_tables
+    return tuple(offset_tables[(position - ring_setting) % 26] for position in range(26))
+
+
+class RotorDefinition(namedtuple("RotorDefinition", ["name", "wiring", "notch", "stepping", "table", "inverse",
+                                                     "forward", "backward"])):
+    """A compiled rotor.
+
+    notch is the turnover position (0 = A) or None, and stepping is True for a rotor whose
+    notch turns the rotor to its left; rotors without one (Beta, Gamma) may also sit beyond
+    the stepping rotors of an M4. forward and backward are table and inverse at each offset.
+    """
+
+    __slots__ = ()
+
+
+class ReflectorDefinition(namedtuple("ReflectorDefinition", ["name", "wiring", "thin", "table"])):
+    """A compiled reflector. A thin reflector only fits an M4, next to its fourth rotor."""
+
+    __slots__ = ()
+
+
+_rotors = {}
+_reflectors = {}
+_compiled_wirings = {}  # Wiring string -> (table, inverse, forward, backward)
+
+# Read-only views of the catalog; parts are added with register_rotor and register_reflector
+ROTORS = MappingProxyType(_rotors)
+REFLECTORS = MappingProxyType(_reflectors)
+
+
+def check_wiring(wiring, reflector=False):
+    """Checks that a wiring connects the 26 letters one to one.
+
+    Args:
+        wiring (str): The wiring, e.g. "EKMFLGDQVZNTOWYHXUSPAIBRCJ".
+        reflector (bool): Also check that letters are swapped in pairs, none left in place.
+
+    Returns:
+        str: The wiring in uppercase.
+
+    Raises:
+        ValueError: If the wiring is not a permutation of the alphabet, or not a valid reflector.
+    """
+    wiring = str(wiring).strip().upper()
+    if len(wiring) != 26 or set(wiring) != set(ALPHABET):
+        raise ValueError(f"The wiring {wiring!r} does not use each of the 26 letters exactly once.")
+    if reflector:
+        for index, letter in enumerate(wiring):
+            if letter == ALPHABET[index]:
+                raise ValueError(f"A reflector cannot connect {letter} to itself.")
+            if wiring[LETTER_INDEX[letter]] != ALPHABET[index]:
+                raise ValueError(f"The reflector wiring sends {ALPHABET[index]} to {letter} but not {letter} "
+                                 f"back to {ALPHABET[index]}.")
+    return wiring
+
+
+def compiled_wiring(wiring):
+    """Returns the compiled tables of a rotor wiring, compiling them on first use.
+
+    Machines built with wirings outside the catalog still share their tables this way.
+
+    Returns:
+        tuple: (table, inverse, forward, backward), where forward and backward are at each offset.
+    """
+    compiled = _compiled_wirings.get(wiring)
+    if compiled is None:
+        table = compile_wiring(wiring)
+        inverse = invert_wiring(table)
+        compiled = (table, inverse, position_tables(table), position_tables(inverse))
+        _compiled_wirings[wiring] = compiled
+    return compiled
+
+
+def _notch_index(notch):
+    """Turns a notch given as a letter, a number 0-25, or None into a position or None."""
+    if notch is None or notch == "":
+        return None
+    if isinstance(notch, int) and 0 <= notch <= 25:
+        return notch
+    if isinstance(notch, str) and notch.strip().upper() in LETTER_INDEX:
+        return LETTER_INDEX[notch.strip().upper()]
+    raise ValueError(f"{notch!r} is not a notch position. Give one letter or a number between 0 and 25.")
+
+
+def define_rotor(name, wiring, notch=None):
+    """Checks and compiles a rotor, without adding it to the catalog.
+
+    Args:
+        name (str): The rotor's name.
+        wiring (str): The 26 letter wiring.
+        notch (str or int): The turnover position as a letter or 0-25, or None for no notch.
+
+    Returns:
+        RotorDefinition: The compiled rotor.
+
+    Raises:
+        ValueError: If the wiring or the notch is invalid.
+    """
+    wiring = check_wiring(wiring)
+    notch = _notch_index(notch)
+    table, inverse, forward, backward = compiled_wiring(wiring)
+    return RotorDefinition(name, wiring, notch, notch is not None, table, inverse, forward, backward)
+
+
+def define_reflector(name, wiring, thin=False):
+    """Checks and compiles a reflector, without adding it to the catalog.
+
+    Raises:
+        ValueError: If the wiring does not swap the letters in pairs.
+    """
+    wiring = check_wiring(wiring, reflector=True)
+    return ReflectorDefinition(name, wiring, bool(thin), compile_wiring(wiring))
+
+
+def register_rotor(definition):
+    """Adds a rotor to the catalog and to rotor_wirings_dict and rotor_notches_dict.
+
+    Registering the same rotor again does nothing.
+
+    Raises:
+        ValueError: If a different rotor is already registered under the name.
+    """
+    existing = _rotors.get(definition.name)
+    if existing is not None and existing[:3] != definition[:3]:
+        raise ValueError(f"A different rotor {definition.name!r} is already registered.")
+    _rotors[definition.name] = definition
+    rotor_wirings_dict[definition.name] = definition.wiring
+    rotor_notches_dict[definition.name] = definition.notch
+
+
+def register_reflector(definition):
+    """Adds a reflector to the catalog and to reflector_wirings_dict or thin_reflector_wirings_dict.
+
+    Registering the same reflector again does nothing.
+
+    Raises:
+        ValueError: If a different reflector is already registered under the name.
+    """
+    existing = _reflectors.get(definition.name)
+    if existing is not None and existing[:3] != definition[:3]:
+        raise ValueError(f"A different reflector {definition.name!r} is already registered.")
+    _reflectors[definition.name] = definition
+    wirings = thin_reflector_wirings_dict if definition.thin else reflector_wirings_dict
+    wirings[definition.name] = definition.wiring
+
+
+def load_wirings(path):
+    """Registers the custom rotors and reflectors in a JSON file.
+
+    Every entry is checked before any is registered, so a file with a mistake adds nothing.
+
+    Args:
+        path (str): A JSON file with "rotors" and/or "reflectors" lists, see the module docstring.
+
+    Returns:
+        list: The RotorDefinition and ReflectorDefinition records registered.
+
+    Raises:
+        ValueError: If the file is malformed, a wiring is invalid or a name is taken by a different part.
+    """
+    with open(path) as file:
+        try:
+            catalog = json.load(file)
+        except json.JSONDecodeError as error:
+            raise ValueError(f"{path} is not valid JSON: {error}") from None
+    if not isinstance(catalog, dict):
+        raise ValueError(f"{path} should hold an object with \"rotors\" and \"reflectors\" lists.")
+
+    definitions = []
+    try:
+        for entry in catalog.get("rotors", []):
+            definitions.append(define_rotor(entry["name"], entry["wiring"], entry.get("notch")))
+        for entry in catalog.get("reflectors", []):
+            definitions.append(define_reflector(entry["name"], entry["wiring"], entry.get("thin", False)))
+    except (KeyError, TypeError):
+        raise ValueError(f"Every entry in {path} needs a name and a wiring.") from None
+
+    pending = {}
+    for definition in definitions:
+        registered = _rotors if isinstance(definition, RotorDefinition) else _reflectors
+        existing = pending.get((type(definition), definition.name), registered.get(definition.name))
+        if existing is not None and existing[:3] != definition[:3]:
+            raise ValueError(f"A different part named {definition.name!r} is already registered.")
+        pending[type(definition), definition.name] = definition
+    for definition in definitions:
+        if isinstance(definition, RotorDefinition):
+            register_rotor(definition)
+        else:
+            register_reflector(definition)
+    return definitions
+
+
+# Compile the standard parts once, at import
+for _name, _wiring in rotor_wirings_dict.items():
+    register_rotor(define_rotor(_name, _wiring, rotor_notches_dict[_name]))
+for _name, _wiring in reflector_wirings_dict.items():
+    register_reflector(define_reflector(_name, _wiring))
+for _name, _wiring in thin_reflector_wirings_dict.items():
+    register_reflector(define_reflector(_name, _wiring, thin=True))
+del _name, _wiring
+
+# The parts that exist in every process, whatever has been registered since
+STANDARD_ROTORS = tuple(_rotors)
+STANDARD_REFLECTORS = tuple(_reflectors)
@@ -0,0 +1,154 @@
+"""
+streamEncoder.py
+--------------------
+This module encodes input that does not fit in a single string, such as large files or
+data arriving from a socket. The input is handled chunk by chunk and the rotor positions
+carry over from one chunk to the next, so the output is the same as encoding everything
+in one go while only one chunk is held in memory at a time.
+
+Any encoder with an encode(str) -> str method that keeps its rotor positions between calls
+can be used, e.g. an EnigmaMachine or a VectorEncoder.
+
+A StreamEncoder can also checkpoint the machine every N characters. Each checkpoint is a
+snapshot from machineState.py; restoring it and skipping the first N characters of the
+input resumes the stream exactly where the checkpoint was taken.
+"""
+
+from EnigmaMachine.core.machineState import snapshot
+
+DEFAULT_BUFFER_SIZE = 1 << 16  # Characters read and encoded at a time
+
+
+class StreamEncoder:
+    """Encodes a stream of text chunk by chunk, keeping the rotor positions between chunks."""
+
+    def __init__(self, encoder, output=None, checkpoint_every=None, on_checkpoint=None):
+        """
+        Args:
+            encoder (EnigmaMachine): The encoder used for every chunk.
+            output (file): Optional text stream that write() sends encoded chunks to.
+            checkpoint_every (int): Optional, take a checkpoint every this many characters.
+            on_checkpoint (callable): Called with (characters encoded so far, snapshot bytes)
+                at every checkpoint.
+        """
+        if checkpoint_every is not None and (checkpoint_every < 1 or on_checkpoint is None):
+            raise ValueError("Checkpoints need a positive interval and an on_checkpoint callback.")
+        self.encoder = encoder
+        self.output = output
+        self.checkpoint_every = checkpoint_every
+        self.on_checkpoint = on_checkpoint
+        self.characters_encoded = 0
+
+    def checkpoint(self):
+        """Takes a snapshot of the encoder's machine at the current point of the stream.
+
+        Returns:
+            bytes: The machine state, as packed by machineState.snapshot.
+        """
+        return snapshot(getattr(self.encoder, "machine", self.encoder))
+
+    def encode(self, chunk):
+        """Encodes the next chunk of the stream.
+
+        Args:
+            chunk (str): The next part of the message.
+
+        Returns:
+            str: The encoded chunk.
+        """
+        if self.checkpoint_every is None:
+            self.characters_encoded += len(chunk)
+            return self.encoder.encode(chunk)
+
+        # Split the chunk where checkpoints fall, so they land on exact multiples of the interval
+        encoded = []
+        while chunk:
+            room = self.checkpoint_every - self.characters_encoded % self.checkpoint_every
+            piece, chunk = chunk[:room], chunk[room:]
+            encoded.append(self.encoder.encode(piece))
+            self.characters_encoded += len(piece)
+            if len(piece) == room:
+                self.on_checkpoint(self.characters_encoded, self.checkpoint())
+        return ''.join(encoded)
+
+    def write(self, chunk):
+        """Encodes the next chunk of the stream and writes it to the output stream.
+
+        Args:
+            chunk (str): The next part of the message.
+
+        Returns:
+            int: The number of characters written.
+
+        Raises:
+            ValueError: If the StreamEncoder was created without an output stream.
+        """
+        if self.output is None:
+            raise ValueError("This StreamEncoder has no output stream to write to.")
+        return self.output.write(self.encode(chunk))
+
+    def iter_encode(self, chunks):
+        """Encodes chunks as they arrive.
+
+        Args:
+            chunks (iterable): The parts of the message, in order.
+
+        Yields:
+            str: Each chunk once it has been encoded.
+        """
+        for chunk in chunks:
+            yield self.encode(chunk)
+
+
+def read_chunks(file, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Reads a file in fixed-size pieces.
+
+    Args:
+        file (file): An open text or binary file.
+        buffer_size (int): The size of each piece.
+
+    Yields:
+        str or bytes: Each piece until the end of the file.
+    """
+    while True:
+        chunk = file.read(buffer_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def encode_file(encoder, src, dst, buffer_size=DEFAULT_BUFFER_SIZE, stats=None):
+    """Encodes a file of any size in fixed-size buffers.
+
+    The file is read as raw bytes. Uppercase A-Z are encoded and every other byte is copied
+    unchanged, so non-ASCII text (UTF-8 or otherwise) passes through untouched.
+
+    Args:
+        encoder (EnigmaMachine): The encoder to use. Its rotor positions are advanced.
+        src (str): Path of the file to encode.
+        dst (str): Path the encoded file is written to.
+        buffer_size (int): The number of bytes encoded at a time.
+        stats (EncodingStats): Optional, records the time spent reading and writing under "io".
+            Give the encoder the same stats to see the encoding stages as well.
+
+    Returns:
+        int: The number of bytes encoded.
+    """
+    stream = StreamEncoder(encoder)
+    with open(src, 'rb') as source, open(dst, 'wb') as destination:
+        if stats is None:
+            for chunk in read_chunks(source, buffer_size):
+                # latin-1 maps every byte to one character and back, so no byte can be lost
+                destination.write(stream.encode(chunk.decode('latin-1')).encode('latin-1'))
+            return stream.characters_encoded
+
+        while True:
+            with stats.measure("io"):
+                chunk = source.read(buffer_size)
+            if not chunk:
+                break
+            encoded = stream.encode(chunk.decode('latin-1')).encode('latin-1')
+            with stats.measure("io"):
+                destination.write(encoded)
+    return stream.characters_encoded
+
@@ -0,0 +1,124 @@
+"""
+traceBuffer.py
+--------------------
+This module contains TraceBuffer, a structured alternative to the string tracers in
+encodingMessage.py. Instead of a (step, letter) call per encryption step, a machine
+given a TraceBuffer writes one compact record of integers per letter into a
+preallocated ring buffer:
+
+    input | rotor positions (n) | plugboard | wheels forward (n) | reflector | wheels back (n) | output
+
+Wheels forward are listed rightmost first and wheels back leftmost first, in the order the
+signal passes them. Nothing is turned into text while encoding; render() formats a record
+into the same lines a StepRecorder would have collected, only for the records that are shown, and the
+buffer can be exported as JSON or CSV for auditing. When the buffer is full the oldest
+records are overwritten, so memory stays fixed however long the message.
+"""
+
+import csv
+import json
+
+from EnigmaMachine.core.encodingMessage import LAMPBOARD_STEP
+
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+TRACE_CAPACITY = 4096  # Default number of letters kept
+
+
+class TraceBuffer:
+    """A fixed-size ring buffer of per-letter trace records."""
+
+    def __init__(self, rotor_count=3, capacity=TRACE_CAPACITY):
+        """
+        Args:
+            rotor_count (int): The number of rotors of the machines that write to the buffer.
+            capacity (int): The number of records kept before the oldest are overwritten.
+        """
+        if capacity < 1:
+            raise ValueError("The trace buffer must be able to hold at least one record.")
+        self.rotor_count = rotor_count
+        self.capacity = capacity
+        self.record_size = 3 * rotor_count + 4
+        self.buffer = bytearray(capacity * self.record_size)
+        self.recorded = 0  # Records written since the buffer was created or cleared
+
+    def __len__(self):
+        return min(self.recorded, self.capacity)
+
+    def append(self, record):
+        """Writes one record, overwriting the oldest if the buffer is full.
+
+        Args:
+            record (list): record_size integers 0-25, in the layout described above.
+        """
+        start = (self.recorded % self.capacity) * self.record_size
+        self.buffer[start:start + self.record_size] = bytes(record)
+        self.recorded += 1
+
+    def clear(self):
+        """Forgets all records. The memory is kept for reuse."""
+        self.recorded = 0
+
+    def __getitem__(self, index):
+        """Returns a record as a tuple of integers. 0 is the oldest record kept, -1 the newest."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("trace record index out of range")
+        slot = (self.recorded - len(self) + index) % self.capacity
+        return tuple(self.buffer[slot * self.record_size:(slot + 1) * self.record_size])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def fields(self, index):
+        """Splits a record into named fields.
+
+        Returns:
+            dict: input, positions, plugboard, forward, reflector, backward and output, as integers.
+        """
+        record = self[index]
+        n = self.rotor_count
+        return {
+            "input": record[0],
+            "positions": list(record[1:1 + n]),
+            "plugboard": record[1 + n],
+            "forward": list(record[2 + n:2 + 2 * n]),
+            "reflector": record[2 + 2 * n],
+            "backward": list(record[3 + 2 * n:3 + 3 * n]),
+            "output": record[3 + 3 * n],
+        }
+
+    def steps(self, index):
+        """Returns a record as (step, letter) tuples, the same ones a tracer would have been given."""
+        fields = self.fields(index)
+        n = self.rotor_count
+        steps = [
+            ("Keyboard Input", ALPHABET[fields["input"]]),
+            ("Rotors Position", ''.join(ALPHABET[position] for position in fields["positions"])),
+            ("Plugboard Encryption", ALPHABET[fields["plugboard"]]),
+        ]
+        steps += [(f"Wheel {n - rotor} Encryption", ALPHABET[letter]) for rotor, letter in enumerate(fields["forward"])]
+        steps.append(("Reflector Encryption", ALPHABET[fields["reflector"]]))
+        steps += [(f"Wheel {rotor + 1} Reverse Encryption", ALPHABET[letter])
+                  for rotor, letter in enumerate(fields["backward"])]
+        steps.append(("Plugboard Encryption", ALPHABET[fields["output"]]))
+        steps.append((LAMPBOARD_STEP, ALPHABET[fields["output"]]))
+        return steps
+
+    def render(self, index):
+        """Formats a record as the lines StepRecorder.lines() gives, one step per line."""
+        return "\n".join(f"{step}: {letter}" for step, letter in self.steps(index))
+
+    def to_json(self):
+        """Exports the records, oldest first, as a JSON list of objects."""
+        return json.dumps([self.fields(index) for index in range(len(self))])
+
+    def write_csv(self, file):
+        """Writes the records, oldest first, to an open text file as CSV with one column per value."""
+        n = self.rotor_count
+        writer = csv.writer(file)
+        writer.writerow(["input"] + [f"position_wheel_{n - rotor}" for rotor in range(n)] + ["plugboard"]
+                        + [f"forward_wheel_{n - rotor}" for rotor in range(n)] + ["reflector"]
+                        + [f"backward_wheel_{rotor + 1}" for rotor in range(n)] + ["output"])
+        writer.writerows(self)
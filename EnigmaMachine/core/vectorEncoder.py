@@ -0,0 +1,167 @@
+"""
+vectorEncoder.py
+--------------------
+This module contains a NumPy version of the Enigma machine for encoding long messages.
+Instead of looping over the message one letter at a time, the rotor positions for every
+letter are worked out up front from the machine's successor table, and the plugboard,
+rotor, reflector and inverse rotor passes are applied to the whole message at once as
+NumPy gathers over the machine's per-position tables (which include the ring settings).
+
+The output matches encode_message_with_rotor_advance exactly. MAX_MESSAGE_LENGTH does not
+apply here: messages are processed in blocks of BLOCK_SIZE characters, so multi-megabyte
+payloads are encoded in bounded memory.
+"""
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed by this module
+    np = None
+
+from EnigmaMachine.core.periodTable import STATE_COUNT, check_stepping_rotors, state_index, successor_table
+
+BLOCK_SIZE = 1 << 20  # Characters encoded per NumPy pass
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("The vectorized encoder needs NumPy. Install it with 'pip install numpy'.")
+
+
+class VectorEncoder:
+    """Encodes messages with NumPy, using the tables of a compiled EnigmaMachine."""
+
+    def __init__(self, machine):
+        """
+        Args:
+            machine (EnigmaMachine): The compiled machine. Its rotor positions are advanced
+                as messages are encoded, so it can be used again afterwards.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+            ValueError: If the machine has fewer than three stepping rotors.
+        """
+        _require_numpy()
+        check_stepping_rotors(machine)  # Positions are looked up by three rotor state
+        self.machine = machine
+        self.plugboard_table = np.array(machine.plugboard_table, dtype=np.uint8)
+        # Rotors that never move are folded into the reflector, see EnigmaMachine.reflector_at
+        stepping = machine.stepping_rotors
+        self.forward_tables = [np.array(tables, dtype=np.uint8) for tables in machine.forward_tables[:stepping]]
+        self.backward_tables = [np.array(tables, dtype=np.uint8) for tables in machine.backward_tables[:stepping]]
+        self.successors = successor_table(machine)
+        # Row s holds state_positions(s)
+        states = np.arange(STATE_COUNT)
+        self.state_positions = np.stack([states % 26, states // 26 % 26, states // 676], axis=1).astype(np.uint8)
+
+    def _letter_positions(self, count):
+        """Returns the rotor positions used for each of the next count letters.
+
+        The rotors step before every letter, so letter k is encoded k + 1 steps on. The states
+        are followed through the successor table until count letters are covered or the states
+        start repeating, in which case the repeating cycle is tiled out with NumPy.
+
+        Returns:
+            tuple: A (count, rotors) uint8 array, and the rotor positions after the last letter.
+        """
+        successors = self.successors
+        first_visit = {}
+        path = []
+        state = state_index(self.machine.rotor_positions)
+        while len(path) <= count and state not in first_visit:
+            first_visit[state] = len(path)
+            path.append(state)
+            state = successors[state]
+
+        steps = np.arange(count + 1, dtype=np.int64)
+        if len(path) <= count:
+            cycle_start = first_visit[state]
+            looped = steps >= len(path)
+            steps[looped] = cycle_start + (steps[looped] - cycle_start) % (len(path) - cycle_start)
+        positions = self.state_positions[np.array(path, dtype=np.int64)[steps]]
+        fixed_positions = self.machine.rotor_positions[self.machine.stepping_rotors:]
+        return positions[1:], [int(position) for position in positions[-1]] + fixed_positions
+
+    def encode_letters(self, letters):
+        """Encodes an array of letter indices, advancing the machine's rotors.
+
+        Args:
+            letters (numpy.ndarray): uint8 letter indices (0 for A to 25 for Z).
+
+        Returns:
+            numpy.ndarray: The encoded letter indices.
+        """
+        positions, final_positions = self._letter_positions(len(letters))
+
+        letters = self.plugboard_table[letters]
+        for rotor, tables in enumerate(self.forward_tables):
+            letters = tables[positions[:, rotor], letters]
+        letters = np.array(self.machine.reflector_at(self.machine.rotor_positions), dtype=np.uint8)[letters]
+        for rotor in reversed(range(len(self.backward_tables))):
+            letters = self.backward_tables[rotor][positions[:, rotor], letters]
+        letters = self.plugboard_table[letters]
+
+        self.machine.rotor_positions = final_positions
+        return letters
+
+    def encode_codes(self, codes):
+        """Encodes an array of character codes. Codes outside A-Z are kept as-is and do not advance the rotors.
+
+        Args:
+            codes (numpy.ndarray): Unsigned integer character codes, e.g. bytes or UTF-32 code points.
+
+        Returns:
+            numpy.ndarray: A new array of the same type with the letters encoded.
+        """
+        codes = codes.copy()
+        is_letter = (codes >= 65) & (codes <= 90)
+        letters = (codes[is_letter] - 65).astype(np.uint8)
+        codes[is_letter] = self.encode_letters(letters) + 65
+        return codes
+
+    def encode_bytes(self, data):
+        """Encodes ASCII bytes. Bytes other than uppercase A-Z are kept as-is.
+
+        Args:
+            data (bytes): The data to be encoded.
+
+        Returns:
+            bytes: The encoded data.
+        """
+        encoded_blocks = []
+        for start in range(0, len(data), BLOCK_SIZE):
+            codes = np.frombuffer(data[start:start + BLOCK_SIZE], dtype=np.uint8)
+            encoded_blocks.append(self.encode_codes(codes).tobytes())
+        return b''.join(encoded_blocks)
+
+    def encode(self, message):
+        """Encodes a message of any length.
+
+        Args:
+            message (str): The message to be encoded.
+
+        Returns:
+            str: The encoded message, identical to encode_message_with_rotor_advance.
+        """
+        encoded_blocks = []
+        for start in range(0, len(message), BLOCK_SIZE):
+            block = message[start:start + BLOCK_SIZE]
+            if block.isascii():
+                codes = np.frombuffer(block.encode('ascii'), dtype=np.uint8)
+                encoded_blocks.append(self.encode_codes(codes).tobytes().decode('ascii'))
+            else:
+                codes = np.frombuffer(block.encode('utf-32-le'), dtype='<u4')
+                encoded_blocks.append(self.encode_codes(codes).tobytes().decode('utf-32-le'))
+        return ''.join(encoded_blocks)
+
+
+def encode_vectorized(machine, message):
+    """Encodes a message of any length with NumPy, advancing the machine's rotors.
+
+    Args:
+        machine (EnigmaMachine): The compiled machine to encode with.
+        message (str): The message to be encoded.
+
+    Returns:
+        str: The encoded message, identical to machine.encode(message).
+    """
+    return VectorEncoder(machine).encode(message)
@@ -1,53 +1,113 @@
-from ui.welcome import (typing_welcome_message, ask_for_instructions)
-from core.enigmaPlugs import *
-from core.enigmaRotors import rotor_notches_dict, rotors_setup, reflectors_setup
-from ui.chooseMode import choose_mode_and_encode
+"""
+enigma.py
+Entry point for the Enigma Machine simulation. This script manages user interactions
+and orchestrates the encoding process using selected rotors, reflectors, and plugboard settings.
 
-#Call the welcome message functions
-if __name__ == "__main__":
-    """
-    enigma.py
-    Entry point for the Enigma Machine simulation. This script manages user interactions
-    and orchestrates the encoding process using selected rotors, reflectors, and plugboard settings.
-    """
-    # Display welcome messages.
-    typing_welcome_message()
+Only argparse is imported up front. The UI modules, the setup prompts and the key sheet
+loader are imported when they are first needed, so --help and scripted runs start fast.
+
+Usage (from the repository root):
+    python -m EnigmaMachine.enigma
+    python -m EnigmaMachine.enigma --key-sheet may.csv --date 2024-05-01 --no-animation
+    python -m EnigmaMachine.enigma --resume <code printed in letter by letter mode>
+"""
+
+import argparse
+import datetime
+import sys
+
+TYPING_DELAY = 0.02  # Seconds per character of the welcome animation, as in ui/welcome.py
+
+
+def main(argv=None):
+    # A key sheet replaces the setup prompts with the day's key, e.g. --key-sheet may.csv
+    parser = argparse.ArgumentParser(description="Enigma Machine simulator.")
+    parser.add_argument("--key-sheet", help="CSV or JSON key sheet to take the day's key from.")
+    parser.add_argument("--date", default=datetime.date.today().isoformat(),
+                        help="Date of the key sheet entry to use, as YYYY-MM-DD (default: today).")
+    parser.add_argument("--resume", help="Resume code printed in letter by letter mode; restores the whole machine.")
+    parser.add_argument("--no-animation", action="store_true",
+                        help="Print the welcome message at once instead of typing it out.")
+    parser.add_argument("--animation-delay", type=float, default=TYPING_DELAY,
+                        help=f"Seconds per character of the welcome animation (default: {TYPING_DELAY}).")
+    args = parser.parse_args(argv)
+
+    daily_key = resumed_state = None
+    if args.resume:
+        from EnigmaMachine.core.machineState import MachineState
+        try:
+            resumed_state = MachineState.from_text(args.resume)
+        except ValueError as error:
+            parser.error(str(error))
+    elif args.key_sheet:
+        from EnigmaMachine.core.keySheet import load_key_sheet
+        try:
+            daily_key = load_key_sheet(args.key_sheet).for_date(args.date)
+        except KeyError as error:
+            parser.error(error.args[0])
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+
+    # Display welcome messages. There is nobody to watch the animation when output is redirected.
+    from EnigmaMachine.ui.welcome import ask_for_instructions, typing_welcome_message
+    animate = not args.no_animation and sys.stdout.isatty()
+    typing_welcome_message(args.animation_delay if animate else 0)
 
     # Add an empty line after the image
     print()
 
-    # Ask if the user needs detailed instructions.
-    ask_for_instructions()
+    # Ask if the user needs detailed instructions. A resumed machine has no plug leads to enter.
+    if resumed_state is None:
+        ask_for_instructions()
 
-    # Set up today's plugboard based on user input.
-    plugboard = get_user_leads()
+    if resumed_state is not None:
+        plugboard, selected_rotors, selected_reflector = resumed_state.components()
+        rotor_positions = list(resumed_state.positions)
+        ring_settings = list(resumed_state.rings)
+        print(f"Resuming: rotors {' '.join(resumed_state.rotors)}, reflector {resumed_state.reflector}, "
+              f"plug leads {' '.join(resumed_state.plug_leads())}")
+    elif daily_key is not None:
+        plugboard, selected_rotors, selected_reflector = daily_key.components()
+        rotor_positions = list(daily_key.positions)
+        ring_settings = list(daily_key.rings)
+        print(f"Using the key for {daily_key.date}: rotors {' '.join(daily_key.rotors)}, "
+              f"reflector {daily_key.reflector}, plug leads {' '.join(daily_key.plugs)}")
+    else:
+        from EnigmaMachine.core.enigmaPlugs import get_user_leads
+        from EnigmaMachine.core.enigmaRotors import reflectors_setup, ring_settings_setup, rotors_setup
 
-    # Add an empty line after the image.
-    print()
+        # Set up today's plugboard based on user input.
+        plugboard = get_user_leads()
 
-    # Select rotors for encoding; returns a list of tuples with rotor names and their settings.
-    selected_rotors = rotors_setup()
+        # Add an empty line after the image.
+        print()
 
-    # Check if any rotors were selected; exit if none are chosen.
-    if not selected_rotors:
-        print("No rotors were selected. Please select at least one rotor to proceed.")
-        exit(1)  # Exit or handle the error as needed.
+        # Select rotors for encoding; returns a list of tuples with rotor names and their settings.
+        selected_rotors = rotors_setup()
 
-    # Set up reflectors; get the reflector set up.
-    selected_reflector = reflectors_setup() # Get the reflector set up
+        # Check if any rotors were selected; exit if none are chosen.
+        if not selected_rotors:
+            print("No rotors were selected. Please select at least one rotor to proceed.")
+            return 1
 
-    print("Now we're all set up, it's time to start encoding")
+        # Set up reflectors; get the reflector set up.
+        selected_reflector = reflectors_setup() # Get the reflector set up
 
-    # Rotor positions; starting positions for the rotors.
-    rotor_positions = [0, 0, 0]
+        print("Now we're all set up, it's time to start encoding")
 
-    # Ring settings; assuming no initial offset (A aligned with A).
-    ring_settings = [0, 0, 0]
+        # Rotor positions; starting positions for the rotors.
+        rotor_positions = [0, 0, 0]
 
-    # NOTE: The ring settings functionality has been written but is not yet implemented.
-    # Uncomment the following line to prompt the user for ring settings once implemented.
-    # ring_settings = ring_settings_setup(selected_rotors)
+        # Ring settings (Ringstellung); 0 leaves A aligned with A.
+        ring_settings = ring_settings_setup(selected_rotors)
 
     # Handle user choice for input mode and encoding.
+    from EnigmaMachine.core.enigmaRotors import rotor_notches_dict
+    from EnigmaMachine.ui.chooseMode import choose_mode_and_encode
     choose_mode_and_encode(plugboard, selected_rotors, selected_reflector, rotor_positions, rotor_notches_dict,
                            ring_settings)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+enigmaBatch.py
+Non-interactive entry point for the Enigma Machine. The full key is given as arguments
+or in a JSON key file, so messages can be encoded from scripts without any prompts and
+without loading the UI modules or the welcome animation.
+
+Every input file is a separate message that starts from the key's rotor positions, so
+files can be encoded concurrently in worker processes.
+
+The key sheet loader, the memory-map encoder (which loads NumPy) and the process pool are
+only imported by the options that use them, so encoding standard input starts fast.
+
+Usage (from the repository root):
+    echo "HELLO WORLD" | python -m EnigmaMachine.enigmaBatch --rotors I II III --reflector B --plugs AB CD
+    python -m EnigmaMachine.enigmaBatch --key-file key.json messages/ --output encoded/ --workers 4
+    python -m EnigmaMachine.enigmaBatch --key-sheet may.csv --date 2024-05-01 < message.txt
+    python -m EnigmaMachine.enigmaBatch --key-file key.json archive.txt --in-place
+
+Key file format:
+    {"rotors": ["I", "II", "III"], "reflector": "B", "positions": "AAA", "rings": "AAA", "plugs": ["AB", "CD"]}
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+
+from EnigmaMachine.core.machineKeys import build_machine
+from EnigmaMachine.core.streamEncoder import DEFAULT_BUFFER_SIZE, StreamEncoder, encode_file, read_chunks
+
+
+def load_key(args):
+    """Combines the key sheet or key file (if any) with the command line arguments, which take priority.
+
+    Returns:
+        dict: The rotors, reflector, positions, rings and plugs of the key.
+    """
+    key = {"rotors": None, "reflector": None, "positions": None, "rings": None, "plugs": []}
+    if args.key_file:
+        with open(args.key_file) as file:
+            key.update(json.load(file))
+    if args.key_sheet:
+        from EnigmaMachine.core.keySheet import load_key_sheet
+        sheet = load_key_sheet(args.key_sheet)
+        try:
+            daily_key = sheet.for_indicator(args.indicator) if args.indicator else sheet.for_date(args.date)
+        except KeyError as error:
+            raise ValueError(error.args[0]) from None
+        key.update(daily_key.as_key())
+    for name in key:
+        if getattr(args, name) is not None:
+            key[name] = getattr(args, name)
+    if not key["rotors"] or not key["reflector"]:
+        raise ValueError("The key needs rotors and a reflector, from --rotors/--reflector or --key-file.")
+    return key
+
+
+def list_jobs(inputs, output):
+    """Pairs every input file with the path its encoded copy is written to.
+
+    Directories are walked recursively and their layout is mirrored under the output directory.
+    With no output directory every file is paired with None, meaning it is rewritten in place.
+
+    Returns:
+        list: (source, destination) path tuples.
+    """
+    jobs = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for folder, _, files in os.walk(path):
+                for name in sorted(files):
+                    source = os.path.join(folder, name)
+                    destination = os.path.join(output, os.path.relpath(source, path)) if output is not None else None
+                    jobs.append((source, destination))
+        elif output is None:
+            jobs.append((path, None))
+        elif len(inputs) == 1 and not os.path.isdir(output):
+            jobs.append((path, output))
+        else:
+            jobs.append((path, os.path.join(output, os.path.basename(path))))
+    return jobs
+
+
+def encode_job(key, source, destination, buffer_size=DEFAULT_BUFFER_SIZE, use_mmap=False):
+    """Encodes one file with a fresh machine. Runs in a worker process when --workers is used.
+
+    Args:
+        destination (str): Where to write the encoded file, or None to rewrite source in place.
+        use_mmap (bool): Encode through memory maps instead of buffered reads. Always used in place.
+
+    Returns:
+        int: The number of bytes encoded.
+    """
+    if destination is None or use_mmap:
+        from EnigmaMachine.core.mmapEncoder import encode_mmap
+    if destination is None:
+        return encode_mmap(build_machine(key), source)
+    folder = os.path.dirname(destination)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if use_mmap:
+        return encode_mmap(build_machine(key), source, destination, buffer_size)
+    return encode_file(build_machine(key), source, destination, buffer_size)
+
+
+def encode_stdin(key, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Encodes standard input to standard output, one buffer at a time."""
+    stream = StreamEncoder(build_machine(key), sys.stdout)
+    for chunk in read_chunks(sys.stdin, buffer_size):
+        stream.write(chunk)
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encode files or standard input with the Enigma Machine.")
+    parser.add_argument("inputs", nargs="*", help="Files or directories to encode (default: standard input).")
+    parser.add_argument("-o", "--output", help="Output file, or directory when encoding several files.")
+    parser.add_argument("--key-file", help="JSON file holding the key.")
+    parser.add_argument("--key-sheet", help="CSV or JSON key sheet to take the day's key from.")
+    parser.add_argument("--date", default=datetime.date.today().isoformat(),
+                        help="Date of the key sheet entry to use, as YYYY-MM-DD (default: today).")
+    parser.add_argument("--indicator", help="Use the key sheet entry with this indicator group instead of --date.")
+    parser.add_argument("--rotors", nargs="+", help="Rotor names, rightmost rotor first, e.g. I II III.")
+    parser.add_argument("--reflector", help="Reflector name, e.g. B.")
+    parser.add_argument("--positions", help="Rotor start positions, e.g. AAA or 0,0,0 (default: all A).")
+    parser.add_argument("--rings", help="Ring settings, e.g. AAA or 0,0,0 (default: all A).")
+    parser.add_argument("--plugs", nargs="*", help="Plug leads, e.g. AB CD EF.")
+    parser.add_argument("--workers", type=int, default=1, help="Encode this many files at once.")
+    parser.add_argument("--mmap", action="store_true", help="Encode files through memory maps.")
+    parser.add_argument("--in-place", action="store_true", help="Rewrite the input files with their encoding.")
+    parser.add_argument("--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE, help="Bytes encoded at a time.")
+    args = parser.parse_args(argv)
+
+    try:
+        key = load_key(args)
+        build_machine(key)  # Validate the key before touching any files
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    if not args.inputs:
+        if args.in_place:
+            parser.error("--in-place needs files to rewrite.")
+        encode_stdin(key, args.buffer_size)
+        return 0
+    if args.in_place and args.output is not None:
+        parser.error("--in-place and --output cannot be used together.")
+    if not args.in_place and args.output is None:
+        parser.error("--output is required when encoding files.")
+
+    jobs = list_jobs(args.inputs, args.output)
+    if args.workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            list(executor.map(encode_job, [key] * len(jobs), *zip(*jobs), [args.buffer_size] * len(jobs),
+                              [args.mmap] * len(jobs)))
+    else:
+        for source, destination in jobs:
+            encode_job(key, source, destination, args.buffer_size, args.mmap)
+    print(f"Encoded {len(jobs)} file(s) {'in place' if args.in_place else 'into ' + args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
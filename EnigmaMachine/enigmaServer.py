@@ -0,0 +1,354 @@
+"""
+enigmaServer.py
+Local encoding service for the Enigma Machine. Other programs send messages over HTTP to
+a long-running process instead of starting Python for every message.
+
+Endpoints:
+    POST /encode   {"key": {...}, "message": "..."}  ->  {"message": "..."}
+    POST /decode   Same as /encode. An Enigma machine is its own inverse, so decoding a
+                   message means encoding it again with the same key.
+    GET  /stats    Request, batch and latency counters, with latency percentiles, as JSON.
+    GET  /metrics  The same counters in the Prometheus text format.
+
+The key has the same format as the enigmaBatch key file. Compiled machines are kept in a
+MachinePool, so a day's key is only compiled once however many messages use it.
+
+Requests that arrive within BATCH_WINDOW of each other are encoded together. Batches are
+never encoded on the event loop, so a long message does not hold up the other connections:
+batches with more than OFFLOAD_THRESHOLD characters go to a process pool, and the rest (or
+all of them, with a single worker) to the event loop's default thread pool.
+
+Usage (from the repository root):
+    python -m EnigmaMachine.enigmaServer --port 8421 --workers 4
+    curl -d '{"key": {"rotors": ["I", "II", "III"], "reflector": "B"}, "message": "HELLO"}' localhost:8421/encode
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from EnigmaMachine.core.machineKeys import MachinePool
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8421
+BATCH_WINDOW = 0.002  # Seconds to wait for more requests before encoding a batch
+MAX_BATCH_SIZE = 64  # Requests encoded together at most
+OFFLOAD_THRESHOLD = 1 << 14  # Batches with more characters than this are encoded in a worker process
+MAX_BODY_SIZE = 1 << 26  # Largest request body accepted, in bytes
+LATENCY_WINDOW = 10000  # Latest requests the latency percentiles are taken over
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large"}
+
+_process_pool = None  # The MachinePool of a worker process, created on its first batch
+
+
+def encode_batch(jobs, pool=None):
+    """Encodes a batch of messages. Runs in a worker process for large batches.
+
+    Args:
+        jobs (list): (key, message) tuples.
+        pool (MachinePool): Where compiled machines are taken from. Defaults to one pool per process.
+
+    Returns:
+        list: An (encoded message, error) tuple per job, one of which is None. A job that
+        fails gets an error instead of failing the batch.
+    """
+    global _process_pool
+    if pool is None:
+        if _process_pool is None:
+            _process_pool = MachinePool()
+        pool = _process_pool
+
+    results = []
+    for key, message in jobs:
+        try:
+            results.append((pool.get(key).encode(message), None))
+        except (KeyError, TypeError, ValueError) as error:
+            results.append((None, f"Invalid key: {error}"))
+        except Exception as error:  # One bad job must not take the rest of the batch with it
+            results.append((None, f"Encoding failed: {error}"))
+    return results
+
+
+def percentile(values, fraction):
+    """Returns the value below which the given fraction of the sorted values fall, or 0.0 for no values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+class ServerStats:
+    """Throughput and latency counters for the server."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.offloaded_batches = 0
+        self.characters = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, characters, latency, failed=False):
+        """Counts one finished encode or decode request."""
+        self.requests += 1
+        self.errors += failed
+        self.characters += characters
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.latencies.append(latency)
+
+    def as_dict(self, pool=None):
+        uptime = time.monotonic() - self.started
+        stats = {
+            "uptime_seconds": uptime,
+            "requests": self.requests,
+            "errors": self.errors,
+            "batches": self.batches,
+            "offloaded_batches": self.offloaded_batches,
+            "characters": self.characters,
+            "characters_per_second": self.characters / uptime if uptime > 0 else 0.0,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "latency_mean_ms": self.latency_total / self.requests * 1e3 if self.requests else 0.0,
+            "latency_p50_ms": percentile(self.latencies, 0.50) * 1e3,
+            "latency_p90_ms": percentile(self.latencies, 0.90) * 1e3,
+            "latency_p99_ms": percentile(self.latencies, 0.99) * 1e3,
+            "latency_max_ms": self.latency_max * 1e3,
+        }
+        if pool is not None:
+            stats["pooled_machines"] = len(pool)
+            stats["machines_compiled"] = pool.compiled
+        return stats
+
+    def as_prometheus(self, pool=None):
+        """Formats the counters in the Prometheus text exposition format."""
+        lines = []
+        for name, value in self.as_dict(pool).items():
+            lines.append(f"enigma_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class EncodingServer:
+    """An asyncio HTTP server that encodes messages in micro-batches."""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, batch_window=BATCH_WINDOW,
+                 max_batch_size=MAX_BATCH_SIZE, offload_threshold=OFFLOAD_THRESHOLD):
+        """
+        Args:
+            host (str): The address to listen on.
+            port (int): The port to listen on, or 0 to pick a free one.
+            workers (int): Worker processes for large batches. Defaults to one per CPU core;
+                1 encodes every batch in-process, on the default thread pool.
+            batch_window (float): Seconds to wait for more requests before encoding a batch.
+            max_batch_size (int): Requests encoded together at most.
+            offload_threshold (int): Batches with more characters than this go to the worker processes.
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.offload_threshold = offload_threshold
+        self.pool = MachinePool()
+        self.stats = ServerStats()
+        self._queue = None
+        self._server = None
+        self._batcher = None
+        self._executor = None
+        self._connections = set()
+
+    async def start(self):
+        """Starts listening. If the port was 0, self.port is set to the port picked."""
+        self._queue = asyncio.Queue()
+        if self.workers != 1:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._batcher = asyncio.create_task(self._run_batches())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """Stops listening and shuts down the batching task and worker processes."""
+        self._server.close()
+        for connection in self._connections:
+            connection.cancel()
+        self._batcher.cancel()
+        await asyncio.gather(self._batcher, *self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def encode(self, key, message):
+        """Queues a message for the next batch and waits for it to be encoded.
+
+        Returns:
+            str: The encoded message.
+
+        Raises:
+            ValueError: If the key is invalid.
+        """
+        result = asyncio.get_running_loop().create_future()
+        await self._queue.put((key, message, result))
+        encoded, error = await result
+        if error is not None:
+            raise ValueError(error)
+        return encoded
+
+    async def _run_batches(self):
+        """Collects queued requests into batches and encodes them."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            jobs = [(key, message) for key, message, _ in batch]
+            self.stats.batches += 1
+            if self._executor is not None and sum(len(message) for _, message in jobs) > self.offload_threshold:
+                self.stats.offloaded_batches += 1
+                task = loop.run_in_executor(self._executor, encode_batch, jobs)
+            else:
+                task = loop.run_in_executor(None, encode_batch, jobs, self.pool)
+            # The batch's results come back through the callback, so this loop moves on without waiting
+            task.add_done_callback(lambda done, batch=batch: self._deliver(batch, done))
+
+    @staticmethod
+    def _deliver(batch, done):
+        """Hands the results of a batch back to the waiting requests, whether it was encoded or failed."""
+        error = "the batch was cancelled" if done.cancelled() else done.exception()
+        outcomes = done.result() if error is None else [(None, f"Encoding failed: {error}")] * len(batch)
+        for (_, _, result), outcome in zip(batch, outcomes):
+            if not result.done():
+                result.set_result(outcome)
+
+    async def _handle_connection(self, reader, writer):
+        """Serves requests on one connection until the client closes it or asks to."""
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = request_line.decode("latin-1").split(maxsplit=2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    # Without a length the body cannot be told apart from the next request
+                    await self._respond(writer, 400, {"error": "The Content-Length header is not a number."}, False)
+                    break
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, {"error": "The request body is too large."}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and not version.strip().upper().startswith("HTTP/1.0"))
+
+                status, payload = await self._route(method.upper(), path, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # The client went away or sent something that is not HTTP
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    async def _route(self, method, path, body):
+        """Works out the response to one request.
+
+        Returns:
+            tuple: The HTTP status and the response payload (a dict for JSON, a str for plain text).
+        """
+        path = path.split("?", 1)[0]
+        if path == "/stats":
+            return (200, self.stats.as_dict(self.pool)) if method == "GET" else (405, {"error": "Use GET."})
+        if path == "/metrics":
+            return (200, self.stats.as_prometheus(self.pool)) if method == "GET" else (405, {"error": "Use GET."})
+        if path not in ("/encode", "/decode"):
+            return 404, {"error": f"Unknown path {path}."}
+        if method != "POST":
+            return 405, {"error": "Use POST."}
+
+        start = time.perf_counter()
+        try:
+            request = json.loads(body)
+            key, message = request["key"], request["message"]
+            if not isinstance(key, dict) or not isinstance(message, str):
+                raise ValueError("Expected a key object and a message string.")
+        except (KeyError, TypeError, ValueError) as error:
+            self.stats.record(0, time.perf_counter() - start, failed=True)
+            return 400, {"error": f"Invalid request: {error}"}
+
+        try:
+            encoded = await self.encode(key, message)
+        except ValueError as error:
+            self.stats.record(0, time.perf_counter() - start, failed=True)
+            return 400, {"error": str(error)}
+        self.stats.record(len(message), time.perf_counter() - start)
+        return 200, {"message": encoded}
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode(), "application/json"
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Enigma Machine encoding over local HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument("--workers", type=int, help="Worker processes for large batches (default: CPU count).")
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW * 1e3,
+                        help="Milliseconds to wait for more requests before encoding a batch.")
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE, help="Requests per batch at most.")
+    args = parser.parse_args(argv)
+
+    server = EncodingServer(args.host, args.port, args.workers, args.batch_window_ms / 1e3, args.max_batch_size)
+    print(f"Serving on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+differentialHarness.py
+--------------------
+Differential testing for the fast engines. Random machine configurations are built from
+the rotors offered by rotors_setup (rotor_wirings_dict), the reflectors and a Plugboard
+of random PlugLeads, and random messages mixing letters with characters that pass through
+(spaces, punctuation, digits, lowercase and non-ASCII). Every engine encodes every case, and
+each must give the reference output of encode_message_with_rotor_advance and leave the
+rotors where the reference left them.
+
+Each case is also checked against two properties of the machine itself:
+    - reciprocity: encoding the output from the same start gives back the message
+    - no self-encipherment: no letter is ever encoded as itself
+
+Costly setup is done once and shared by many cases: the machine, its period table and
+its vectorized encoder are built once per configuration, and the successor table once per
+set of stepping rotors (see periodTable.successor_table). The fast engines run on every
+case; the traced, profiled and recorded code paths, which do the same lookups with extra
+bookkeeping and cost as much as all the fast engines together, run on one case in
+INSTRUMENTED_EVERY. encode_parallel starts a process pool for each message, so it runs on
+the first case of each configuration only, split into one segment per worker. The harness
+checks well over a thousand cases per second and reports the rate it reached;
+a fixed-seed run is part of test.py.
+
+Usage (from the repository root):
+    python -m EnigmaMachine.tests.differentialHarness --cases 20000 --seed 1
+"""
+
+import argparse
+import copy
+import random
+import sys
+import time
+from collections import namedtuple
+
+from EnigmaMachine.core.decodingMessage import decode_messages
+from EnigmaMachine.core.encodingMessage import STEPPING_ROTORS, StepRecorder, encode_message_with_rotor_advance
+from EnigmaMachine.core.encodingStats import EncodingStats
+from EnigmaMachine.core.enigmaMachine import ALPHABET, EnigmaMachine
+from EnigmaMachine.core.enigmaPlugs import PlugLead, Plugboard
+from EnigmaMachine.core.enigmaRotors import (reflector_wirings_dict, rotor_notches_dict, rotor_wirings_dict,
+                                             thin_reflector_wirings_dict)
+from EnigmaMachine.core.machineState import MachineState, restore, snapshot
+from EnigmaMachine.core.parallelEncoder import encode_parallel
+from EnigmaMachine.core.periodTable import PeriodTableCache, encode_with_period_table
+from EnigmaMachine.core.streamEncoder import StreamEncoder
+from EnigmaMachine.core.traceBuffer import TraceBuffer
+from EnigmaMachine.core.vectorEncoder import VectorEncoder, np
+
+DEFAULT_CASES = 2000
+CASES_PER_CONFIGURATION = 500  # Cases sharing one compiled configuration
+MAX_MESSAGE_LENGTH = 40
+PASSTHROUGH_CHARACTERS = " .,?!-0123456789abcxyzÄÖÜé"
+M4_FRACTION = 0.25  # Share of configurations that are four rotor M4s
+INSTRUMENTED_EVERY = 8  # The traced, profiled and recorded code paths run on one case in this many
+PARALLEL_WORKERS = 2  # Worker processes encode_parallel splits each of its cases between
+
+Configuration = namedtuple("Configuration", ["rotors", "reflector", "rings", "plug_leads", "fixed_positions"])
+Failure = namedtuple("Failure", ["configuration", "start", "message", "engine", "problem"])
+DifferentialResult = namedtuple("DifferentialResult", ["cases", "configurations", "seconds", "failures"])
+
+
+def random_configuration(generator):
+    """Picks rotors, a reflector, ring settings and plug leads at random.
+
+    Returns:
+        Configuration: Rotor names rightmost first, the reflector name, ring settings, plug leads and
+            the positions of the rotors that never step. Those are part of the configuration, as they
+            are part of the key the period table is cached under.
+    """
+    if generator.random() < M4_FRACTION:
+        fourth = generator.choice([name for name in rotor_wirings_dict if rotor_notches_dict[name] is None])
+        rotors = generator.sample([name for name in rotor_wirings_dict if name != fourth], 3) + [fourth]
+        reflector = generator.choice(list(thin_reflector_wirings_dict))
+    else:
+        rotors = generator.sample(list(rotor_wirings_dict), 3)
+        reflector = generator.choice(list(reflector_wirings_dict))
+    letters = generator.sample(ALPHABET, 2 * generator.randint(0, 13))
+    plug_leads = [letters[index] + letters[index + 1] for index in range(0, len(letters), 2)]
+    rings = [generator.randrange(26) for _ in rotors]
+    fixed_positions = [generator.randrange(26) for _ in rotors[STEPPING_ROTORS:]]
+    return Configuration(rotors, reflector, rings, plug_leads, fixed_positions)
+
+
+def random_message(generator):
+    """Builds a message of up to MAX_MESSAGE_LENGTH characters, mostly letters."""
+    length = generator.randint(0, MAX_MESSAGE_LENGTH)
+    return ''.join(generator.choice(PASSTHROUGH_CHARACTERS) if generator.random() < 0.2 else generator.choice(ALPHABET)
+                   for _ in range(length))
+
+
+class CompiledConfiguration:
+    """The engines for one configuration, set up once and shared by all of its cases."""
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self.plugboard = Plugboard()
+        for lead in configuration.plug_leads:
+            self.plugboard.add_lead(PlugLead(lead))
+        reflectors = {**reflector_wirings_dict, **thin_reflector_wirings_dict}
+        self.selected_rotors = [(name, rotor_wirings_dict[name]) for name in configuration.rotors]
+        self.selected_reflector = (configuration.reflector, reflectors[configuration.reflector])
+
+        self.machine = EnigmaMachine.from_settings(configuration.rotors, configuration.reflector, None,
+                                                   configuration.rings, configuration.plug_leads)
+        self.restored = restore(snapshot(self.machine))  # Compiled from a snapshot rather than the settings
+        self.period_tables = PeriodTableCache(maxsize=1)
+        self.vector_encoder = VectorEncoder(copy.copy(self.machine)) if np is not None else None
+        self.engines = {
+            "machine": self._machine,
+            "stream": self._stream,
+            "snapshot": self._snapshot,
+            "period_table": self._period_table,
+        }
+        if self.vector_encoder is not None:
+            self.engines["vectorized"] = self._vectorized
+        # The instrumented code paths, which are checked on a sample of the cases
+        self.instrumented_engines = {
+            "traced": self._traced,
+            "profiled": self._profiled,
+            "recorded": self._recorded,
+        }
+        # The engines that start worker processes, which are checked once per configuration
+        self.parallel_engines = {
+            "parallel": self._parallel,
+        }
+
+    def reference(self, start, message):
+        """Encodes a case with the reference functions.
+
+        Returns:
+            tuple: The output and the rotor positions after the message.
+        """
+        positions = list(start)
+        output = encode_message_with_rotor_advance(self.plugboard, self.selected_rotors, self.selected_reflector,
+                                                   message, positions, rotor_notches_dict, self.configuration.rings,
+                                                   tracer=None)
+        return output, positions
+
+    def at(self, start, **options):
+        """Returns a copy of the compiled machine set to the start positions."""
+        machine = copy.copy(self.machine)
+        machine.rotor_positions = list(start)
+        for name, value in options.items():
+            setattr(machine, name, value)
+        return machine
+
+    def _machine(self, start, message):
+        machine = self.at(start)
+        return machine.encode(message), machine.rotor_positions
+
+    def _traced(self, start, message):
+        machine = self.at(start, tracer=StepRecorder())
+        return machine.encode(message), machine.rotor_positions
+
+    def _profiled(self, start, message):
+        machine = self.at(start, stats=EncodingStats())
+        return machine.encode(message), machine.rotor_positions
+
+    def _recorded(self, start, message):
+        machine = self.at(start, trace=TraceBuffer(len(start), capacity=8))
+        return machine.encode(message), machine.rotor_positions
+
+    def _stream(self, start, message):
+        machine = self.at(start)
+        stream = StreamEncoder(machine)
+        output = ''.join(stream.encode(message[index:index + 7]) for index in range(0, len(message), 7))
+        return output, machine.rotor_positions
+
+    def _snapshot(self, start, message):
+        # Encode half, snapshot, and finish on the restored machine at the snapshot's positions
+        machine = self.at(start)
+        half = len(message) // 2
+        output = machine.encode(message[:half])
+        state = MachineState.from_bytes(snapshot(machine))
+        if state != MachineState.from_machine(machine):
+            return output, None
+        machine = copy.copy(self.restored)
+        machine.rotor_positions = list(state.positions)
+        return output + machine.encode(message[half:]), machine.rotor_positions
+
+    def _period_table(self, start, message):
+        machine = self.at(start)
+        return encode_with_period_table(machine, message, self.period_tables), machine.rotor_positions
+
+    def _parallel(self, start, message):
+        machine = self.at(start)
+        output = encode_parallel(machine, message, workers=PARALLEL_WORKERS, min_segment_length=1)
+        return output, machine.rotor_positions
+
+    def _vectorized(self, start, message):
+        self.vector_encoder.machine.rotor_positions = list(start)
+        return self.vector_encoder.encode(message), self.vector_encoder.machine.rotor_positions
+
+
+def check_case(compiled, start, message, instrumented=True, parallel=False):
+    """Runs one case through every engine and checks the machine's properties.
+
+    Args:
+        compiled (CompiledConfiguration): The configuration of the case.
+        start (list): The start positions, rightmost rotor first.
+        message (str): The message.
+        instrumented (bool): Also run the traced, profiled and recorded code paths.
+        parallel (bool): Also run encode_parallel, which starts worker processes.
+
+    Returns:
+        tuple: The reference output, and a Failure for every engine or property that did not hold.
+    """
+    configuration = compiled.configuration
+    failures = []
+    expected, expected_positions = compiled.reference(start, message)
+    engines = dict(compiled.engines)
+    if instrumented:
+        engines.update(compiled.instrumented_engines)
+    if parallel:
+        engines.update(compiled.parallel_engines)
+    for engine, encode in engines.items():
+        output, positions = encode(start, message)
+        if output != expected:
+            failures.append(Failure(configuration, start, message, engine, f"output {output!r} != {expected!r}"))
+        elif positions is None or list(positions) != expected_positions:
+            failures.append(Failure(configuration, start, message, engine,
+                                    f"final positions {positions} != {expected_positions}"))
+
+    if compiled.at(start).encode(expected) != message:
+        failures.append(Failure(configuration, start, message, "machine", "decoding does not give the message back"))
+    if any(letter in ALPHABET and letter == encoded for letter, encoded in zip(message, expected)):
+        failures.append(Failure(configuration, start, message, "reference", "a letter was encoded as itself"))
+    return expected, failures
+
+
+def run_differential(cases=DEFAULT_CASES, seed=0, cases_per_configuration=CASES_PER_CONFIGURATION):
+    """Generates random cases and checks every engine against the reference.
+
+    Args:
+        cases (int): The number of (configuration, start positions, message) cases.
+        seed (int): Seed for the random generator, so a failing run can be repeated.
+        cases_per_configuration (int): How many cases share one configuration.
+
+    Returns:
+        DifferentialResult: The counts, the time taken and every failure found.
+    """
+    generator = random.Random(seed)
+    started = time.perf_counter()
+    failures = []
+    configurations = 0
+    remaining = cases
+    while remaining > 0:
+        compiled = CompiledConfiguration(random_configuration(generator))
+        configurations += 1
+        batch = []
+        for _ in range(min(cases_per_configuration, remaining)):
+            start = [generator.randrange(26) for _ in range(STEPPING_ROTORS)] + compiled.configuration.fixed_positions
+            message = random_message(generator)
+            instrumented = (cases - remaining + len(batch)) % INSTRUMENTED_EVERY == 0
+            expected, case_failures = check_case(compiled, start, message, instrumented, parallel=not batch)
+            failures.extend(case_failures)
+            batch.append((start, message, expected))
+        remaining -= len(batch)
+
+        # The batch decoder must agree with the reference for the whole batch at once
+        decoded_batch = decode_messages(compiled.machine, [(start, expected) for start, _, expected in batch])
+        for (start, message, _), decoded in zip(batch, decoded_batch):
+            if decoded != message:
+                failures.append(Failure(compiled.configuration, start, message, "decode_messages",
+                                        f"decoded {decoded!r}"))
+    return DifferentialResult(cases, configurations, time.perf_counter() - started, failures)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check every encoding engine against the reference.")
+    parser.add_argument("--cases", type=int, default=DEFAULT_CASES, help="Number of random cases.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("--cases-per-configuration", type=int, default=CASES_PER_CONFIGURATION,
+                        help="Cases that share one machine configuration.")
+    args = parser.parse_args(argv)
+
+    result = run_differential(args.cases, args.seed, args.cases_per_configuration)
+    for failure in result.failures[:20]:
+        print(failure)
+    print(f"{result.cases} cases over {result.configurations} configurations in {result.seconds:.2f} s "
+          f"({result.cases / result.seconds:,.0f} cases/sec), {len(result.failures)} failures")
+    return 1 if result.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,99 @@
+import asyncio
+import contextlib
+import copy
+import functools
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
 
+from EnigmaMachine.core import rotorRegistry
+from EnigmaMachine.core.cribSearch import search_crib
+from EnigmaMachine.core.decodingMessage import decode_message, decode_messages, message_key
+from EnigmaMachine.core.encodingMessage import StepRecorder, encode_message_with_rotor_advance
+from EnigmaMachine.core.encodingStats import EncodingStats
+from EnigmaMachine.core.enigmaMachine import ALPHABET, LETTER_INDEX, EnigmaMachine
 from EnigmaMachine.core.enigmaPlugs import *
 from EnigmaMachine.core.enigmaRotors import *
+from EnigmaMachine.core.keySheet import load_key_sheet
+from EnigmaMachine.core.machineKeys import MachinePool, build_machine, parse_settings
+from EnigmaMachine.core.machineState import MachineState, restore, snapshot
+from EnigmaMachine.core.manyKeys import compile_keys, encode_many_keys, row_text, sweep_positions
+from EnigmaMachine.core.mmapEncoder import encode_mmap
+from EnigmaMachine.core.ngramSearch import (best_start_positions, build_ngram_table, hill_climb_plugboard,
+                                            index_of_coincidence, load_ngram_table)
+from EnigmaMachine.core.parallelEncoder import encode_parallel
+from EnigmaMachine.core.periodTable import PeriodTableCache, encode_with_period_table
+from EnigmaMachine.core.rotorRegistry import REFLECTORS, ROTORS, load_wirings, position_tables
+from EnigmaMachine.core.streamEncoder import StreamEncoder, encode_file
+from EnigmaMachine.core.traceBuffer import TraceBuffer
+from EnigmaMachine.core.vectorEncoder import VectorEncoder, encode_vectorized, np
+
+from EnigmaMachine.benchmarks.benchmarkEncoding import benchmark, compare_to_baseline
+from EnigmaMachine.enigma import main as enigma_main
+from EnigmaMachine.enigmaBatch import main as batch_main
+from EnigmaMachine.enigmaServer import EncodingServer
+from EnigmaMachine.tests.differentialHarness import run_differential
+from EnigmaMachine.ui.chooseMode import build_traced_machine, choose_mode_and_encode, encode_message_with_steps
+
+# A fixed machine setup shared by the encoding tests
+TEST_ROTORS = [
+    ("I", "EKMFLGDQVZNTOWYHXUSPAIBRCJ"),
+    ("II", "AJDKSIRUXBLHWTMCQGZNPYFVOE"),
+    ("III", "BDFHJLCPRTXVZNYEIWGAKMUSQO"),
+]
+TEST_REFLECTOR = ("B", "YRUHQSLDPXNGOKMIEBFZCWVJAT")
+TEST_MESSAGE = "HELLO WORLD, THIS IS THE ENIGMA MACHINE SPEAKING"
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Startup budget for importing the compiled engine. Generous, as bytecode may not be cached.
+CORE_IMPORT_BUDGET_MS = 150
+TEST_PLAINTEXT = (
+    "THE ENIGMA MACHINES WERE A SERIES OF ELECTROMECHANICAL ROTOR CIPHER MACHINES DEVELOPED AND USED IN THE "
+    "EARLY TO MID TWENTIETH CENTURY TO PROTECT COMMERCIAL DIPLOMATIC AND MILITARY COMMUNICATION THE MACHINE "
+    "HAS AN ELECTROMECHANICAL ROTOR MECHANISM THAT SCRAMBLES THE TWENTY SIX LETTERS OF THE ALPHABET IN TYPICAL "
+    "USE ONE PERSON ENTERS TEXT ON THE KEYBOARD AND ANOTHER PERSON WRITES DOWN WHICH OF TWENTY SIX LIGHTS ABOVE "
+    "THE KEYBOARD ILLUMINATED AT EACH KEY PRESS"
+)
+
+
+def import_times(module):
+    """Imports a module in a fresh interpreter under -X importtime.
+
+    Returns:
+        dict: The cumulative import time in microseconds of every module that was imported.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPOSITORY_ROOT,
+                            env=dict(os.environ, PYTHONPATH=REPOSITORY_ROOT), capture_output=True, text=True,
+                            check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def make_test_plugboard(pairs=("AG", "BT", "QZ")):
+    plugboard = Plugboard()
+    for pair in pairs:
+        plugboard.add_lead(PlugLead(pair))
+    return plugboard
+
+
+def reference_encode(plugboard, message, rotor_positions, rotors=TEST_ROTORS, reflector=TEST_REFLECTOR):
+    """Runs encode_message_with_rotor_advance with its step printing captured."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return encode_message_with_rotor_advance(plugboard, list(rotors), reflector, message,
+                                                 list(rotor_positions), rotor_notches_dict, [0, 0, 0])
 
 
 class TestEnigmaMachine(unittest.TestCase):
@@ -36,6 +128,778 @@ class TestEnigmaMachine(unittest.TestCase):
             print(f"Encoded '{char}' -> '{encoded}'")
         print("Plugboard tests completed successfully.")
 
+    def test_plugboard_table_and_transform_string(self):
+        plugboard = make_test_plugboard()
+        self.assertEqual(plugboard.transform_character("A"), "G")
+        self.assertEqual(plugboard.transform_character("Q"), "Z")
+        self.assertEqual(plugboard.transform_character("C"), "C")
+        self.assertEqual(plugboard.table[0], 6)
+        self.assertEqual(plugboard.transform_string("ABC GTZ!"), "GTC ABQ!")
+        self.assertEqual(''.join(plugboard.transform_character(letter) for letter in TEST_MESSAGE),
+                         plugboard.transform_string(TEST_MESSAGE))
+        self.assertFalse(hasattr(PlugLead("AB"), "__dict__"))
+
+    def test_plugboard_swaps_notify_machine_and_undo(self):
+        plugboard = make_test_plugboard()  # AG BT QZ
+        machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [0, 0, 0], rotor_notches_dict)
+        machine.follow_plugboard(plugboard)
+        changes = []
+        plugboard.add_listener(changes.append)
+
+        # A to B unplugs both old leads, leaving G and T free
+        plugboard.swap("A", "B")
+        self.assertEqual(sorted(changes[-1]), [(0, 1), (1, 0), (6, 6), (19, 19)])
+        self.assertEqual(sorted(lead.mapping for lead in plugboard.plug_leads), ["AB", "QZ"])
+        self.assertEqual(plugboard.transform_string("ABGTQ"), "BAGTZ")
+        plugboard.unswap("Z")
+        self.assertEqual(machine.plugboard_table, plugboard.table)
+        self.assertEqual(machine.encode(TEST_MESSAGE), EnigmaMachine.from_settings(
+            ["I", "II", "III"], "B", plug_leads=["AB"]).encode(TEST_MESSAGE))
+
+        # Taking both moves back restores the original leads, in the machine too
+        plugboard.undo()
+        plugboard.undo()
+        self.assertEqual(plugboard.table, make_test_plugboard().table)
+        self.assertEqual(machine.plugboard_table, plugboard.table)
+        self.assertEqual([lead.mapping for lead in plugboard.plug_leads], ["AG", "BT", "QZ"])
+        self.assertEqual(plugboard.transform_string(TEST_MESSAGE), make_test_plugboard().transform_string(TEST_MESSAGE))
+        with self.assertRaises(IndexError):
+            plugboard.undo()
+        with self.assertRaises(ValueError):
+            plugboard.unswap("C")
+        with self.assertRaises(ValueError):
+            plugboard.swap("C", "c")
+        plugboard.add_lead(PlugLead("CD"))
+        self.assertEqual([lead.mapping for lead in plugboard.plug_leads], ["AG", "BT", "QZ", "CD"])
+
+    def test_plugboard_uppercases_characters_like_each_lead_in_turn(self):
+        plugboard = make_test_plugboard()
+        for character in "AaGgCc.1éß":
+            expected = character
+            for lead in plugboard.plug_leads:
+                expected = lead.encode(character)
+                if expected != character:
+                    break
+            self.assertEqual(plugboard.transform_character(character), expected)
+        self.assertEqual(plugboard.transform_character("c"), "C")
+        self.assertEqual(Plugboard().transform_character("c"), "c")
+
+    def test_plugboard_rejects_duplicate_letters(self):
+        plugboard = make_test_plugboard()
+        with self.assertRaises(ValueError):
+            plugboard.add_lead(PlugLead("AC"))
+        with self.assertRaises(ValueError):
+            plugboard.add_lead(PlugLead("CC"))
+        self.assertEqual(len(plugboard.plug_leads), 3)
+        self.assertEqual(plugboard.transform_character("C"), "C")
+
+    def test_enigma_machine_matches_reference(self):
+        print("Running compiled EnigmaMachine tests...")
+        plugboard = make_test_plugboard()
+        for rotor_positions in ([0, 0, 0], [16, 4, 21], [25, 25, 25]):
+            expected = reference_encode(plugboard, TEST_MESSAGE, rotor_positions)
+            machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, rotor_positions, rotor_notches_dict)
+            self.assertEqual(machine.encode(TEST_MESSAGE), expected)
+        print("Compiled EnigmaMachine tests completed successfully.")
+
+    def test_historical_test_vectors(self):
+        print("Running historical test vector tests...")
+        # Rotors are given rightmost first: I-II-III in the usual left to right order
+        machine = EnigmaMachine.from_settings(["III", "II", "I"], "B")
+        self.assertEqual(machine.encode("AAAAA"), "BDZGO")
+        machine = EnigmaMachine.from_settings(["III", "II", "I"], "B", ring_settings=[1, 1, 1])
+        self.assertEqual(machine.encode("AAAAA"), "EWTYX")
+
+        # The middle rotor steps twice in a row: ADU -> ADV -> AEW -> BFX
+        machine = EnigmaMachine.from_settings(["III", "II", "I"], "B", rotor_positions=[20, 3, 0])
+        windows = []
+        for _ in range(3):
+            machine.step()
+            windows.append(''.join(ALPHABET[position] for position in reversed(machine.rotor_positions)))
+        self.assertEqual(windows, ["ADV", "AEW", "BFX"])
+
+        # Operation Barbarossa, 1941: rotors II IV V, rings BUL, start BLA
+        machine = EnigmaMachine.from_settings(["V", "IV", "II"], "B", [0, 11, 1], [11, 20, 1],
+                                              ["AV", "BS", "CG", "DL", "FU", "HZ", "IN", "KM", "OW", "RX"])
+        self.assertEqual(machine.encode("EDPUDNRGYSZRCXNUYTPOMRMBOFKTBZREZKMLXLVEFGUEYSIOZVEQMIKUBPMMYLKLT"),
+                         "AUFKLXABTEILUNGXVONXKURTINOWAXKURTINOWAXNORDWESTLXSEBEZXSEBEZXUAF")
+        print("Historical test vector tests completed successfully.")
+
+    def test_rotor_registry_shares_tables_and_loads_custom_wirings(self):
+        # Machines pick their tables out of the catalog instead of compiling them
+        machine = EnigmaMachine.from_settings(["I", "II", "III"], "B", ring_settings=[0, 5, 0])
+        self.assertIs(machine.forward_tables[0], ROTORS["I"].forward)
+        self.assertEqual(machine.forward_tables[1], position_tables(ROTORS["II"].table, 5))
+        self.assertEqual((ROTORS["I"].notch, ROTORS["Beta"].stepping, REFLECTORS["C-Thin"].thin), (16, False, True))
+        with self.assertRaises(TypeError):
+            ROTORS["X"] = ROTORS["I"]
+
+        custom_rotor = {"name": "X", "wiring": "QWERTZUIOASDFGHJKPYXCVBNML", "notch": "K"}
+        custom_reflector = {"name": "D", "wiring": "FOWULAQYSRTEZVBXGJIKDNCPHM"}
+        with contextlib.ExitStack() as stack, tempfile.TemporaryDirectory() as directory:
+            # Keep the registrations from leaking into the other tests
+            for registered in (rotor_wirings_dict, rotor_notches_dict, reflector_wirings_dict,
+                               rotorRegistry._rotors, rotorRegistry._reflectors):
+                stack.enter_context(mock.patch.dict(registered))
+
+            path = os.path.join(directory, "wirings.json")
+            for invalid in ({"rotors": [custom_rotor, {"name": "Y", "wiring": "ABCDEFGHIJKLMNOPQRSTUVWXYA"}]},
+                            {"reflectors": [{"name": "E", "wiring": "ABCDEFGHIJKLMNOPQRSTUVWXYZ"}]},
+                            {"reflectors": [{"name": "E", "wiring": "BCAEDGFIHKJMLONQPSRUTWVYXZ"}]},
+                            {"rotors": [{**custom_rotor, "name": "I"}]}):
+                with open(path, "w") as file:
+                    json.dump(invalid, file)
+                with self.assertRaises(ValueError):
+                    load_wirings(path)
+                self.assertNotIn("X", ROTORS)  # Nothing from a bad file is registered
+
+            with open(path, "w") as file:
+                json.dump({"rotors": [custom_rotor], "reflectors": [custom_reflector]}, file)
+            self.assertEqual([definition.name for definition in load_wirings(path)], ["X", "D"])
+            machine = EnigmaMachine.from_settings(["X", "I", "II"], "D", [9, 3, 0], [1, 2, 3], ["AB"])
+            plugboard = Plugboard()
+            plugboard.add_lead(PlugLead("AB"))
+            expected = encode_message_with_rotor_advance(
+                plugboard, [("X", custom_rotor["wiring"]), TEST_ROTORS[0], TEST_ROTORS[1]],
+                ("D", custom_reflector["wiring"]), TEST_MESSAGE, [9, 3, 0], rotor_notches_dict, [1, 2, 3], tracer=None)
+            self.assertEqual(machine.encode(TEST_MESSAGE), expected)
+            with self.assertRaises(ValueError):
+                snapshot(machine)  # Custom parts have no id that other processes would agree on
+
+            # Letter by letter mode leaves the resume code out instead of failing
+            custom_plugboard, output = Plugboard(), io.StringIO()
+            with mock.patch("builtins.input", side_effect=["L", "A", ""]), contextlib.redirect_stdout(output):
+                choose_mode_and_encode(custom_plugboard, [("X", custom_rotor["wiring"])] + TEST_ROTORS[:2],
+                                       ("D", custom_reflector["wiring"]), [0, 0, 0], rotor_notches_dict, [0, 0, 0])
+            self.assertIn("Encoded letter:", output.getvalue())
+            self.assertNotIn("Resume code:", output.getvalue())
+
+        # A snapshot restores the standard notches, so a machine stepping on others is refused
+        with self.assertRaisesRegex(ValueError, "notch"):
+            snapshot(EnigmaMachine(Plugboard(), TEST_ROTORS, TEST_REFLECTOR, [0, 0, 0], {**rotor_notches_dict, "I": 0}))
+        self.assertNotIn("X", rotor_wirings_dict)
+
+    def test_m4_four_rotor_machine(self):
+        print("Running M4 tests...")
+        # U-534, 1945: Beta II IV I, thin reflector B, rings AAAV, start VJNA
+        ciphertext = ("NCZWVUSXPNYMINHZXMQXSFWXWLKJAHSHNMCOCCAKUQPMKCSMHKSEINJUSBLKIOSXCKUBHMLLXCSJUSRRDVKOHULX"
+                      "WCCBGVLIYXEOAHXRHKKFVDREWEZLXOBAFGYUJQUKGRTVUKAMEURBVEKSUHHVOYHABCJWMAKLFKLMYFVNRIZRVVRTK"
+                      "OFDANJMOLBGFFLEOPRGTFLVRHOWOPBEKVWMUQFMPWPARMFHAGKXIIBG")
+        plaintext = ("VONVONJLOOKSJHFFTTTEINSEINSDREIZWOYYQNNSNEUNINHALTXXBEIANGRIFFUNTERWASSERGEDRUECKTYWABOS"
+                     "XLETZTERGEGNERSTANDNULACHTDREINULUHRMARQUANTONJOTANEUNACHTSEYHSDREIYZWOZWONULGRADYACHTSMYS"
+                     "TOSSENACHXEKNSVIERMBFAELLTYNNNNNNOOOVIERYSICHTEINSNULL")
+
+        def machine(positions=(0, 13, 9, 21)):
+            return EnigmaMachine.from_settings(["I", "IV", "II", "Beta"], "B-Thin", list(positions), [21, 0, 0, 0],
+                                               ["AT", "BL", "DF", "GJ", "HM", "NW", "OP", "QY", "RZ", "VX"])
+        m4 = machine()
+        self.assertEqual(m4.encode(ciphertext), plaintext)
+        self.assertEqual(m4.rotor_positions[3], 21)  # The fourth rotor never moves
+        self.assertEqual(encode_with_period_table(machine(), ciphertext), plaintext)
+        if np is not None:
+            self.assertEqual(encode_vectorized(machine(), ciphertext), plaintext)
+
+        # The fourth rotor's position is part of the configuration, so tables are not shared across it
+        cache = PeriodTableCache()
+        self.assertNotEqual(encode_with_period_table(machine((0, 13, 9, 4)), plaintext, cache),
+                            encode_with_period_table(machine(), plaintext, cache))
+        self.assertEqual(len(cache), 2)
+
+        with self.assertRaises(ValueError):
+            EnigmaMachine.from_settings(["I", "IV", "II", "V"], "B-Thin")  # V steps, so it cannot be fourth
+        with self.assertRaises(ValueError):
+            EnigmaMachine.from_settings(["I", "IV", "II", "Beta"], "B")  # A full-width reflector does not fit
+        with self.assertRaises(ValueError):
+            EnigmaMachine.from_settings(["I", "IV", "II"], "C-Thin")
+        print("M4 tests completed successfully.")
+
+    def test_every_engine_applies_ring_settings_and_is_reciprocal(self):
+        plugboard = make_test_plugboard()
+        rings = [5, 17, 2]
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = encode_message_with_rotor_advance(plugboard, list(TEST_ROTORS), TEST_REFLECTOR, TEST_MESSAGE,
+                                                         [3, 4, 5], rotor_notches_dict, rings)
+
+        def machine():
+            return EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [3, 4, 5], rotor_notches_dict, rings)
+        self.assertEqual(machine().encode(TEST_MESSAGE), expected)
+        self.assertEqual(machine().encode(expected), TEST_MESSAGE)
+        self.assertEqual(encode_with_period_table(machine(), TEST_MESSAGE), expected)
+        if np is not None:
+            self.assertEqual(encode_vectorized(machine(), TEST_MESSAGE), expected)
+
+    def test_differential_harness_finds_no_disagreement(self):
+        # Four random configurations, one of them an M4, each checked on every engine
+        result = run_differential(cases=2000, seed=1, cases_per_configuration=500)
+        self.assertEqual(result.configurations, 4)
+        self.assertEqual(result.failures, [])
+
+    def test_bulk_decoding_under_one_daily_key(self):
+        print("Running bulk decoding tests...")
+        daily_key = EnigmaMachine.from_settings(["V", "IV", "II"], "B", None, [11, 20, 1],
+                                                ["AV", "BS", "CG", "DL", "FU", "HZ", "IN", "KM", "OW", "RX"])
+        generator = random.Random(7)
+        messages, plaintexts = [], []
+        for index in range(20):
+            positions = [generator.randrange(26) for _ in range(3)]
+            plaintext = TEST_PLAINTEXT[index * 10:index * 10 + 60 + index]
+            sender = copy.copy(daily_key)
+            sender.rotor_positions = list(positions)
+            messages.append((''.join(ALPHABET[position] for position in positions), sender.encode(plaintext)))
+            plaintexts.append(plaintext)
+
+        self.assertEqual(decode_messages(daily_key, messages), plaintexts)
+        self.assertEqual(decode_messages(daily_key, messages, use_period_table=True), plaintexts)
+        self.assertEqual(daily_key.rotor_positions, [0, 0, 0])
+
+        # The message key travels encoded at the Grundstellung sent in the clear
+        sender = copy.copy(daily_key)
+        sender.rotor_positions = parse_settings("WZA")
+        indicator = sender.encode("SXT")
+        self.assertEqual(message_key(daily_key, "WZA", indicator), parse_settings("SXT"))
+
+        plugboard = make_test_plugboard()
+        encoded = reference_encode(plugboard, TEST_MESSAGE, [3, 7, 11])
+        self.assertEqual(decode_message(plugboard, list(TEST_ROTORS), TEST_REFLECTOR, encoded, [3, 7, 11],
+                                        rotor_notches_dict, [0, 0, 0]), TEST_MESSAGE)
+        with self.assertRaises(ValueError):
+            decode_messages(daily_key, [("AB", "XYZ")])
+        print("Bulk decoding tests completed successfully.")
+
+    def test_enigma_machine_keeps_rotor_state_between_calls(self):
+        plugboard = make_test_plugboard()
+        expected = reference_encode(plugboard, TEST_MESSAGE, [3, 7, 11])
+        machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [3, 7, 11], rotor_notches_dict)
+        encoded = machine.encode(TEST_MESSAGE[:20]) + machine.encode(TEST_MESSAGE[20:])
+        self.assertEqual(encoded, expected)
+
+    def test_profiled_paths_count_stages_without_printing(self):
+        plugboard = make_test_plugboard()
+        expected = reference_encode(plugboard, TEST_MESSAGE, [3, 7, 11])
+        letters = sum(letter in ALPHABET for letter in TEST_MESSAGE)
+
+        stats = EncodingStats()
+        machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [3, 7, 11], rotor_notches_dict, stats=stats)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(machine.encode(TEST_MESSAGE), expected)
+            self.assertEqual(encode_message_with_rotor_advance(plugboard, list(TEST_ROTORS), TEST_REFLECTOR,
+                                                               TEST_MESSAGE, [3, 7, 11], rotor_notches_dict,
+                                                               [0, 0, 0], stats=stats), expected)
+        self.assertEqual(output.getvalue(), "")
+
+        counters = stats.as_dict()
+        self.assertEqual((counters["messages"], counters["letters"]), (2, 2 * letters))
+        self.assertEqual(counters["stages"]["stepping"]["count"], 2 * letters)
+        self.assertEqual(counters["stages"]["rotors"]["count"], 2 * 6 * letters)
+        self.assertIn('enigma_stage_runs_total{stage="reflector"} %d' % (2 * letters), stats.as_prometheus())
+
+        with tempfile.TemporaryDirectory() as folder:
+            src, dst = os.path.join(folder, "in.txt"), os.path.join(folder, "out.txt")
+            with open(src, "w") as file:
+                file.write(TEST_MESSAGE)
+            machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [3, 7, 11], rotor_notches_dict)
+            encode_file(machine, src, dst, buffer_size=16, stats=stats)
+            with open(dst) as file:
+                self.assertEqual(file.read(), expected)
+        self.assertGreater(stats.as_dict()["stages"]["io"]["count"], 0)
+
+    def test_core_engine_import_budget(self):
+        times = import_times("EnigmaMachine.core.enigmaMachine")
+        self.assertLess(times["EnigmaMachine.core.enigmaMachine"] / 1000, CORE_IMPORT_BUDGET_MS)
+        for heavy in ("numpy", "asyncio", "concurrent.futures", "EnigmaMachine.ui.chooseMode"):
+            self.assertNotIn(heavy, times)
+
+        # The entry points only load the UI, NumPy or the process pool when they are used
+        self.assertNotIn("numpy", import_times("EnigmaMachine.enigmaBatch"))
+        times = import_times("EnigmaMachine.enigma")
+        self.assertFalse([name for name in times if name.startswith(("EnigmaMachine.core", "EnigmaMachine.ui"))])
+
+    def test_trace_buffer_records_reference_steps(self):
+        plugboard = make_test_plugboard()
+        expected = StepRecorder()
+        reference = encode_message_with_rotor_advance(plugboard, list(TEST_ROTORS), TEST_REFLECTOR, TEST_MESSAGE,
+                                                      [5, 0, 0], rotor_notches_dict, [4, 9, 1], tracer=expected)
+        letters = sum(letter in ALPHABET for letter in TEST_MESSAGE)
+
+        machine = build_traced_machine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [5, 0, 0], rotor_notches_dict,
+                                       [4, 9, 1], capacity=16)
+        encoded, steps = encode_message_with_steps(machine, TEST_MESSAGE)
+        self.assertEqual(encoded, reference)
+
+        # Only the newest 16 letters are kept, and they render exactly as the reference traced them
+        trace = machine.trace
+        self.assertEqual((len(trace), trace.recorded), (16, letters))
+        self.assertEqual(steps.split("\n-----------------------------\n"),
+                         ["\n".join(expected.lines()[start:start + 12]) for start in range((letters - 16) * 12,
+                                                                                       letters * 12, 12)])
+        self.assertEqual(trace.fields(-1)["output"], LETTER_INDEX[encoded[-1]])
+        self.assertEqual(len(json.loads(trace.to_json())), 16)
+        output = io.StringIO()
+        trace.write_csv(output)
+        self.assertEqual(len(output.getvalue().splitlines()), 17)
+        with self.assertRaises(ValueError):
+            EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [0, 0, 0], rotor_notches_dict, trace=TraceBuffer(4))
+
+        # Working copies made by the decoders do not record into the caller's buffer
+        self.assertIsNone(machine.silent_copy().trace)
+        decode_messages(machine, [([5, 0, 0], encoded)])
+        message_key(machine, [5, 0, 0], "ABC")
+        self.assertEqual(trace.recorded, letters)
+
+    def test_quiet_encoding_prints_nothing(self):
+        plugboard = make_test_plugboard()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            encoded = encode_message_with_rotor_advance(plugboard, list(TEST_ROTORS), TEST_REFLECTOR, TEST_MESSAGE,
+                                                        [0, 0, 0], rotor_notches_dict, [0, 0, 0], tracer=None)
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual(encoded, reference_encode(plugboard, TEST_MESSAGE, [0, 0, 0]))
+
+    def test_traced_machine_reports_reference_steps(self):
+        plugboard = make_test_plugboard()
+        expected = StepRecorder()
+        encode_message_with_rotor_advance(plugboard, list(TEST_ROTORS), TEST_REFLECTOR, "ENIGMA", [5, 0, 0],
+                                          rotor_notches_dict, [0, 0, 0], tracer=expected)
+        recorder = StepRecorder()
+        machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [5, 0, 0], rotor_notches_dict, tracer=recorder)
+        machine.encode("ENIGMA")
+        self.assertEqual(recorder.events, expected.events)
+        self.assertEqual(len(recorder.events), 6 * 12)
+
+    def test_period_table_matches_reference(self):
+        print("Running period table tests...")
+        plugboard = make_test_plugboard()
+        cache = PeriodTableCache(maxsize=1)
+        for rotor_positions in ([0, 0, 0], [16, 4, 21]):
+            machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, rotor_positions, rotor_notches_dict)
+            expected_machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, rotor_positions,
+                                             rotor_notches_dict)
+            self.assertEqual(encode_with_period_table(machine, TEST_MESSAGE, cache),
+                             reference_encode(plugboard, TEST_MESSAGE, rotor_positions))
+            expected_machine.encode(TEST_MESSAGE)
+            self.assertEqual(machine.rotor_positions, expected_machine.rotor_positions)
+        self.assertEqual(len(cache), 1)  # Both machines share one configuration
+
+        # Rotor states are made of three stepping rotors, so smaller machines are turned away
+        with self.assertRaises(ValueError):
+            EnigmaMachine.from_settings(["I", "II"], "B")
+        two_rotors = EnigmaMachine(plugboard, TEST_ROTORS[:2], TEST_REFLECTOR, [0, 0], rotor_notches_dict)
+        with self.assertRaises(ValueError):
+            encode_with_period_table(two_rotors, TEST_MESSAGE, cache)
+        print("Period table tests completed successfully.")
+
+    def test_period_table_cache_evicts_least_recently_used(self):
+        cache = PeriodTableCache(maxsize=1)
+        first = EnigmaMachine(make_test_plugboard(), TEST_ROTORS, TEST_REFLECTOR, [0, 0, 0], rotor_notches_dict)
+        second = EnigmaMachine(make_test_plugboard(("AB",)), TEST_ROTORS, TEST_REFLECTOR, [0, 0, 0],
+                               rotor_notches_dict)
+        first_table = cache.get(first)
+        self.assertIs(cache.get(first), first_table)
+        cache.get(second)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNot(cache.get(first), first_table)
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_vectorized_encoder_matches_reference(self):
+        print("Running vectorized encoder tests...")
+        plugboard = make_test_plugboard()
+        generator = random.Random(4)
+        # Long enough for the rotor positions to go round their cycle, with non-ASCII passthrough
+        message = ''.join(generator.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ .,é") for _ in range(6000))
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = encode_message_with_rotor_advance(plugboard, list(TEST_ROTORS), TEST_REFLECTOR, message,
+                                                         [7, 1, 2], rotor_notches_dict, [0, 0, 0], tracer=None)
+        machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [7, 1, 2], rotor_notches_dict)
+        self.assertEqual(encode_vectorized(machine, message), expected)
+
+        machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [7, 1, 2], rotor_notches_dict)
+        encoder = VectorEncoder(machine)
+        ascii_message = message.replace("é", "E")
+        self.assertEqual(encoder.encode_bytes(ascii_message[:100].encode()) + encoder.encode_bytes(
+            ascii_message[100:].encode()), reference_encode(plugboard, ascii_message, [7, 1, 2]).encode())
+        with self.assertRaises(ValueError):
+            VectorEncoder(EnigmaMachine(plugboard, TEST_ROTORS[:2], TEST_REFLECTOR, [7, 1], rotor_notches_dict))
+        print("Vectorized encoder tests completed successfully.")
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_many_keys_match_one_machine_per_key(self):
+        message = TEST_MESSAGE + " é"
+        keys = [{"rotors": ["I", "II", "III"], "reflector": "B", "positions": "ADU", "plugs": ["AG", "BT"]},
+                {"rotors": ["V", "Beta", "IV"], "reflector": "C", "positions": "QEV", "rings": "BXC"},
+                {"rotors": ["III", "I", "Gamma"], "reflector": "A", "positions": [25, 3, 0], "rings": [4, 9, 1],
+                 "plugs": ["QZ", "KM", "XY"]}]
+        m4_keys = [{"rotors": ["I", "IV", "II", "Beta"], "reflector": "B-Thin", "positions": [0, 13, 9, 21],
+                    "rings": [21, 0, 0, 0], "plugs": ["AT", "BL", "DF"]},
+                   {"rotors": ["V", "III", "I", "Gamma"], "reflector": "C-Thin", "positions": "ZZZB"}]
+        for batch in (keys, m4_keys):
+            results = encode_many_keys(message, batch)
+            self.assertEqual(results.shape, (len(batch), len(message)))
+            self.assertEqual([row_text(results, row) for row in range(len(batch))],
+                             [build_machine(key).encode(message) for key in batch])
+
+        # A sweep over start positions, through the double step, split over blocks of keys
+        key = {"rotors": ["I", "II", "III"], "reflector": "B", "rings": [4, 9, 1], "plugs": ["AG", "BT", "QZ"]}
+        positions = [[right, middle, 0] for right in (14, 15, 16) for middle in (3, 4)]
+        results = encode_many_keys(TEST_MESSAGE, sweep_positions(key, positions))
+        for row, start in enumerate(positions):
+            self.assertEqual(row_text(results, row), build_machine({**key, "positions": start}).encode(TEST_MESSAGE))
+        self.assertEqual(len(sweep_positions(key).positions), 26 ** 3)
+        with self.assertRaises(ValueError):
+            compile_keys(keys + m4_keys)
+
+        # Worker processes get the compiled tables, so parts they have never registered still work
+        custom_rotor = rotorRegistry.define_rotor("X", "QWERTZUIOASDFGHJKPYXCVBNML", "K")
+        spawned_pool = functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn"))
+        with contextlib.ExitStack() as stack:
+            for registered in (rotor_wirings_dict, rotor_notches_dict, rotorRegistry._rotors):
+                stack.enter_context(mock.patch.dict(registered))
+            stack.enter_context(mock.patch("concurrent.futures.ProcessPoolExecutor", spawned_pool))
+            rotorRegistry.register_rotor(custom_rotor)
+            custom_keys = [{"rotors": ["X", "I", "II"], "reflector": "B", "positions": [row, 3, 7]} for row in range(4)]
+            results = encode_many_keys(TEST_MESSAGE, custom_keys, workers=2)
+            self.assertEqual([row_text(results, row) for row in range(4)],
+                             [build_machine(key).encode(TEST_MESSAGE) for key in custom_keys])
+
+    def test_stream_encoder_keeps_rotor_positions_between_chunks(self):
+        plugboard = make_test_plugboard()
+        expected = reference_encode(plugboard, TEST_MESSAGE, [0, 0, 0])
+        machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [0, 0, 0], rotor_notches_dict)
+        chunks = [TEST_MESSAGE[start:start + 7] for start in range(0, len(TEST_MESSAGE), 7)]
+        self.assertEqual(''.join(StreamEncoder(machine).iter_encode(chunks)), expected)
+
+    def test_checkpointed_stream_resumes_exactly(self):
+        def machine():
+            return EnigmaMachine.from_settings(["IV", "I", "V"], "C", [7, 24, 3], [2, 5, 19], ["AG", "BT", "QZ"])
+        message = TEST_PLAINTEXT * 3
+        expected = machine().encode(message)
+
+        checkpoints = []
+        stream = StreamEncoder(machine(), checkpoint_every=100,
+                               on_checkpoint=lambda characters, state: checkpoints.append((characters, state)))
+        encoded = ''.join(stream.iter_encode(message[start:start + 37] for start in range(0, len(message), 37)))
+        self.assertEqual(encoded, expected)
+        self.assertEqual([characters for characters, _ in checkpoints], list(range(100, len(message) + 1, 100)))
+
+        # Resuming from any checkpoint carries on exactly as the uninterrupted stream did
+        for characters, state in checkpoints[::4]:
+            self.assertEqual(len(state), 3 * 3 + 29)
+            self.assertEqual(restore(state).encode(message[characters:]), expected[characters:])
+
+        m4 = EnigmaMachine.from_settings(["I", "IV", "II", "Beta"], "B-Thin", [0, 13, 9, 21], [21, 0, 0, 0], ["AT"])
+        state = MachineState.from_text(MachineState.from_machine(m4).to_text())
+        self.assertEqual((state.rotors, state.reflector, state.plug_leads()), (("I", "IV", "II", "Beta"), "B-Thin",
+                                                                               ["AT"]))
+        self.assertEqual(state.machine().encode(TEST_MESSAGE), m4.encode(TEST_MESSAGE))
+        for invalid in (b"", b"\x09" + snapshot(m4)[1:], snapshot(m4)[:-1]):
+            with self.assertRaises(ValueError):
+                restore(invalid)
+
+    def test_encode_file_in_small_buffers(self):
+        plugboard = make_test_plugboard()
+        message = (TEST_MESSAGE + " ÜBER\n") * 20
+        with tempfile.TemporaryDirectory() as folder:
+            src = os.path.join(folder, "message.txt")
+            dst = os.path.join(folder, "encoded.txt")
+            with open(src, 'w', encoding='utf-8') as file:
+                file.write(message)
+            machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [0, 0, 0], rotor_notches_dict)
+            encode_file(machine, src, dst, buffer_size=13)
+            with open(dst, encoding='utf-8') as file:
+                encoded = file.read()
+        self.assertEqual(encoded, reference_encode(plugboard, message, [0, 0, 0]))
+
+    def test_seek_matches_stepping(self):
+        machine = EnigmaMachine(make_test_plugboard(), TEST_ROTORS, TEST_REFLECTOR, [3, 7, 11], rotor_notches_dict)
+        stepped = EnigmaMachine(make_test_plugboard(), TEST_ROTORS, TEST_REFLECTOR, [3, 7, 11], rotor_notches_dict)
+        for _ in range(5000):
+            stepped.step()
+        machine.seek(5000)
+        self.assertEqual(machine.rotor_positions, stepped.rotor_positions)
+
+    def test_parallel_encoder_matches_single_process(self):
+        print("Running parallel encoder tests...")
+        plugboard = make_test_plugboard()
+        message = (TEST_MESSAGE + "\n") * 100
+        machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [1, 2, 3], rotor_notches_dict)
+        expected_machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [1, 2, 3], rotor_notches_dict)
+        encoded = encode_parallel(machine, message, workers=3, min_segment_length=1000)
+        self.assertEqual(encoded, expected_machine.encode(message))
+        self.assertEqual(machine.rotor_positions, expected_machine.rotor_positions)
+        print("Parallel encoder tests completed successfully.")
+
+    def test_crib_search_recovers_settings(self):
+        print("Running crib search tests...")
+        selected_rotors = [("II", rotor_wirings_dict["II"]), ("I", rotor_wirings_dict["I"]),
+                           ("III", rotor_wirings_dict["III"])]
+        machine = EnigmaMachine(make_test_plugboard(), selected_rotors, ("C", reflector_wirings_dict["C"]),
+                                [5, 9, 20], rotor_notches_dict)
+        ciphertext = machine.encode("WEATHER REPORT FOR TODAY")
+        result = search_crib(ciphertext, "ATHERREPORT", crib_offset=2, plugboard=make_test_plugboard(),
+                             rotor_names=["I", "II", "III"], reflector_names=["B", "C"], workers=1)
+        self.assertIn((("II", "I", "III"), "C", [5, 9, 20]), result.candidates)
+        self.assertEqual(result.settings_tested, 6 * 2 * 26 ** 3)
+        self.assertGreater(result.settings_per_second, 0)
+
+        # Workers are sent the plugboard's table, not the Plugboard and its (unpicklable) listeners
+        plugboard = make_test_plugboard()
+        plugboard.add_listener(lambda entries: None)
+        parallel = search_crib(ciphertext, "ATHERREPORT", crib_offset=2, plugboard=plugboard,
+                               rotor_names=["I", "II", "III"], reflector_names=["C"], workers=2)
+        self.assertIn((("II", "I", "III"), "C", [5, 9, 20]), parallel.candidates)
+        print(f"Crib search tests completed successfully ({result.settings_per_second:.0f} settings/sec).")
+
+    def test_index_of_coincidence(self):
+        counts = [0] * 26
+        for letter in TEST_PLAINTEXT.replace(" ", ""):
+            counts[LETTER_INDEX[letter]] += 1
+        self.assertGreater(index_of_coincidence(counts, sum(counts)), 0.06)
+        self.assertEqual(index_of_coincidence([1] * 26, 26), 0.0)
+
+    def test_hill_climb_recovers_plugboard(self):
+        print("Running plugboard hill climbing tests...")
+        plugboard = make_test_plugboard(("AG", "BT", "QZ", "EK", "RS"))
+        machine = EnigmaMachine(plugboard, TEST_ROTORS, TEST_REFLECTOR, [4, 2, 9], rotor_notches_dict)
+        ciphertext = machine.encode(TEST_PLAINTEXT.replace(" ", ""))
+        result = hill_climb_plugboard(ciphertext, TEST_ROTORS, TEST_REFLECTOR, [4, 2, 9],
+                                      build_ngram_table(TEST_PLAINTEXT, 3), restarts=2, workers=1)
+        self.assertEqual(sorted(result.leads), ["AG", "BT", "EK", "QZ", "RS"])
+        self.assertEqual(result.plaintext, TEST_PLAINTEXT.replace(" ", ""))
+        with self.assertRaises(ValueError):
+            hill_climb_plugboard(ciphertext, TEST_ROTORS, TEST_REFLECTOR, [4, 2, 9],
+                                 build_ngram_table(TEST_PLAINTEXT, 3), restarts=0, workers=1)
+        print("Plugboard hill climbing tests completed successfully.")
+
+    def test_index_of_coincidence_finds_start_positions(self):
+        plaintext = TEST_PLAINTEXT[:150]
+        machine = EnigmaMachine(Plugboard(), TEST_ROTORS, TEST_REFLECTOR, [7, 19, 2], rotor_notches_dict)
+        ranking = best_start_positions(machine.encode(plaintext), TEST_ROTORS, TEST_REFLECTOR, keep=3)
+        self.assertEqual(len(ranking), 3)
+        self.assertEqual(list(ranking[0][1]), [7, 19, 2])
+        self.assertAlmostEqual(ranking[0][0], index_of_coincidence(
+            [plaintext.count(letter) for letter in ALPHABET], sum(plaintext.count(letter) for letter in ALPHABET)))
+
+    def test_ngram_file_errors_name_the_line(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "trigrams.txt")
+            for lines, problem in ((["THE 10", "AND"], "line 2"), (["THE 10", "", "TION 3"], "line 3"),
+                                   (["THE ten"], "line 1"), (["THE 10", "AN-D 4"], "line 2"), ([], "no n-grams")):
+                with open(path, "w") as file:
+                    file.write("\n".join(lines) + "\n")
+                with self.assertRaisesRegex(ValueError, problem):
+                    load_ngram_table(path)
+
+            with open(path, "w") as file:
+                file.write("THE 30\nand 10\n\nAND 10\n")
+            table = load_ngram_table(path)
+        self.assertEqual(table.n, 3)
+        self.assertAlmostEqual(table.score([LETTER_INDEX[letter] for letter in "AND"], 3), math.log10(0.4))
+
+    def test_benchmark_flags_regressions_against_baseline(self):
+        result = benchmark("EnigmaMachine.encode", "I-II-III/B/no-leads", 100, repeats=3)
+        self.assertEqual(result["repeats"], 3)
+        self.assertGreater(result["chars_per_sec"], 0)
+        self.assertLessEqual(result["latency_p50_us"], result["latency_p99_us"])
+        self.assertEqual(result["latency_piece_chars"], 16)
+
+        report = {"results": [result]}
+        faster_baseline = {"results": [dict(result, chars_per_sec=result["chars_per_sec"] * 2)]}
+        slower_baseline = {"results": [dict(result, chars_per_sec=result["chars_per_sec"] / 2)]}
+        regressions = compare_to_baseline(report, faster_baseline, threshold=0.1)
+        self.assertEqual(len(regressions), 1)
+        self.assertAlmostEqual(regressions[0]["change"], -0.5)
+        self.assertEqual(compare_to_baseline(report, slower_baseline, threshold=0.1), [])
+
+    def test_batch_cli_encodes_directory_tree(self):
+        print("Running batch CLI tests...")
+        self.assertEqual(parse_settings("ABZ"), [0, 1, 25])
+        self.assertEqual(parse_settings("0,1,25"), [0, 1, 25])
+        messages = {"one.txt": TEST_MESSAGE, os.path.join("nested", "two.txt"): "ANOTHER MESSAGE\n"}
+        with tempfile.TemporaryDirectory() as folder:
+            source = os.path.join(folder, "in")
+            for name, message in messages.items():
+                os.makedirs(os.path.dirname(os.path.join(source, name)), exist_ok=True)
+                with open(os.path.join(source, name), "w") as file:
+                    file.write(message)
+            key_file = os.path.join(folder, "key.json")
+            with open(key_file, "w") as file:
+                json.dump({"rotors": ["I", "II", "III"], "reflector": "B", "positions": "DEF",
+                           "plugs": ["AG", "BT", "QZ"]}, file)
+
+            output = os.path.join(folder, "out")
+            with contextlib.redirect_stderr(io.StringIO()):
+                batch_main([source, "--output", output, "--key-file", key_file, "--workers", "2"])
+            for name, message in messages.items():
+                with open(os.path.join(output, name)) as file:
+                    self.assertEqual(file.read(), reference_encode(make_test_plugboard(), message, [3, 4, 5]))
+        print("Batch CLI tests completed successfully.")
+
+    def test_mmap_encoder_matches_buffered_and_in_place(self):
+        key = {"rotors": ["I", "II", "III"], "reflector": "B", "positions": "DEF", "plugs": ["AG", "BT", "QZ"]}
+        data = ("HELLO WORLD, \u00e9t\u00e9 lower case XYZ\n" * 600).encode("utf-8")
+        with tempfile.TemporaryDirectory() as folder:
+            source = os.path.join(folder, "archive.txt")
+            with open(source, "wb") as file:
+                file.write(data)
+            encode_file(build_machine(key), source, os.path.join(folder, "buffered"))
+            # A one page window makes the rotor positions carry over between several windows
+            self.assertEqual(encode_mmap(build_machine(key), source, os.path.join(folder, "mapped"), 1), len(data))
+            encode_mmap(build_machine(key), source)
+            with open(os.path.join(folder, "buffered"), "rb") as buffered, \
+                    open(os.path.join(folder, "mapped"), "rb") as mapped, open(source, "rb") as in_place:
+                expected = buffered.read()
+                self.assertEqual(mapped.read(), expected)
+                self.assertEqual(in_place.read(), expected)
+
+            empty = os.path.join(folder, "empty")
+            open(empty, "wb").close()
+            self.assertEqual(encode_mmap(build_machine(key), empty, empty + ".out"), 0)
+            self.assertEqual(os.path.getsize(empty + ".out"), 0)
+
+    def test_machine_pool_reuses_compiled_configurations(self):
+        pool = MachinePool(maxsize=2)
+        key = {"rotors": ["I", "II", "III"], "reflector": "B", "plugs": ["GA", "BT", "QZ"]}
+        first = pool.get(dict(key, positions="AAA"))
+        second = pool.get(dict(key, positions="DEF", plugs=["ZQ", "AG", "TB"]))
+        self.assertEqual(pool.compiled, 1)
+        self.assertEqual(first.encode(TEST_MESSAGE), reference_encode(make_test_plugboard(), TEST_MESSAGE, [0, 0, 0]))
+        self.assertEqual(second.encode(TEST_MESSAGE), reference_encode(make_test_plugboard(), TEST_MESSAGE, [3, 4, 5]))
+        with self.assertRaises(ValueError):
+            pool.get(dict(key, positions="AAAA"))
+
+    def test_key_sheet_indexes_and_validates_daily_keys(self):
+        print("Running key sheet tests...")
+        rows = ["date,rotors,reflector,rings,positions,plugs,indicators",
+                "2024-05-02,I II III,B,AAA,DEF,AG BT QZ,ABC DEF",
+                "2024-05-01,IV V I,C,,,,XYZ",
+                "2024-05-03,I II III,B,AAA,AAA,AG BT QZ,"]
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "may.csv")
+            with open(path, "w") as file:
+                file.write("\n".join(rows) + "\n")
+            sheet = load_key_sheet(path)
+
+            with open(path, "w") as file:
+                file.write("\n".join(rows[:2] + ["2024-05-04,I II III,B,,,AG GT,"]) + "\n")
+            with self.assertRaises(ValueError):
+                load_key_sheet(path)
+
+            # An M4 whose fourth rotor steps parses, but fails to compile; the error names the key
+            with open(path, "w") as file:
+                file.write("\n".join(rows[:2] + ["2024-05-04,I II III IV,B-Thin,,,,"]) + "\n")
+            with self.assertRaisesRegex(ValueError, r"Key 2 \(2024-05-04\): Rotor IV steps"):
+                load_key_sheet(path)
+
+            json_path = os.path.join(folder, "may.json")
+            with open(json_path, "w") as file:
+                json.dump({"days": []}, file)
+            with self.assertRaisesRegex(ValueError, "keys"):
+                load_key_sheet(json_path)
+
+            # JSON values of the wrong type are reported as ValueErrors naming the key
+            for field, value in (("reflector", 5), ("plugs", [5]), ("rotors", None), ("positions", 3)):
+                with open(json_path, "w") as file:
+                    json.dump([{"date": "2024-05-01", "rotors": ["I", "II", "III"], "reflector": "B", field: value}],
+                              file)
+                with self.assertRaisesRegex(ValueError, "key 1"):
+                    load_key_sheet(json_path)
+
+            # The command line reports a bad sheet or a missing date instead of a traceback
+            for sheet_path, date in ((json_path, "2024-05-01"), (path, "2024-06-01")):
+                with open(path, "w") as file:
+                    file.write("\n".join(rows) + "\n")
+                with contextlib.redirect_stderr(io.StringIO()) as errors, self.assertRaises(SystemExit):
+                    enigma_main(["--key-sheet", sheet_path, "--date", date, "--no-animation"])
+                self.assertIn("key", errors.getvalue())
+
+        self.assertEqual(len(sheet), 3)
+        self.assertEqual(sheet.compiled, 2)  # The 2nd and 3rd share a configuration
+        self.assertIs(sheet.for_indicator("def"), sheet.for_date("2024-05-02"))
+        self.assertEqual(sheet.for_indicator("XYZ").rotors, ("IV", "V", "I"))
+        with self.assertRaises(KeyError):
+            sheet.for_date("2024-06-01")
+
+        daily_key = sheet.for_date("2024-05-02")
+        self.assertEqual(sheet.machine(daily_key).encode(TEST_MESSAGE),
+                         reference_encode(make_test_plugboard(), TEST_MESSAGE, [3, 4, 5]))
+        plugboard, selected_rotors, selected_reflector = daily_key.components()
+        self.assertEqual(selected_rotors, TEST_ROTORS)
+        self.assertEqual(selected_reflector, TEST_REFLECTOR)
+        print("Key sheet tests completed successfully.")
+
+    def test_server_batches_requests_over_one_connection(self):
+        async def exchange():
+            server = EncodingServer(port=0, workers=1, batch_window=0.01)
+            await server.start()
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+
+            async def request(method, path, payload=None):
+                body = json.dumps(payload).encode() if payload is not None else b""
+                writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+                status = int((await reader.readline()).split()[1])
+                headers = {}
+                while (line := await reader.readline()) != b"\r\n":
+                    name, _, value = line.decode().partition(":")
+                    headers[name.lower()] = value.strip()
+                return status, json.loads(await reader.readexactly(int(headers["content-length"])))
+
+            key = {"rotors": ["I", "II", "III"], "reflector": "B", "positions": "DEF", "plugs": ["AG", "BT", "QZ"]}
+            encoded = await asyncio.gather(server.encode(key, TEST_MESSAGE), server.encode(key, "SECOND MESSAGE"))
+            responses = [await request("POST", "/encode", {"key": key, "message": TEST_MESSAGE}),
+                         await request("POST", "/encode", {"key": {"rotors": ["I"]}, "message": "A"}),
+                         await request("GET", "/stats")]
+            writer.close()
+
+            # A Content-Length that is not a number is answered, and the connection closed
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(b"POST /encode HTTP/1.1\r\nContent-Length: many\r\n\r\n")
+            responses.append((await reader.read()).split(b"\r\n", 1)[0])
+            writer.close()
+            await server.close()
+            return encoded, responses
+
+        encoded, (first, invalid, stats, bad_length) = asyncio.run(exchange())
+        expected = reference_encode(make_test_plugboard(), TEST_MESSAGE, [3, 4, 5])
+        self.assertEqual(encoded[0], expected)
+        self.assertEqual(encoded[1], reference_encode(make_test_plugboard(), "SECOND MESSAGE", [3, 4, 5]))
+        self.assertEqual(first, (200, {"message": expected}))
+        self.assertEqual(invalid[0], 400)
+        self.assertEqual(stats[0], 200)
+        self.assertEqual(stats[1]["requests"], 2)
+        self.assertEqual(stats[1]["errors"], 1)
+        self.assertEqual(stats[1]["machines_compiled"], 1)
+        self.assertEqual(stats[1]["batches"], 3)  # The two direct encodes shared a batch
+        self.assertLessEqual(stats[1]["latency_p50_ms"], stats[1]["latency_p99_ms"])
+        self.assertLessEqual(stats[1]["latency_p99_ms"], stats[1]["latency_max_ms"])
+        self.assertEqual(bad_length, b"HTTP/1.1 400 Bad Request")
+
+    def test_server_keeps_batching_after_a_failed_job(self):
+        async def exchange():
+            server = EncodingServer(port=0, workers=1, batch_window=0.001)
+            await server.start()
+            key = {"rotors": ["I", "II", "III"], "reflector": "B", "positions": "DEF", "plugs": ["AG", "BT", "QZ"]}
+            outcomes = []
+            for bad_key in ({**key, "plugs": [1]}, {**key, "rotors": "I II III"}, {**key, "rings": 5}):
+                try:
+                    outcomes.append(await asyncio.wait_for(server.encode(bad_key, "A"), 5))
+                except ValueError as error:
+                    outcomes.append(str(error))
+            with mock.patch("EnigmaMachine.enigmaServer.encode_batch", side_effect=RuntimeError("boom")):
+                try:
+                    await asyncio.wait_for(server.encode(key, "A"), 5)
+                except ValueError as error:
+                    outcomes.append(str(error))
+            outcomes.append(await asyncio.wait_for(server.encode(key, TEST_MESSAGE), 5))
+            await server.close()
+            return outcomes
+
+        *errors, encoded = asyncio.run(exchange())
+        self.assertEqual(len(errors), 4)
+        self.assertTrue(all(error.startswith("Invalid key:") for error in errors[:3]))
+        self.assertEqual(errors[3], "Encoding failed: boom")
+        self.assertEqual(encoded, reference_encode(make_test_plugboard(), TEST_MESSAGE, [3, 4, 5]))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
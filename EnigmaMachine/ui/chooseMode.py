@@ -1,57 +1,46 @@
-from EnigmaMachine.core.encodingMessage import encode_letter_with_rotor_advance
-
-def encode_letter_with_steps(plugboard, selected_rotors, selected_reflector, letter, rotor_positions,
-                             rotor_notches_dict, ring_settings):
-    steps = []
-
-    # Track keyboard input and rotor positions
-    steps.append(f"Keyboard Input: {letter}")
-    steps.append(f"Rotors Position: {rotor_positions}")
-
-    # Encode the letter
-    encoded_letter = encode_letter_with_rotor_advance(
-        plugboard,
-        selected_rotors,
-        selected_reflector,
-        letter,
-        rotor_positions,
-        rotor_notches_dict
-    )
-
-    steps.append(f"Output (Lampboard): {encoded_letter}")
-
-    return encoded_letter, "\n".join(steps)
-
-def encode_message_with_steps(plugboard, selected_rotors, selected_reflector, message, rotor_positions,
-                              rotor_notches_dict, ring_settings):
-    all_steps = []
-    encoded_message = ""
-
-    for letter in message:
-        if letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
-            encoded_letter, steps = encode_letter_with_steps(
-                plugboard,
-                selected_rotors,
-                selected_reflector,
-                letter,
-                rotor_positions,
-                rotor_notches_dict,
-                ring_settings
-            )
-            encoded_message += encoded_letter
-            all_steps.append(steps)
-        else:
-            encoded_message += letter  # Handle non-alphabetic characters like spaces
+from EnigmaMachine.core.enigmaMachine import EnigmaMachine
+from EnigmaMachine.core.machineState import MachineState
+from EnigmaMachine.core.traceBuffer import TRACE_CAPACITY, TraceBuffer
+
+STEP_SEPARATOR = "\n-----------------------------\n"
+
+def build_traced_machine(plugboard, selected_rotors, selected_reflector, rotor_positions, rotor_notches_dict,
+                         ring_settings, capacity=TRACE_CAPACITY):
+    # The machine records every letter as integers; text is only made for the letters shown
+    trace = TraceBuffer(len(selected_rotors), capacity)
+    return EnigmaMachine(plugboard, selected_rotors, selected_reflector, rotor_positions, rotor_notches_dict,
+                         ring_settings, trace=trace)
+
+def encode_letter_with_steps(machine, letter):
+    encoded_letter = machine.encode(letter)
+    return encoded_letter, machine.trace.render(-1)
 
-    return encoded_message, "\n-----------------------------\n".join(all_steps)
+def encode_message_with_steps(machine, message):
+    trace = machine.trace
+    recorded_before = trace.recorded
+    encoded_message = machine.encode(message)
+
+    # Render the records of this message that are still in the buffer
+    new_records = min(trace.recorded - recorded_before, len(trace))
+    all_steps = [trace.render(index) for index in range(len(trace) - new_records, len(trace))]
+    return encoded_message, STEP_SEPARATOR.join(all_steps)
 
 def choose_mode_and_encode(plugboard, selected_rotors, selected_reflector, rotor_positions, rotor_notches_dict, ring_settings):
+    machine = build_traced_machine(plugboard, selected_rotors, selected_reflector, rotor_positions, rotor_notches_dict,
+                                   ring_settings)
     mode = input("Would you like to enter the message letter by letter (L) or as a full phrase (P)? ").strip().upper()
 
     if mode == "L":
         input_phrase = ""
         encoded_message = ""
 
+        # Only machines built from the standard parts can be snapshotted into a resume code
+        try:
+            MachineState.from_machine(machine)
+            resumable = True
+        except ValueError:
+            resumable = False
+
         while True:
             letter = input("Enter a letter to encode (or press Enter to finish): ").strip().upper()
 
@@ -63,19 +52,16 @@ def choose_mode_and_encode(plugboard, selected_rotors, selected_reflector, rotor
                 continue
 
             # Encode the letter with steps
-            encoded_letter, encryption_steps = encode_letter_with_steps(
-                plugboard,
-                selected_rotors,
-                selected_reflector,
-                letter,
-                rotor_positions,
-                rotor_notches_dict,
-                ring_settings
-            )
+            encoded_letter, encryption_steps = encode_letter_with_steps(machine, letter)
+            rotor_positions[:] = machine.rotor_positions
 
             print(f"\nEncryption Steps for '{letter}':\n{encryption_steps}")
             print(f"Encoded letter: {encoded_letter}")
 
+            # The rotors only live in this list, so show a code that picks up from here after a crash
+            if resumable:
+                print(f"Resume code: {MachineState.from_machine(machine).to_text()}")
+
             input_phrase += letter
             encoded_message += encoded_letter
 
@@ -85,15 +71,8 @@ def choose_mode_and_encode(plugboard, selected_rotors, selected_reflector, rotor
     elif mode == "P":
         input_message = input("Enter a message to encode (max 250 characters): ").strip().upper()
 
-        encoded_message, all_steps = encode_message_with_steps(
-            plugboard,
-            selected_rotors,
-            selected_reflector,
-            input_message,
-            rotor_positions,
-            rotor_notches_dict,
-            ring_settings
-        )
+        encoded_message, all_steps = encode_message_with_steps(machine, input_message)
+        rotor_positions[:] = machine.rotor_positions
 
         print(f"\nDetailed Encryption Steps:\n{all_steps}")
         print(f"\nFinal input phrase: {input_message}")
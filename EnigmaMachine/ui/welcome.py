@@ -6,8 +6,15 @@ This module handles the welcome messages and instructions for the Enigma Machine
 It provides a visual welcome message and prompts users for instructions.
 """
 
-def typing_welcome_message():
-    """Displays a welcome message with a typing effect."""
+TYPING_DELAY = 0.02  # Default delay between each character, in seconds
+
+
+def typing_welcome_message(delay=TYPING_DELAY):
+    """Displays a welcome message with a typing effect.
+
+    Args:
+        delay (float): Seconds between each character. 0 prints the whole message at once.
+    """
     message = """
           ________________
          |                |
@@ -20,9 +27,12 @@ def typing_welcome_message():
         |______o______o____|
     """
     print("Welcome to the Enigma Machine!\n")
+    if delay <= 0:
+        print(message, end='', flush=True)
+        return
     for char in message:
         print(char, end='', flush=True)
-        time.sleep(0.02)  # Delay between each character
+        time.sleep(delay)  # Delay between each character
 
 def ask_for_instructions():
     """Prompts the user for detailed instructions and displays them if requested."""